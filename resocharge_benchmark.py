@@ -0,0 +1,449 @@
+# ResoCharge: Benchmark Suite
+# Measure the simulator's hot paths so slowdowns get noticed
+#
+# What this does:
+# - Builds synthetic source/antenna inventories by scaling up the three
+#   built-in scenarios (same kinds of signals, just many more of them)
+# - Times the hot paths at several sizes: pair evaluation (scalar and
+#   batch engine), rectifier interpolation, report writing,
+#   compare_scenarios, chart rendering and sweep-log ingestion (bytes
+#   per second for CSV, per parser, and for the binary format)
+# - Records throughput and peak memory (tracemalloc) in a JSON file
+# - Compares a run with a stored baseline and flags regressions
+#
+# Examples:
+#   python resocharge_benchmark.py run -o baseline.json
+#   python resocharge_benchmark.py run --scales small medium \
+#       --baseline baseline.json       # exit status 1 on regressions
+#   python resocharge_benchmark.py compare baseline.json current.json
+#
+# Everything is seeded, so every run benchmarks exactly the same inputs.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from resocharge_engine import evaluate_totals, pack_harvesters
+from resocharge_ingest import RECORD_DTYPE, ingest_spectrum_log
+from resocharge_simulator import AntennaTable, RFEnergyHarvester, \
+    RFSourceTable, compare_scenarios, create_near_cell_tower_scenario, \
+    create_rural_scenario, create_urban_apartment_scenario
+
+
+# Inventory sizes: name -> (sources, antennas); None = the built-in
+# urban apartment scenario as it is
+SCALES: Dict[str, Optional[Tuple[int, int]]] = {
+    'small': None,
+    'medium': (1_000, 20),
+    'large': (10_000, 50),
+    'huge': (1_000_000, 100),
+}
+
+# Scales run when none are given ('huge' takes minutes and GBs)
+DEFAULT_SCALES = ('small', 'medium', 'large')
+
+# A result counts as a regression when throughput drops, or peak memory
+# grows, by more than this fraction
+DEFAULT_THRESHOLD = 0.10
+
+
+def synthetic_harvester(scale: str, seed: int = 0) -> RFEnergyHarvester:
+    """
+    A harvester with the inventory size of the given scale
+
+    Sources and antennas are drawn from the three built-in scenarios,
+    with frequencies jittered by up to ±5% and densities/areas by a
+    log-normal factor, so the mix of bands and power levels stays
+    realistic while the counts grow.
+    """
+    harvester = create_urban_apartment_scenario()
+    if SCALES[scale] is None:
+        return harvester
+    source_count, antenna_count = SCALES[scale]
+    rng = np.random.default_rng(seed)
+
+    templates = [create_urban_apartment_scenario(),
+                 create_near_cell_tower_scenario(),
+                 create_rural_scenario()]
+    sources = [s for h in templates for s in h.rf_sources]
+    antennas = [a for h in templates for a in h.antennas]
+
+    pick = rng.integers(len(sources), size=source_count)
+    frequency = np.array([s.frequency_mhz for s in sources])[pick]
+    density = np.array([s.power_density_uw_per_m2 for s in sources])[pick]
+    availability = np.array([s.availability for s in sources])[pick]
+    names = np.array([s.name for s in sources], dtype=object)[pick]
+    harvester.rf_sources = RFSourceTable.from_arrays(
+        name=names,
+        frequency_mhz=frequency * rng.uniform(0.95, 1.05, source_count),
+        power_density_uw_per_m2=density * rng.lognormal(
+            0.0, 0.5, source_count),
+        availability=availability)
+
+    pick = rng.integers(len(antennas), size=antenna_count)
+    harvester.antennas = AntennaTable.from_arrays(
+        frequency_mhz=np.array([a.frequency_mhz for a in antennas])[pick] *
+        rng.uniform(0.95, 1.05, antenna_count),
+        effective_area_m2=np.array(
+            [a.effective_area_m2 for a in antennas])[pick] *
+        rng.lognormal(0.0, 0.3, antenna_count),
+        efficiency=np.array([a.efficiency for a in antennas])[pick])
+    return harvester
+
+
+def _fresh(harvester: RFEnergyHarvester) -> RFEnergyHarvester:
+    """Same configuration, empty result cache (tables are shared, so
+    this costs next to nothing)"""
+    return harvester.clone()
+
+
+def _rectifier_inputs(scale: str, seed: int = 0) -> np.ndarray:
+    """Input powers spread over the whole curve (0.01 μW .. 10 mW)"""
+    count = {'small': 1_000, 'medium': 10_000, 'large': 100_000,
+             'huge': 1_000_000}[scale]
+    return np.random.default_rng(seed).lognormal(0.0, 3.0, count)
+
+
+# Benchmark cases ----------------------------------------------------------
+# Each prepare function builds its inputs (not timed) and returns
+# (run, items): run() does the timed work, items is how much work that
+# is (pairs, lookups, report lines, ...) for the throughput figure.
+# Cases that write files also get a scratch directory, which is removed
+# once the case has been timed.
+
+def _pairs_scalar(scale):
+    harvester = synthetic_harvester(scale)
+    items = len(harvester.calculate_total_harvested_power()['sources'])
+    return (lambda: _fresh(harvester).calculate_total_harvested_power(),
+            items)
+
+
+def _pairs_cached(scale):
+    harvester = synthetic_harvester(scale)
+    items = len(harvester.calculate_total_harvested_power()['sources'])
+    return harvester.calculate_total_harvested_power, items
+
+
+def _pairs_engine(scale):
+    harvester = synthetic_harvester(scale)
+    items = len(harvester.rf_sources) * len(harvester.antennas)
+    return lambda: evaluate_totals(pack_harvesters([harvester])), items
+
+
+def _rectifier_scalar(scale):
+    harvester = synthetic_harvester('small')
+    powers = _rectifier_inputs(scale).tolist()
+    efficiency = harvester.get_rectifier_efficiency
+
+    def run():
+        for power in powers:
+            efficiency(power)
+    return run, len(powers)
+
+
+def _rectifier_array(scale):
+    curve = synthetic_harvester('small').rectifier.curve
+    powers = _rectifier_inputs(scale)
+    return lambda: curve.efficiency_array(powers), len(powers)
+
+
+def _report_text(scale):
+    harvester = synthetic_harvester(scale)
+    results = harvester.calculate_total_harvested_power()
+    return (lambda: harvester.write_report(io.StringIO(), results),
+            len(results['sources']))
+
+
+def _compare_scenarios(scale):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            compare_scenarios(chart_path=None)
+    return run, 3
+
+
+def _chart(scale, scratch):
+    from resocharge_simulator import plot_comparison
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = compare_scenarios(chart_path=None)
+    path = os.path.join(scratch, 'chart.png')
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            plot_comparison(data, path)
+    return run, 1
+
+
+def _sweep_log(scale, scratch, log_format):
+    """Write a synthetic sweep log; returns its path"""
+    count = {'small': 100_000, 'medium': 1_000_000,
+             'large': 4_000_000}[scale]
+    rng = np.random.default_rng(0)
+    records = np.empty(count, dtype=RECORD_DTYPE)
+    records['timestamp'] = 1.7e9 + np.arange(count) * 1e-3
+    records['frequency_hz'] = np.round(rng.uniform(80e6, 6e9, count))
+    records['dbm'] = np.round(rng.uniform(-100.0, -40.0, count), 2)
+    if log_format == 'binary':
+        path = os.path.join(scratch, 'sweep.bin')
+        records.tofile(path)
+    else:
+        path = os.path.join(scratch, 'sweep.csv')
+        np.savetxt(path, np.column_stack([records[name] for name in
+                                          RECORD_DTYPE.names]),
+                   fmt=('%.3f', '%.0f', '%.2f'), delimiter=',',
+                   header='timestamp,frequency_hz,dbm', comments='')
+    return path
+
+
+def _ingest(log_format, engine='auto'):
+    """Ingestion case; throughput is in bytes of log per second"""
+    def prepare(scale, scratch):
+        path = _sweep_log(scale, scratch, log_format)
+        return (lambda: ingest_spectrum_log(path, log_format,
+                                            csv_engine=engine),
+                os.path.getsize(path))
+    return prepare
+
+
+@dataclass
+class BenchmarkCase:
+    """One thing to time, and the scales it makes sense at"""
+    name: str
+    unit: str  # What the items are (for throughput: items per second)
+    scales: Tuple[str, ...]
+    prepare: Callable
+    needs: Optional[str] = None  # Optional package required
+    scratch: bool = False  # prepare(scale, directory) gets a scratch dir
+
+
+ALL_SCALES = tuple(SCALES)
+CASES: List[BenchmarkCase] = [
+    # The scalar path builds a dict per pair: keep it below 'huge'
+    BenchmarkCase('pairs_scalar', 'pairs', ALL_SCALES[:3], _pairs_scalar),
+    BenchmarkCase('pairs_cached', 'pairs', ALL_SCALES[:3], _pairs_cached),
+    BenchmarkCase('pairs_engine', 'pairs', ALL_SCALES, _pairs_engine),
+    BenchmarkCase('rectifier_scalar', 'lookups', ALL_SCALES[:3],
+                  _rectifier_scalar),
+    BenchmarkCase('rectifier_array', 'lookups', ALL_SCALES,
+                  _rectifier_array),
+    BenchmarkCase('report_text', 'lines', ALL_SCALES[:3], _report_text),
+    BenchmarkCase('compare_scenarios', 'scenarios', ('small',),
+                  _compare_scenarios),
+    BenchmarkCase('chart', 'charts', ('small',), _chart,
+                  needs='matplotlib', scratch=True),
+    BenchmarkCase('ingest_csv_numpy', 'bytes', ALL_SCALES[:3],
+                  _ingest('csv', 'numpy'), scratch=True),
+    BenchmarkCase('ingest_csv_pandas', 'bytes', ALL_SCALES[:3],
+                  _ingest('csv', 'pandas'), needs='pandas', scratch=True),
+    BenchmarkCase('ingest_csv_arrow', 'bytes', ALL_SCALES[:3],
+                  _ingest('csv', 'pyarrow'), needs='pyarrow',
+                  scratch=True),
+    BenchmarkCase('ingest_binary', 'bytes', ALL_SCALES[:3],
+                  _ingest('binary'), scratch=True),
+]
+
+
+@dataclass
+class BenchmarkResult:
+    """Timing and memory of one case at one scale"""
+    name: str
+    scale: str
+    unit: str
+    items: int
+    repeats: int
+    seconds_min: float
+    seconds_median: float
+    throughput: float  # items per second (using the fastest run)
+    peak_memory_mb: float  # tracemalloc peak during one run
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.name, self.scale
+
+
+def _available(package: Optional[str]) -> bool:
+    """Is an optional package installed?"""
+    if package is None:
+        return True
+    try:
+        __import__(package)
+    except ImportError:
+        return False
+    return True
+
+
+def time_case(case: BenchmarkCase, scale: str,
+              min_time_s: float = 0.5,
+              max_repeats: int = 20) -> BenchmarkResult:
+    """
+    Time one case: repeat until about min_time_s has been spent (at
+    least once, at most max_repeats), then one extra run under
+    tracemalloc for the peak memory
+    """
+    with contextlib.ExitStack() as stack:
+        if case.scratch:
+            scratch = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix='resocharge-'))
+            run, items = case.prepare(scale, scratch)
+        else:
+            run, items = case.prepare(scale)
+        times = []
+        started = time.perf_counter()
+        while True:
+            run_started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - run_started)
+            if (time.perf_counter() - started >= min_time_s or
+                    len(times) >= max_repeats):
+                break
+
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    fastest = min(times)
+    return BenchmarkResult(
+        name=case.name, scale=scale, unit=case.unit, items=items,
+        repeats=len(times), seconds_min=fastest,
+        seconds_median=statistics.median(times),
+        throughput=items / fastest if fastest > 0 else float('inf'),
+        peak_memory_mb=peak / 1e6)
+
+
+def run_suite(scales: Sequence[str] = DEFAULT_SCALES,
+              names: Optional[Sequence[str]] = None,
+              min_time_s: float = 0.5, verbose: bool = True) -> Dict:
+    """Run every case (or the named ones) at the given scales"""
+    results = []
+    for case in CASES:
+        if names and case.name not in names:
+            continue
+        if not _available(case.needs):
+            if verbose:
+                print(f"skip {case.name}: {case.needs} not installed",
+                      file=sys.stderr)
+            continue
+        for scale in scales:
+            if scale not in case.scales:
+                continue
+            result = time_case(case, scale, min_time_s)
+            if verbose:
+                print(f"{result.name:18s} {result.scale:7s} "
+                      f"{result.throughput:14,.0f} {result.unit}/s  "
+                      f"{result.peak_memory_mb:9.1f} MB", file=sys.stderr)
+            results.append(result)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': [asdict(r) for r in results],
+    }
+
+
+def compare_results(baseline: Dict, current: Dict,
+                    threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Line up two result files case by case
+
+    Each row has the throughput and memory ratios (current / baseline)
+    and regression=True if throughput fell, or memory rose, by more
+    than threshold.  Cases missing from either file are left out.
+    """
+    before = {(r['name'], r['scale']): r for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = before.get((result['name'], result['scale']))
+        if old is None:
+            continue
+        speed = (result['throughput'] / old['throughput']
+                 if old['throughput'] else float('inf'))
+        memory = (result['peak_memory_mb'] / old['peak_memory_mb']
+                  if old['peak_memory_mb'] else 1.0)
+        rows.append({
+            'name': result['name'],
+            'scale': result['scale'],
+            'throughput_ratio': speed,
+            'memory_ratio': memory,
+            'regression': speed < 1.0 - threshold or
+            memory > 1.0 + threshold,
+        })
+    return rows
+
+
+def format_comparison(rows: List[Dict]) -> str:
+    """Comparison table as text"""
+    lines = [f"{'case':18s} {'scale':7s} {'speed':>8s} {'memory':>8s}"]
+    for row in rows:
+        flag = "  REGRESSION" if row['regression'] else ""
+        lines.append(f"{row['name']:18s} {row['scale']:7s} "
+                     f"{row['throughput_ratio']:7.2f}x "
+                     f"{row['memory_ratio']:7.2f}x{flag}")
+    return "\n".join(lines)
+
+
+def _load(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line; exit status 1 when a regression was found"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('--scales', nargs='+', choices=tuple(SCALES),
+                     default=list(DEFAULT_SCALES))
+    run.add_argument('--cases', nargs='+',
+                     choices=[case.name for case in CASES])
+    run.add_argument('--min-time', type=float, default=0.5,
+                     help='seconds to spend timing each case')
+    run.add_argument('-o', '--output', help='results file (JSON)')
+    run.add_argument('--baseline', help='compare with this results file')
+    run.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    compare = commands.add_parser('compare',
+                                  help='compare two results files')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float,
+                         default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        current = run_suite(args.scales, args.cases, args.min_time)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+        if not args.baseline:
+            return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    rows = compare_results(baseline, current, args.threshold)
+    print(format_comparison(rows))
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
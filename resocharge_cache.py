@@ -0,0 +1,407 @@
+# ResoCharge: Result Cache
+# Remember scenario results on disk, so unchanged scenarios cost a lookup
+#
+# What this does:
+# - Gives every harvester configuration a fingerprint: a SHA-256 hash of
+#   its sources, antennas, rectifier curve, efficiencies, resonance
+#   boost and rectification mode (the name doesn't count - two
+#   identical setups share results)
+# - Stores calculate_total_harvested_power, calculate_energy_per_day and
+#   estimate_charging_capability results under that fingerprint, one
+#   small binary file per configuration that is read with mmap
+# - Keeps the cache under a size limit by deleting the least recently
+#   used entries first
+# - Is safe with many worker processes sharing one cache directory:
+#   entries are written to a temporary file and renamed into place, so
+#   readers see either the whole entry or none, and only eviction takes
+#   a lock
+#
+# Example:
+#   cache = ResultCache('~/.cache/resocharge')
+#   evaluation = cache.evaluate(harvester)   # computed once...
+#   evaluation = cache.evaluate(harvester)   # ...then hash + read
+#   evaluation['results']['total_harvested_uw']
+#
+# Entry file layout (little-endian):
+#   header   - magic, format version, pair count, capability text size
+#   scalars  - 11 float64: the totals, energy and charging numbers
+#   pairs    - source and antenna rows (int64) and received /
+#              harvested / efficiency (float64) columns of every
+#              source x antenna pair with power
+#   text     - the capability strings as JSON (a few hundred bytes)
+# Source names and frequencies aren't stored: they are part of the
+# fingerprint, so they are read from the harvester itself.
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from dataclasses import fields
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from resocharge_engine import evaluate_harvesters
+from resocharge_results import HarvestResult
+from resocharge_simulator import AntennaConfig, \
+    DEVICE_POWER_REQUIREMENTS_MW, IPHONE_BATTERY_WH, \
+    PARTIAL_POWER_FRACTION, RFEnergyHarvester, RFSource
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+# Bump when the file layout or the meaning of a result changes; old
+# entries then simply stop matching
+CACHE_FORMAT_VERSION = 2
+
+# Default size limit of a cache directory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Eviction trims the cache down to this fraction of the limit, so it
+# doesn't run again on the very next write
+EVICTION_TARGET = 0.9
+
+ENTRY_SUFFIX = '.rcr'
+
+_MAGIC = b'RCRC'
+_HEADER = struct.Struct('<4sIQQ')  # magic, version, pairs, text bytes
+_SCALARS = ('total_received_uw', 'total_harvested_uw', 'total_harvested_mw',
+            'system_efficiency', 'power_uw', 'power_mw',
+            'energy_per_day_mwh', 'energy_per_day_wh', 'energy_per_day_j',
+            'iphone_charge_time_days', 'iphone_charge_time_years')
+# Pair columns of an entry, in file order
+_PAIR_COLUMNS = {'source_index': '<i8', 'antenna_index': '<i8',
+                 'received_uw': '<f8', 'harvested_uw': '<f8',
+                 'efficiency': '<f8'}
+_ENERGY_KEYS = ('power_uw', 'power_mw', 'energy_per_day_mwh',
+                'energy_per_day_wh', 'energy_per_day_j')
+
+
+def _hash_column(digest, values: np.ndarray):
+    """Add one table column to a hash (numbers as raw float64 bytes)"""
+    if values.dtype == object:
+        for value in values:
+            text = repr(value).encode('utf-8')
+            digest.update(struct.pack('<Q', len(text)))
+            digest.update(text)
+    else:
+        digest.update(np.ascontiguousarray(values,
+                                           dtype='<f8').tobytes())
+
+
+def config_hash(harvester: RFEnergyHarvester) -> str:
+    """
+    Fingerprint of everything that decides a harvester's results
+
+    Think of this as a barcode: harvesters with the same sources,
+    antennas, rectifier curve, efficiencies and resonance boost get the
+    same hex string, and any change gives a different one.  Works on
+    the column arrays, so even huge scenarios hash quickly.
+    """
+    digest = hashlib.sha256()
+    digest.update(struct.pack('<4sI', _MAGIC, CACHE_FORMAT_VERSION))
+    # Capabilities depend on the device list and the phone battery too
+    digest.update(json.dumps([list(DEVICE_POWER_REQUIREMENTS_MW.items()),
+                              IPHONE_BATTERY_WH, PARTIAL_POWER_FRACTION]
+                             ).encode('utf-8'))
+    digest.update(struct.pack('<3d', harvester.matching_efficiency,
+                              harvester.filter_efficiency,
+                              harvester.resonance_boost))
+    digest.update(harvester.rectification_mode.encode('utf-8'))
+    for table, row_class in ((harvester.rf_sources, RFSource),
+                             (harvester.antennas, AntennaConfig)):
+        digest.update(struct.pack('<Q', len(table)))
+        for field in fields(row_class):
+            digest.update(field.name.encode('utf-8'))
+            _hash_column(digest, table.column(field.name))
+
+    if harvester.rectifier:
+        curve = harvester.rectifier.curve
+        digest.update(struct.pack('<Q', len(curve.power_levels)))
+        _hash_column(digest, np.asarray(curve.power_levels))
+        _hash_column(digest, np.asarray(curve.efficiencies))
+    else:
+        digest.update(b'no rectifier')
+    return digest.hexdigest()
+
+
+def evaluate_scenario(harvester: RFEnergyHarvester,
+                      results: Optional[Dict] = None) -> Dict:
+    """
+    Everything the cache stores for one harvester:
+    {'results': ..., 'energy': ..., 'charging': ...} as returned by
+    calculate_total_harvested_power, calculate_energy_per_day and
+    estimate_charging_capability (results may be passed in if known)
+    """
+    if results is None:
+        results = harvester.calculate_total_harvested_power()
+    harvested_uw = results['total_harvested_uw']
+    return {
+        'results': results,
+        'energy': harvester.calculate_energy_per_day(harvested_uw),
+        'charging': harvester.estimate_charging_capability(harvested_uw),
+    }
+
+
+def _align(offset: int) -> int:
+    return -(-offset // 8) * 8
+
+
+def _encode(harvester: RFEnergyHarvester, evaluation: Dict) -> bytes:
+    """One cache entry as bytes"""
+    results = evaluation['results']
+    pairs = results['sources']
+    scalars = dict(results, **evaluation['energy'],
+                   **evaluation['charging'])
+    text = json.dumps(evaluation['charging']['capabilities'],
+                      ensure_ascii=False).encode('utf-8')
+
+    parts = [_HEADER.pack(_MAGIC, CACHE_FORMAT_VERSION, len(pairs),
+                          len(text)),
+             np.array([scalars[key] for key in _SCALARS],
+                      dtype='<f8').tobytes()]
+    for key in _PAIR_COLUMNS:
+        parts.append(np.asarray(getattr(pairs, key),
+                                dtype=_PAIR_COLUMNS[key]).tobytes())
+    parts.append(text)
+    return b''.join(parts)
+
+
+def _decode(buffer, harvester: RFEnergyHarvester) -> Dict:
+    """Rebuild the evaluation dicts from an entry's bytes"""
+    magic, version, count, text_size = _HEADER.unpack_from(buffer, 0)
+    offset = _align(_HEADER.size)
+    expected = offset + 8 * len(_SCALARS) + 40 * count + text_size
+    if magic != _MAGIC or version != CACHE_FORMAT_VERSION or \
+            len(buffer) != expected:
+        raise ValueError("not a valid cache entry")
+
+    def array(dtype, size):
+        nonlocal offset
+        values = np.frombuffer(buffer, dtype=dtype, count=size,
+                               offset=offset)
+        offset += values.nbytes
+        return values
+
+    scalars = dict(zip(_SCALARS, array('<f8', len(_SCALARS)).tolist()))
+    # Copied out: the mapping is closed once the entry has been read
+    columns = {key: array(dtype, count).copy()
+               for key, dtype in _PAIR_COLUMNS.items()}
+    capabilities = json.loads(bytes(buffer[offset:offset + text_size]))
+
+    sources = harvester.rf_sources
+    results = {
+        'sources': HarvestResult(
+            **columns, source_name=sources.column('name'),
+            source_frequency_mhz=sources.column('frequency_mhz')),
+        'total_received_uw': scalars['total_received_uw'],
+        'total_harvested_uw': scalars['total_harvested_uw'],
+        'total_harvested_mw': scalars['total_harvested_mw'],
+        'system_efficiency': scalars['system_efficiency'],
+    }
+    return {
+        'results': results,
+        'energy': {key: scalars[key] for key in _ENERGY_KEYS},
+        'charging': {
+            'capabilities': capabilities,
+            'iphone_charge_time_days': scalars['iphone_charge_time_days'],
+            'iphone_charge_time_years': scalars[
+                'iphone_charge_time_years'],
+        },
+    }
+
+
+class ResultCache:
+    """
+    A directory of cached scenario evaluations
+
+    Think of this as a filing cabinet sorted by fingerprint: before
+    evaluating a harvester we look for its drawer, and only compute
+    (and file the answer) if it isn't there.  Entries live in 256
+    subdirectories named after the first two hex digits of the key.
+
+    max_bytes bounds the total size; when a write pushes the cache over
+    it, the entries used longest ago are deleted.  Reading an entry
+    marks it as used (its modification time is the "last used" time).
+    """
+
+    def __init__(self, directory: str,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 check_every: int = 256):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.check_every = check_every  # Writes between full size checks
+        self.hits = 0
+        self.misses = 0
+        self._written = 0  # Bytes written since the last size check
+        self._writes = 0
+        self._size: Optional[int] = None  # Cache size at the last check
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """File of the entry with this key"""
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    # Reading ----------------------------------------------------------------
+
+    def get(self, harvester: RFEnergyHarvester,
+            key: Optional[str] = None) -> Optional[Dict]:
+        """The cached evaluation of harvester, or None"""
+        key = key or config_hash(harvester)
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    raise ValueError("empty cache entry")
+                with mmap.mmap(f.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapped:
+                    evaluation = _decode(mapped, harvester)
+        except FileNotFoundError:
+            self.misses += 1
+            return None  # Never written, or evicted meanwhile
+        except (ValueError, struct.error, IndexError):
+            self._remove(path)  # Damaged or from another format version
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return evaluation
+
+    def __contains__(self, harvester: RFEnergyHarvester) -> bool:
+        return os.path.exists(self.path(config_hash(harvester)))
+
+    # Writing ----------------------------------------------------------------
+
+    def put(self, harvester: RFEnergyHarvester, evaluation: Dict,
+            key: Optional[str] = None):
+        """Store an evaluation (see evaluate_scenario for its layout)"""
+        key = key or config_hash(harvester)
+        data = _encode(harvester, evaluation)
+        path = self.path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # Write next to the final name, then rename: other processes see
+        # the old entry, no entry, or the whole new one - never half
+        handle, temporary = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            self._remove(temporary)
+            raise
+
+        self._written += len(data)
+        self._writes += 1
+        if self._size is None or self._writes >= self.check_every or \
+                self._size + self._written > self.max_bytes:
+            self.evict()
+
+    def evaluate(self, harvester: RFEnergyHarvester) -> Dict:
+        """Cached evaluate_scenario: compute and store only on a miss"""
+        key = config_hash(harvester)
+        evaluation = self.get(harvester, key)
+        if evaluation is None:
+            evaluation = evaluate_scenario(harvester)
+            self.put(harvester, evaluation, key)
+        return evaluation
+
+    def evaluate_many(self, harvesters: Sequence[RFEnergyHarvester]
+                      ) -> List[Dict]:
+        """
+        evaluate() for a list: the misses are computed together with
+        the batch engine (same numbers as the scalar path)
+        """
+        keys = [config_hash(h) for h in harvesters]
+        evaluations = [self.get(h, key) for h, key in zip(harvesters, keys)]
+        missing = [i for i, e in enumerate(evaluations) if e is None]
+        if missing:
+            computed = evaluate_harvesters([harvesters[i] for i in missing])
+            for i, results in zip(missing, computed):
+                evaluations[i] = evaluate_scenario(harvesters[i], results)
+                self.put(harvesters[i], evaluations[i], keys[i])
+        return evaluations
+
+    # Size limit -------------------------------------------------------------
+
+    def _entries(self) -> List:
+        """(last used, size, path) of every entry"""
+        entries = []
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        info = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+                    entries.append((info.st_mtime, info.st_size,
+                                    entry.path))
+        return entries
+
+    @contextmanager
+    def _locked(self):
+        """Hold the cache-wide lock (only eviction needs it)"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the cache fits in
+        max_bytes (down to EVICTION_TARGET of it); returns how many
+        """
+        removed = 0
+        with self._locked():
+            entries = self._entries()
+            size = sum(entry[1] for entry in entries)
+            if size > self.max_bytes:
+                target = self.max_bytes * EVICTION_TARGET
+                for _, entry_size, path in sorted(entries):
+                    if size <= target:
+                        break
+                    self._remove(path)
+                    size -= entry_size
+                    removed += 1
+        self._size = size
+        self._written = 0
+        self._writes = 0
+        return removed
+
+    @property
+    def size_bytes(self) -> int:
+        """Total size of all entries right now"""
+        return sum(entry[1] for entry in self._entries())
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def clear(self):
+        """Delete every entry"""
+        with self._locked():
+            for _, _, path in self._entries():
+                self._remove(path)
+        self._size = 0
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,271 @@
+# ResoCharge: Batch Command Line
+# Evaluate scenario files without questions, charts or a screen
+#
+# What this does:
+# - Loads scenarios from JSON/TOML files, directories or built-in names
+# - Evaluates them all in one process with the vectorized batch engine
+# - Writes one result per scenario as JSON Lines or CSV
+# - Only imports matplotlib if a chart is asked for
+#
+# Examples:
+#   python resocharge_cli.py evaluate urban tower rural
+#   python resocharge_cli.py evaluate scenarios/ --format csv -o out.csv
+#   python resocharge_cli.py export urban -o urban.toml
+#
+# Add --timings to see where the time goes (import, load, evaluate,
+# write).  A plain evaluation run doesn't import matplotlib at all.
+
+import time
+
+_STARTED = time.perf_counter()  # Before the heavier imports below
+
+import argparse  # noqa: E402
+import csv  # noqa: E402
+import json  # noqa: E402
+import sys  # noqa: E402
+from typing import Dict, List, Optional, Sequence, TextIO  # noqa: E402
+
+from resocharge_engine import evaluate_harvesters, evaluate_totals, \
+    pack_harvesters  # noqa: E402
+from resocharge_report import _json_safe  # noqa: E402
+from resocharge_scenarios import ScenarioError, dump_scenario, \
+    load_scenarios  # noqa: E402
+from resocharge_simulator import RECTIFICATION_MODES, \
+    RFEnergyHarvester  # noqa: E402
+
+_IMPORTED = time.perf_counter()
+
+# Columns of every result record (CSV header order)
+RESULT_FIELDS = ('scenario', 'path', 'sources', 'antennas',
+                 'enable_resonance', 'total_received_uw',
+                 'total_harvested_uw', 'total_harvested_mw',
+                 'system_efficiency', 'energy_per_day_mwh',
+                 'iphone_charge_time_days')
+
+# Scenarios packed into one engine batch (bounds the padding waste
+# when scenario sizes differ a lot)
+DEFAULT_BATCH_SIZE = 1024
+
+
+def _records(harvesters: Sequence[RFEnergyHarvester],
+             paths: Sequence[str], details: bool,
+             cache=None) -> List[Dict]:
+    """Evaluate one batch of harvesters into result records"""
+    if cache is not None:
+        # Unchanged scenarios are read back instead of evaluated
+        evaluations = cache.evaluate_many(harvesters)
+        results = [e['results'] for e in evaluations]
+        totals = {key: [r[key] for r in results]
+                  for key in ('total_received_uw', 'total_harvested_uw',
+                              'total_harvested_mw', 'system_efficiency')}
+    elif details:
+        results = evaluate_harvesters(harvesters)
+        totals = {key: [r[key] for r in results]
+                  for key in ('total_received_uw', 'total_harvested_uw',
+                              'total_harvested_mw', 'system_efficiency')}
+    else:
+        totals = {key: values.tolist() for key, values in
+                  evaluate_totals(pack_harvesters(harvesters)).items()}
+
+    records = []
+    for i, harvester in enumerate(harvesters):
+        harvested_uw = totals['total_harvested_uw'][i]
+        energy = harvester.calculate_energy_per_day(harvested_uw)
+        charging = harvester.estimate_charging_capability(harvested_uw)
+        record = {
+            'scenario': harvester.name,
+            'path': paths[i],
+            'sources': len(harvester.rf_sources),
+            'antennas': len(harvester.antennas),
+            'enable_resonance': bool(harvester.enable_resonance),
+            'total_received_uw': totals['total_received_uw'][i],
+            'total_harvested_uw': harvested_uw,
+            'total_harvested_mw': totals['total_harvested_mw'][i],
+            'system_efficiency': totals['system_efficiency'][i],
+            'energy_per_day_mwh': energy['energy_per_day_mwh'],
+            'iphone_charge_time_days': charging['iphone_charge_time_days'],
+        }
+        if details:
+            record['pairs'] = results[i]['sources'].to_list()
+        records.append(record)
+    return records
+
+
+def _write(records: List[Dict], output_format: str, out: TextIO,
+           header: bool):
+    """Write result records as JSON Lines or CSV"""
+    if output_format == 'jsonl':
+        for record in records:
+            out.write(json.dumps(_json_safe(record), ensure_ascii=False,
+                                 allow_nan=False) + "\n")
+    else:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS,
+                                extrasaction='ignore')
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def evaluate_command(args) -> int:
+    """The 'evaluate' subcommand"""
+    timings = {'import_s': _IMPORTED - _STARTED}
+
+    started = time.perf_counter()
+    harvesters: List[RFEnergyHarvester] = []
+    paths: List[str] = []
+    for path in args.scenarios:
+        loaded = load_scenarios(path)
+        harvesters.extend(loaded)
+        paths.extend([path] * len(loaded))
+    if args.resonance:
+        for harvester in harvesters:
+            harvester.enable_resonance = True
+            harvester.resonance_boost = 1.5
+    if args.rectification:
+        for harvester in harvesters:
+            harvester.rectification_mode = args.rectification
+    timings['load_s'] = time.perf_counter() - started
+
+    cache = None
+    if args.cache:
+        from resocharge_cache import ResultCache
+        cache = ResultCache(args.cache)
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') \
+        if args.output else sys.stdout
+    evaluate_s = write_s = 0.0
+    all_records = []
+    try:
+        for start in range(0, len(harvesters), args.batch_size):
+            stop = start + args.batch_size
+            started = time.perf_counter()
+            records = _records(harvesters[start:stop], paths[start:stop],
+                               args.details, cache)
+            evaluate_s += time.perf_counter() - started
+
+            started = time.perf_counter()
+            _write(records, args.format, out, header=start == 0)
+            write_s += time.perf_counter() - started
+            if args.chart:
+                all_records.extend(records)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    timings['evaluate_s'] = evaluate_s
+    timings['write_s'] = write_s
+
+    if args.chart:
+        from resocharge_simulator import plot_comparison
+        plot_comparison([{'name': r['scenario'],
+                          'power_uw': r['total_harvested_uw'],
+                          'power_mw': r['total_harvested_mw']}
+                         for r in all_records], args.chart)
+
+    if args.timings:
+        timings['total_s'] = time.perf_counter() - _STARTED
+        timings['scenarios'] = len(harvesters)
+        if cache is not None:
+            timings['cache_hits'] = cache.hits
+            timings['cache_misses'] = cache.misses
+        print(json.dumps(timings), file=sys.stderr)
+    return 0
+
+
+def export_command(args) -> int:
+    """The 'export' subcommand: save scenarios as files"""
+    harvesters = load_scenarios(args.scenario)
+    if len(harvesters) != 1:
+        raise ScenarioError(f"{args.scenario}: holds {len(harvesters)} "
+                            f"scenarios, export needs exactly one")
+    dump_scenario(harvesters[0], args.output)
+    return 0
+
+
+def compare_command(args) -> int:
+    """The 'compare' subcommand: summary of many scenarios"""
+    from resocharge_compare import compare_many, plot_distribution
+
+    result = compare_many(args.scenarios, top_k=args.top,
+                          workers=args.workers, resonance=args.resonance,
+                          rectification=args.rectification)
+    if args.format == 'json':
+        print(json.dumps(_json_safe(result.stats.summary()),
+                         ensure_ascii=False, allow_nan=False))
+    else:
+        print(result.format())
+    if args.chart:
+        plot_distribution(result.stats, args.chart)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Command-line options"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge batch evaluation (non-interactive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    evaluate = commands.add_parser(
+        'evaluate', help='evaluate scenario files, directories or '
+                         'built-in names (urban, tower, rural)')
+    evaluate.add_argument('scenarios', nargs='+')
+    evaluate.add_argument('--format', choices=('jsonl', 'csv'),
+                          default='jsonl')
+    evaluate.add_argument('-o', '--output',
+                          help='output file (default: standard output)')
+    evaluate.add_argument('--resonance', action='store_true',
+                          help='enable multi-band resonance everywhere')
+    evaluate.add_argument('--rectification', choices=RECTIFICATION_MODES,
+                          help='rectify pair by pair, per antenna or per '
+                               'rectifier chain (default: as in each '
+                               'scenario)')
+    evaluate.add_argument('--details', action='store_true',
+                          help='include every source x antenna pair '
+                               '(JSON Lines only)')
+    evaluate.add_argument('--batch-size', type=int,
+                          default=DEFAULT_BATCH_SIZE)
+    evaluate.add_argument('--chart', metavar='PNG',
+                          help='also save a comparison chart')
+    evaluate.add_argument('--cache', metavar='DIR',
+                          help='reuse results of unchanged scenarios '
+                               'from this cache directory')
+    evaluate.add_argument('--timings', action='store_true',
+                          help='print timings as JSON to standard error')
+    evaluate.set_defaults(run=evaluate_command)
+
+    compare = commands.add_parser(
+        'compare', help='summarize many scenarios: distribution, devices, '
+                        'best and worst sites')
+    compare.add_argument('scenarios', nargs='+')
+    compare.add_argument('--top', type=int, default=10,
+                         help='how many best and worst sites to list')
+    compare.add_argument('--workers', type=int,
+                         help='worker processes (default: all cores)')
+    compare.add_argument('--format', choices=('text', 'json'),
+                         default='text')
+    compare.add_argument('--resonance', action='store_true',
+                         help='enable multi-band resonance everywhere')
+    compare.add_argument('--rectification', choices=RECTIFICATION_MODES)
+    compare.add_argument('--chart', metavar='PNG',
+                         help='also save a distribution chart')
+    compare.set_defaults(run=compare_command)
+
+    export = commands.add_parser(
+        'export', help='save one scenario as a .json or .toml file')
+    export.add_argument('scenario')
+    export.add_argument('-o', '--output', required=True)
+    export.set_defaults(run=export_command)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the command line; returns the exit status"""
+    args = build_parser().parse_args(argv)
+    try:
+        return args.run(args)
+    except (OSError, ValueError) as error:  # Includes ScenarioError
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+# ResoCharge: Scenario Comparison at Scale
+# Compare thousands of sites without keeping (or drawing) every one
+#
+# What this does:
+# - Takes any iterable of harvesters, scenario files, directories or
+#   built-in names ('urban', 'tower', 'rural') - a generator works, so
+#   the scenarios never all have to be in memory at once
+# - Evaluates them in chunks with the batch engine, spread over worker
+#   processes (each worker also loads its own scenario files)
+# - Keeps only streaming summaries: count, mean, spread, min / max,
+#   quantiles (QuantileSketch), a fixed log-spaced histogram, how many
+#   sites can run each device, and heaps with the k best and k worst
+#   sites
+# - Draws distributions (histogram and ECDF) instead of one bar and one
+#   line per scenario, so a chart of 10^6 sites takes as long to render
+#   as a chart of 10
+#
+# Memory stays flat however many scenarios stream through: a worker
+# hands back a small summary of its chunk, never per-scenario results.
+# compare_scenarios in resocharge_simulator is still the place for the
+# full side-by-side report of a few scenarios.
+#
+# Example:
+#   result = compare_many(['sites/'], top_k=20, workers=4)
+#   print(result.format())
+#   plot_distribution(result.stats, 'sites.png')
+
+import argparse
+import heapq
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from resocharge_engine import evaluate_totals, pack_harvesters
+from resocharge_fleet import CONTINUOUS, DEVICE_CLASSES, PARTIAL, \
+    feasibility
+from resocharge_montecarlo import QuantileSketch
+from resocharge_scenarios import BUILTIN_SCENARIOS, SCENARIO_EXTENSIONS, \
+    load_scenarios
+from resocharge_simulator import DEVICE_POWER_REQUIREMENTS_MW, \
+    RFEnergyHarvester
+
+# Something compare_many can evaluate: a harvester, or a path / name
+# for load_scenarios
+ScenarioItem = Union[RFEnergyHarvester, str]
+
+# Best and worst sites kept
+DEFAULT_TOP_K = 10
+
+# Scenario items per worker task
+DEFAULT_CHUNK_SIZE = 512
+
+# Histogram bins of harvested power: 20 per decade from 1 pW to 1 W
+# (values outside go into the first / last bin, zero is counted apart)
+HISTOGRAM_EDGES_UW = np.logspace(-6, 6, 12 * 20 + 1)
+
+
+def _ranked(entries: List[Tuple]) -> List[Dict]:
+    """Heap entries as records, the most extreme first (earlier
+    scenarios first on ties)"""
+    return [{'scenario': name, 'path': path,
+             'total_harvested_uw': abs(power)}
+            for power, _, _, name, path in sorted(entries, reverse=True)]
+
+
+@dataclass
+class ComparisonStats:
+    """
+    Running summary of harvested power over any number of scenarios
+
+    Think of this as a tally sheet: add() takes one chunk of scenarios,
+    merge() adds another sheet (e.g. from a worker process), and
+    nothing on the sheet grows with the number of scenarios - apart
+    from the quantile sketch, which grows with the range of values.
+    """
+    top_k: int = DEFAULT_TOP_K
+    count: int = 0
+    mean_uw: float = 0.0
+    m2: float = 0.0  # Sum of squared deviations from the mean
+    zero_count: int = 0
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    histogram: np.ndarray = field(default_factory=lambda: np.zeros(
+        len(HISTOGRAM_EDGES_UW) - 1, dtype=np.int64))
+    # Per device class: sites that run it continuously / duty cycled
+    continuous: np.ndarray = field(default_factory=lambda: np.zeros(
+        len(DEVICE_CLASSES), dtype=np.int64))
+    partial: np.ndarray = field(default_factory=lambda: np.zeros(
+        len(DEVICE_CLASSES), dtype=np.int64))
+    # Min-heaps of (power, -chunk, -position, name, path); the bottom
+    # heap stores -power so its root is the best of the worst
+    top: List[Tuple] = field(default_factory=list)
+    bottom: List[Tuple] = field(default_factory=list)
+
+    def add(self, harvested_uw: np.ndarray, names: List[str],
+            paths: List[str], chunk: int = 0):
+        """Count one chunk of scenarios (in order, chunk = its number)"""
+        harvested_uw = np.asarray(harvested_uw, dtype=float)
+        if len(harvested_uw) == 0:
+            return
+        self._merge_moments(len(harvested_uw), harvested_uw.mean(),
+                            ((harvested_uw - harvested_uw.mean()) ** 2
+                             ).sum())
+        self.zero_count += int(np.count_nonzero(harvested_uw <= 0))
+        self.sketch.add(harvested_uw)
+
+        positive = harvested_uw[harvested_uw > 0]
+        bins = np.searchsorted(HISTOGRAM_EDGES_UW, positive,
+                               side='right') - 1
+        self.histogram += np.bincount(
+            np.clip(bins, 0, len(self.histogram) - 1),
+            minlength=len(self.histogram))
+
+        status = feasibility(harvested_uw / 1000.0)
+        self.continuous += (status == CONTINUOUS).sum(axis=0)
+        self.partial += (status == PARTIAL).sum(axis=0)
+
+        # Only the chunk's own k best / worst can make it onto a heap
+        k = min(self.top_k, len(harvested_uw))
+        if k == 0:
+            return
+        for sign, heap, rows in (
+                (1.0, self.top,
+                 np.argpartition(-harvested_uw, k - 1)[:k]),
+                (-1.0, self.bottom,
+                 np.argpartition(harvested_uw, k - 1)[:k])):
+            for row in rows.tolist():
+                self._push(heap, (sign * harvested_uw[row].item(), -chunk,
+                                  -row, names[row], paths[row]))
+
+    def _push(self, heap: List[Tuple], entry: Tuple):
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def _merge_moments(self, count: int, mean: float, m2: float):
+        """Combine mean and spread with another group's (Chan et al.)"""
+        total = self.count + count
+        delta = mean - self.mean_uw
+        self.mean_uw += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other: 'ComparisonStats'):
+        """Add everything counted by another summary"""
+        if other.count == 0:
+            return
+        self._merge_moments(other.count, other.mean_uw, other.m2)
+        self.zero_count += other.zero_count
+        self.sketch.merge(other.sketch)
+        self.histogram += other.histogram
+        self.continuous += other.continuous
+        self.partial += other.partial
+        for entry in other.top:
+            self._push(self.top, entry)
+        for entry in other.bottom:
+            self._push(self.bottom, entry)
+
+    @property
+    def std_uw(self) -> float:
+        """Standard deviation of harvested power"""
+        return (self.m2 / self.count) ** 0.5 if self.count else 0.0
+
+    @property
+    def max_uw(self) -> float:
+        return max(self.top)[0] if self.top else float('nan')
+
+    @property
+    def min_uw(self) -> float:
+        return -max(self.bottom)[0] if self.bottom else float('nan')
+
+    def best(self) -> List[Dict]:
+        """The top_k sites with the most harvested power, best first"""
+        return _ranked(self.top)
+
+    def worst(self) -> List[Dict]:
+        """The top_k sites with the least harvested power, worst first"""
+        return _ranked(self.bottom)
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile of harvested power (μW)"""
+        return self.sketch.quantile(q)
+
+    def ecdf(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(power μW, fraction of sites at or below it), from the
+        histogram - zero-power sites are the value at the first edge"""
+        cumulative = self.zero_count + np.cumsum(self.histogram)
+        fraction = np.concatenate([[self.zero_count], cumulative]) / \
+            max(self.count, 1)
+        return HISTOGRAM_EDGES_UW, fraction
+
+    def summary(self) -> Dict:
+        """Everything as plain numbers (e.g. for JSON)"""
+        count = max(self.count, 1)
+        return {
+            'scenarios': self.count,
+            'mean_uw': self.mean_uw,
+            'std_uw': self.std_uw,
+            'min_uw': self.min_uw,
+            'max_uw': self.max_uw,
+            'zero_power': self.zero_count,
+            'harvested_uw_percentiles': {
+                p: self.quantile(p / 100) for p in (5, 25, 50, 75, 95)},
+            'devices': {
+                device: {'continuous': continuous / count,
+                         'partial': partial / count}
+                for device, continuous, partial in zip(
+                    DEVICE_CLASSES, self.continuous.tolist(),
+                    self.partial.tolist())},
+            'best': self.best(),
+            'worst': self.worst(),
+        }
+
+
+@dataclass
+class ComparisonResult:
+    """What compare_many found, and how long it took"""
+    stats: ComparisonStats
+    elapsed_s: float
+    workers: int
+
+    def format(self) -> str:
+        """Text summary: distribution, devices, best and worst sites"""
+        summary = self.stats.summary()
+        quantiles = summary['harvested_uw_percentiles']
+        lines = [f"Compared {summary['scenarios']:,} scenarios in "
+                 f"{self.elapsed_s:.2f} s ({self.workers} "
+                 f"worker{'s' if self.workers != 1 else ''})",
+                 f"  Harvested: mean {summary['mean_uw']:.3g} μW "
+                 f"(std {summary['std_uw']:.3g} μW), "
+                 f"min {summary['min_uw']:.3g} μW, "
+                 f"max {summary['max_uw']:.3g} μW",
+                 "  Percentiles: " + ", ".join(
+                     f"{p}%: {value:.3g} μW"
+                     for p, value in quantiles.items()),
+                 "",
+                 f"  {'Device':26s} {'Continuous':>11s} "
+                 f"{'Partial':>9s}"]
+        for device, share in summary['devices'].items():
+            lines.append(f"  {device:26s} "
+                         f"{share['continuous'] * 100:10.1f}% "
+                         f"{share['partial'] * 100:8.1f}%")
+        for title, records in (('Best', summary['best']),
+                               ('Worst', summary['worst'])):
+            lines += ["", f"  {title} {len(records)}:"]
+            for rank, record in enumerate(records, 1):
+                where = f"  ({record['path']})" if record['path'] else ""
+                lines.append(f"  {rank:4d}. {record['scenario'][:40]:40s} "
+                             f"{record['total_harvested_uw']:12.4g} μW"
+                             f"{where}")
+        return "\n".join(lines)
+
+
+def expand_items(items: Iterable[ScenarioItem]) -> Iterator[ScenarioItem]:
+    """
+    Split directories into their scenario files (in file-name order),
+    so each file can go to a different worker; everything else is
+    passed through
+    """
+    for item in items:
+        if isinstance(item, str) and os.path.isdir(item):
+            for entry in sorted(os.listdir(item)):
+                if os.path.splitext(entry)[1].lower() in \
+                        SCENARIO_EXTENSIONS:
+                    yield os.path.join(item, entry)
+        else:
+            yield item
+
+
+def _chunks(items: Iterable[ScenarioItem],
+            size: int) -> Iterator[List[ScenarioItem]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _evaluate_chunk(chunk: int, items: List[ScenarioItem], top_k: int,
+                    resonance: bool,
+                    rectification: Optional[str]) -> ComparisonStats:
+    """Load, evaluate and summarize one chunk (runs in a worker)"""
+    harvesters: List[RFEnergyHarvester] = []
+    paths: List[str] = []
+    for item in items:
+        if isinstance(item, str):
+            loaded = load_scenarios(item)
+            harvesters.extend(loaded)
+            paths.extend([item] * len(loaded))
+        else:
+            harvesters.append(item)
+            paths.append('')
+    if resonance or rectification:
+        # Settings only: clones share the caller's source and antenna
+        # tables, but the caller's harvesters stay as they were
+        harvesters = [harvester.clone() for harvester in harvesters]
+    if resonance:
+        for harvester in harvesters:
+            harvester.enable_resonance = True
+            harvester.resonance_boost = 1.5
+    if rectification:
+        for harvester in harvesters:
+            harvester.rectification_mode = rectification
+
+    stats = ComparisonStats(top_k=top_k)
+    # Empty scenarios harvest nothing; leave them out of the batch
+    harvested = np.zeros(len(harvesters))
+    rows = [i for i, h in enumerate(harvesters)
+            if len(h.rf_sources) and len(h.antennas)]
+    if rows:
+        harvested[rows] = evaluate_totals(pack_harvesters(
+            [harvesters[i] for i in rows]))['total_harvested_uw']
+    stats.add(harvested, [h.name for h in harvesters], paths, chunk)
+    return stats
+
+
+def compare_many(items: Iterable[ScenarioItem],
+                 top_k: int = DEFAULT_TOP_K,
+                 workers: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 resonance: bool = False,
+                 rectification: Optional[str] = None) -> ComparisonResult:
+    """
+    Evaluate and summarize any number of scenarios
+
+    items         - harvesters, scenario files, directories or built-in
+                    names, in any mix (an iterator is read lazily)
+    top_k         - how many best and worst sites to keep
+    workers       - process count (None = all cores, 1 = no pool)
+    chunk_size    - scenario items per worker task
+    resonance     - enable the 1.5x resonance boost everywhere
+    rectification - override every scenario's rectification_mode
+
+    Harvested power is exactly calculate_total_harvested_power; only
+    as many chunks as there are workers (times two) are in flight, so
+    a generator of scenarios is never read far ahead.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    stats = ComparisonStats(top_k=top_k)
+    chunks = enumerate(_chunks(expand_items(items), chunk_size))
+    options = (top_k, resonance, rectification)
+
+    if workers == 1:
+        for number, chunk in chunks:
+            stats.merge(_evaluate_chunk(number, chunk, *options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for number, chunk in chunks:
+                pending.append(pool.submit(_evaluate_chunk, number, chunk,
+                                           *options))
+                if len(pending) >= 2 * workers:
+                    # Merge in submission order: the result doesn't
+                    # depend on which worker finished first
+                    stats.merge(pending.popleft().result())
+            while pending:
+                stats.merge(pending.popleft().result())
+
+    return ComparisonResult(stats=stats,
+                            elapsed_s=time.perf_counter() - started,
+                            workers=workers)
+
+
+def plot_distribution(stats: ComparisonStats,
+                      path: str = 'scenario_distribution.png'):
+    """
+    Save the harvested-power distribution chart: histogram and ECDF,
+    with the device power requirements marked
+
+    The number of things drawn doesn't depend on the scenario count.
+    matplotlib is only imported here.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+    edges = HISTOGRAM_EDGES_UW
+    used = np.nonzero(stats.histogram)[0]
+    if len(used):
+        # Only the decades that have sites in them (plus a bin margin)
+        low = max(used[0] - 1, 0)
+        high = min(used[-1] + 2, len(stats.histogram))
+    else:
+        low, high = 0, len(stats.histogram)
+
+    ax1.stairs(stats.histogram[low:high], edges[low:high + 1], fill=True,
+               color='#3498db', alpha=0.8)
+    ax1.set_xscale('log')
+    ax1.set_xlabel('Harvested Power (μW, log scale)', fontsize=12)
+    ax1.set_ylabel('Scenarios', fontsize=12)
+    ax1.set_title(f'Harvested Power of {stats.count:,} Scenarios',
+                  fontsize=14, fontweight='bold')
+    ax1.grid(axis='y', alpha=0.3)
+    if stats.zero_count:
+        ax1.text(0.02, 0.95, f'{stats.zero_count:,} harvest nothing',
+                 transform=ax1.transAxes, va='top')
+
+    power, fraction = stats.ecdf()
+    ax2.step(power[low:high + 1], fraction[low:high + 1], where='post',
+             color='#2ecc71', linewidth=2, label='Scenarios at or below')
+    # Requirements as lines: where a line crosses the curve is the
+    # share of sites that can't run that device continuously
+    shown = [(device, required * 1000.0)
+             for device, required in DEVICE_POWER_REQUIREMENTS_MW.items()
+             if edges[low] <= required * 1000.0 <= edges[high]]
+    if shown:
+        ax2.vlines([uw for _, uw in shown], 0, 1, colors='#95a5a6',
+                   linestyles='--', label='Device requirement')
+        for device, uw in shown:
+            ax2.text(uw, 0.02, device, rotation=90, fontsize=8,
+                     va='bottom', ha='right')
+    ax2.set_xscale('log')
+    ax2.set_ylim(0, 1)
+    ax2.set_xlabel('Harvested Power (μW, log scale)', fontsize=12)
+    ax2.set_ylabel('Fraction of scenarios', fontsize=12)
+    ax2.set_title('Cumulative Distribution', fontsize=14,
+                  fontweight='bold')
+    ax2.legend(loc='upper left')
+    ax2.grid(alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"\nDistribution chart saved as '{path}'")
+
+
+def main():
+    """Command-line demo: compare scenario files or built-in names"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge comparison of many scenarios')
+    parser.add_argument('scenarios', nargs='*',
+                        default=list(BUILTIN_SCENARIOS))
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int,
+                        default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--chart', metavar='PNG')
+    args = parser.parse_args()
+
+    result = compare_many(args.scenarios, top_k=args.top,
+                          workers=args.workers, chunk_size=args.chunk_size)
+    print(result.format())
+    if args.chart:
+        plot_distribution(result.stats, args.chart)
+
+
+if __name__ == "__main__":
+    main()
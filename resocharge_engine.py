@@ -0,0 +1,748 @@
+# ResoCharge: Vectorized Batch Engine
+# Array-based version of RFEnergyHarvester.calculate_total_harvested_power
+#
+# What this does:
+# - Packs many harvesters into NumPy arrays (one row per harvester)
+# - Builds the frequency match mask, received-power matrix and efficiency
+#   chain for every source x antenna pair of every harvester in one pass
+# - Gives exactly the same numbers as the scalar Python loop
+# - Can also give the exact derivative of the total harvested power with
+#   respect to every number in the batch (evaluate_gradients), from the
+#   same pass - no need to re-run once per nudged parameter
+#
+# Array shapes used throughout:
+#   B = number of harvesters (batch), S = sources, A = antennas,
+#   K = rectifier curve points.  Harvesters with fewer sources/antennas
+#   are padded with NaN frequencies, which never match anything.
+#
+# Rectification modes (RFEnergyHarvester.rectification_mode) are stored
+# as rectifier_group: the rectifier each antenna feeds.  Antennas of one
+# row with the same group share a rectifier that sees their summed
+# received power; -1 means pair-by-pair rectification.
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from resocharge_results import HarvestResult
+from resocharge_simulator import RFEnergyHarvester
+
+
+# Efficiency used when a harvester has no rectifier configured
+# (same default as RFEnergyHarvester.get_rectifier_efficiency)
+DEFAULT_RECTIFIER_EFFICIENCY = 0.5
+
+# Default frequency matching tolerance (same as AntennaConfig.tolerance)
+DEFAULT_MATCH_TOLERANCE = 0.15
+
+
+@dataclass
+class HarvesterBatch:
+    """
+    A batch of harvesters stored as arrays
+
+    Think of this as a spreadsheet: each row is one harvester, and the
+    columns hold its sources, antennas, rectifier curve and efficiencies.
+    Build it with pack_harvesters() or directly from your own arrays.
+
+    Example: 10,000 antenna designs for the urban apartment become one
+    HarvesterBatch with B=10000, S=8, A=6.
+    """
+    source_frequency_mhz: np.ndarray  # (B, S), NaN = padding
+    source_power_density_uw_per_m2: np.ndarray  # (B, S)
+    source_availability: np.ndarray  # (B, S)
+    antenna_frequency_mhz: np.ndarray  # (B, A), NaN = padding
+    antenna_effective_area_m2: np.ndarray  # (B, A)
+    antenna_efficiency: np.ndarray  # (B, A)
+    matching_efficiency: np.ndarray  # (B,)
+    filter_efficiency: np.ndarray  # (B,)
+    resonance_boost: np.ndarray  # (B,)
+    # Rectifier curve points sorted by power, padded with +inf powers
+    curve_power_uw: np.ndarray  # (B, K)
+    curve_efficiency: np.ndarray  # (B, K)
+    curve_size: np.ndarray  # (B,) number of real points, 0 = no rectifier
+    # Per-antenna match tolerance (B, A); None = 0.15 for every antenna
+    antenna_tolerance: Optional[np.ndarray] = None
+    # Shared rectifier of each antenna (B, A), numbered 0 .. A-1 within
+    # a row, -1 = pair by pair; None = pair by pair everywhere
+    rectifier_group: Optional[np.ndarray] = None
+
+    @property
+    def size(self) -> int:
+        """Number of harvesters in the batch"""
+        return self.source_frequency_mhz.shape[0]
+
+
+def pack_harvesters(
+        harvesters: Sequence[RFEnergyHarvester]) -> HarvesterBatch:
+    """
+    Pack a list of RFEnergyHarvester objects into a HarvesterBatch
+
+    Harvesters may have different numbers of sources, antennas and
+    rectifier points - shorter rows are padded so they never match.
+    """
+    count = len(harvesters)
+    max_sources = max([len(h.rf_sources) for h in harvesters] + [1])
+    max_antennas = max([len(h.antennas) for h in harvesters] + [1])
+    max_points = max(
+        [len(h.rectifier.efficiency_at_power)
+         for h in harvesters if h.rectifier] + [2])
+
+    source_freq = np.full((count, max_sources), np.nan)
+    source_density = np.zeros((count, max_sources))
+    source_avail = np.zeros((count, max_sources))
+    antenna_freq = np.full((count, max_antennas), np.nan)
+    antenna_area = np.zeros((count, max_antennas))
+    antenna_eff = np.zeros((count, max_antennas))
+    antenna_tol = np.full((count, max_antennas), DEFAULT_MATCH_TOLERANCE)
+    curve_power = np.full((count, max_points), np.inf)
+    curve_eff = np.zeros((count, max_points))
+    curve_size = np.zeros(count, dtype=np.int64)
+    groups = [h.rectifier_groups() for h in harvesters]
+    rectifier_group = None
+    if any(group is not None for group in groups):
+        rectifier_group = np.full((count, max_antennas), -1, dtype=np.int64)
+
+    for row, harvester in enumerate(harvesters):
+        # Sources and antennas are stored column by column already,
+        # so each row is a handful of array copies
+        sources, antennas = harvester.rf_sources, harvester.antennas
+        count_s, count_a = len(sources), len(antennas)
+        source_freq[row, :count_s] = sources.column('frequency_mhz')
+        source_density[row, :count_s] = sources.column(
+            'power_density_uw_per_m2')
+        source_avail[row, :count_s] = sources.column('availability')
+        antenna_freq[row, :count_a] = antennas.column('frequency_mhz')
+        antenna_area[row, :count_a] = antennas.column('effective_area_m2')
+        antenna_eff[row, :count_a] = antennas.column('efficiency')
+        antenna_tol[row, :count_a] = antennas.column('tolerance')
+        if groups[row] is not None:
+            rectifier_group[row, :count_a] = groups[row]
+        if harvester.rectifier:
+            # Compiled curves are cached, so shared rectifiers are
+            # sorted only once no matter how many rows use them
+            curve = harvester.rectifier.curve
+            size = len(curve.power_levels)
+            curve_size[row] = size
+            curve_power[row, :size] = curve.power_levels
+            curve_eff[row, :size] = curve.efficiencies
+
+    return HarvesterBatch(
+        source_frequency_mhz=source_freq,
+        source_power_density_uw_per_m2=source_density,
+        source_availability=source_avail,
+        antenna_frequency_mhz=antenna_freq,
+        antenna_effective_area_m2=antenna_area,
+        antenna_efficiency=antenna_eff,
+        matching_efficiency=np.array(
+            [h.matching_efficiency for h in harvesters], dtype=float),
+        filter_efficiency=np.array(
+            [h.filter_efficiency for h in harvesters], dtype=float),
+        resonance_boost=np.array(
+            [h.resonance_boost for h in harvesters], dtype=float),
+        curve_power_uw=curve_power,
+        curve_efficiency=curve_eff,
+        curve_size=curve_size,
+        antenna_tolerance=antenna_tol,
+        rectifier_group=rectifier_group)
+
+
+def _rectifier_efficiency(
+        batch: HarvesterBatch,
+        rows: slice,
+        input_power_uw: np.ndarray) -> np.ndarray:
+    """
+    Rectifier efficiency for an array of input powers, one curve per row
+
+    input_power_uw has shape (B, ...) and row b is looked up on curve b.
+    Uses the same clamping and interpolation formula as the scalar
+    get_rectifier_efficiency, so the values are bit-for-bit identical.
+    """
+    powers = batch.curve_power_uw[rows]
+    effs = batch.curve_efficiency[rows]
+    sizes = batch.curve_size[rows]
+    count = powers.shape[0]
+    flat = input_power_uw.reshape(count, -1)
+
+    # Number of curve points strictly below each input = the index
+    # bisect_left would return.  K is tiny, so a loop over points is
+    # cheaper than a per-row binary search.
+    below = np.zeros(flat.shape, dtype=np.int64)
+    for k in range(powers.shape[1]):
+        below += flat > powers[:, k:k + 1]
+
+    segment = np.clip(below - 1, 0, powers.shape[1] - 2)
+    p1 = np.take_along_axis(powers, segment, axis=1)
+    p2 = np.take_along_axis(powers, segment + 1, axis=1)
+    e1 = np.take_along_axis(effs, segment, axis=1)
+    e2 = np.take_along_axis(effs, segment + 1, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Linear interpolation formula (same operation order as scalar)
+        result = e1 + (e2 - e1) * (flat - p1) / (p2 - p1)
+
+    last = np.maximum(sizes - 1, 0)[:, None]
+    first_power = powers[:, :1]
+    last_power = np.take_along_axis(powers, last, axis=1)
+    result = np.where(flat >= last_power,
+                      np.take_along_axis(effs, last, axis=1), result)
+    result = np.where(flat <= first_power, effs[:, :1], result)
+    result = np.where((sizes == 0)[:, None],
+                      DEFAULT_RECTIFIER_EFFICIENCY, result)
+    return result.reshape(input_power_uw.shape)
+
+
+def _received_power(batch: HarvesterBatch, rows: slice,
+                    sources: slice):
+    """(match mask, received power) of a block of pairs"""
+    source_freq = batch.source_frequency_mhz[rows, sources, None]
+    antenna_freq = batch.antenna_frequency_mhz[rows, None, :]
+    tolerance = DEFAULT_MATCH_TOLERANCE
+    if batch.antenna_tolerance is not None:
+        tolerance = batch.antenna_tolerance[rows, None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        match = (np.abs(source_freq - antenna_freq) / antenna_freq
+                 < tolerance)
+
+    # Power = power_density x effective_area x antenna_efficiency x
+    # availability x resonance boost (same order as the scalar path)
+    antenna_eff = batch.antenna_efficiency[rows, None, :]
+    received = (batch.source_power_density_uw_per_m2[rows, sources, None] *
+                batch.antenna_effective_area_m2[rows, None, :] *
+                antenna_eff *
+                batch.source_availability[rows, sources, None])
+    received = received * batch.resonance_boost[rows, None, None]
+
+    # Only matched pairs with some power count (like the scalar loop)
+    match &= received > 0
+    received = np.where(match, received, 0.0)
+    return match, received
+
+
+def _antenna_received(batch: HarvesterBatch, rows: slice,
+                      source_step: int) -> np.ndarray:
+    """Received power per antenna (b, A), adding sources in order,
+    source_step of them at a time"""
+    antenna_received = np.zeros(batch.antenna_frequency_mhz[rows].shape)
+    source_count = batch.source_frequency_mhz.shape[1]
+    for source_start in range(0, source_count, source_step):
+        _, received = _received_power(
+            batch, rows, slice(source_start, source_start + source_step))
+        # cumsum adds strictly in order (see _sequential_sum)
+        antenna_received = np.cumsum(np.concatenate(
+            [antenna_received[:, None, :], received], axis=1),
+            axis=1)[:, -1, :]
+    return antenna_received
+
+
+def _group_sum(batch: HarvesterBatch, rows: slice,
+               per_antenna: np.ndarray) -> np.ndarray:
+    """Per-antenna values (b, A) added up per rectifier group, antennas
+    in order; (b, A) by group number"""
+    return _sum_by_group(batch.rectifier_group[rows], per_antenna)
+
+
+def _sum_by_group(groups: np.ndarray, per_antenna: np.ndarray
+                  ) -> np.ndarray:
+    """
+    Per-antenna values (b, A) added up per group (b, A; -1 = no group),
+    antennas in order - the order RFEnergyHarvester adds them in.
+    Returns (b, A) indexed by group number.
+    """
+    totals = np.zeros(groups.shape)
+    row_index = np.arange(groups.shape[0])
+    for antenna in range(groups.shape[1]):
+        group = groups[:, antenna]
+        shared = group >= 0
+        totals[row_index[shared], group[shared]] += \
+            per_antenna[shared, antenna]
+    return totals
+
+
+def _shared_rows(batch: HarvesterBatch, rows: slice) -> bool:
+    """Whether any antenna of these rows feeds a shared rectifier"""
+    return batch.rectifier_group is not None and \
+        bool(np.any(batch.rectifier_group[rows] >= 0))
+
+
+def _group_received(batch: HarvesterBatch, rows: slice,
+                    source_step: int) -> Optional[np.ndarray]:
+    """
+    Power reaching each shared rectifier, (b, A) by group number
+
+    Two grouped sums, linear in the number of pairs: received power per
+    antenna (sources in order), then per group (antennas in order) -
+    the order RFEnergyHarvester adds them in, so the results match it
+    exactly.  None if every antenna of these rows is rectified pair by
+    pair.
+    """
+    if not _shared_rows(batch, rows):
+        return None
+    return _group_sum(batch, rows,
+                      _antenna_received(batch, rows, source_step))
+
+
+def _by_antenna(batch: HarvesterBatch, rows: slice,
+                group_values: np.ndarray) -> np.ndarray:
+    """Per-group values (b, A) looked up for each antenna's group"""
+    return np.take_along_axis(
+        group_values, np.maximum(batch.rectifier_group[rows], 0), axis=1)
+
+
+def _evaluate_pairs(batch: HarvesterBatch, rows: slice, sources: slice,
+                    group_received: Optional[np.ndarray] = None
+                    ) -> Dict[str, np.ndarray]:
+    """
+    Match mask, received power and efficiency chain for a block
+
+    Pass group_received (from _group_received, over all sources) when
+    the batch has shared rectifiers; without it every pair is rectified
+    on its own.
+    """
+    match, received = _received_power(batch, rows, sources)
+    antenna_eff = batch.antenna_efficiency[rows, None, :]
+
+    rectifier_eff = _rectifier_efficiency(batch, rows, received)
+    if group_received is not None:
+        shared = _by_antenna(batch, rows, _rectifier_efficiency(
+            batch, rows, group_received))
+        rectifier_eff = np.where(
+            (batch.rectifier_group[rows] >= 0)[:, None, :],
+            shared[:, None, :], rectifier_eff)
+    total_eff = (antenna_eff *
+                 batch.matching_efficiency[rows, None, None] *
+                 rectifier_eff *
+                 batch.filter_efficiency[rows, None, None])
+    total_eff = np.where(match, total_eff, 0.0)
+    harvested = received * total_eff
+
+    return {
+        'match': match,
+        'received_uw': received,
+        'rectifier_efficiency': rectifier_eff,
+        'efficiency': total_eff,
+        'harvested_uw': harvested,
+    }
+
+
+def _sequential_sum(values: np.ndarray, start: np.ndarray) -> np.ndarray:
+    """
+    Add up the last two axes left to right, continuing from start
+
+    np.sum uses pairwise summation, which rounds differently from the
+    scalar loop.  cumsum adds strictly in order, so the last element is
+    exactly what `total += x` would give (the zeros of unmatched pairs
+    do not change a float sum).
+    """
+    flat = values.reshape(values.shape[0], -1)
+    flat = np.concatenate([start[:, None], flat], axis=1)
+    return np.cumsum(flat, axis=1)[:, -1]
+
+
+def _totals(total_received: np.ndarray,
+            total_harvested: np.ndarray) -> Dict[str, np.ndarray]:
+    """Derived totals shared by evaluate_batch and evaluate_totals"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        system_eff = np.where(total_received > 0,
+                              total_harvested / total_received, 0.0)
+    return {
+        'total_received_uw': total_received,
+        'total_harvested_uw': total_harvested,
+        'total_harvested_mw': total_harvested / 1000.0,
+        'system_efficiency': system_eff,
+    }
+
+
+def evaluate_batch(batch: HarvesterBatch) -> Dict[str, np.ndarray]:
+    """
+    Evaluate every source x antenna pair of every harvester at once
+
+    Returns the full (B, S, A) matrices ('match', 'received_uw',
+    'rectifier_efficiency', 'efficiency', 'harvested_uw') plus the
+    per-harvester totals, each of shape (B,).
+    """
+    everything = slice(None)
+    group_received = _group_received(
+        batch, everything, max(batch.source_frequency_mhz.shape[1], 1))
+    pairs = _evaluate_pairs(batch, everything, everything, group_received)
+    zeros = np.zeros(batch.size)
+    pairs.update(_totals(_sequential_sum(pairs['received_uw'], zeros),
+                         _sequential_sum(pairs['harvested_uw'], zeros)))
+    return pairs
+
+
+def evaluate_totals(batch: HarvesterBatch,
+                    max_elements: int = 1 << 22) -> Dict[str, np.ndarray]:
+    """
+    Evaluate only the per-harvester totals, in bounded memory
+
+    Sources are processed in blocks so that no temporary array has more
+    than about max_elements entries.  Totals are still added in the same
+    order as the scalar loop, so they match it exactly.
+    """
+    source_count = batch.source_frequency_mhz.shape[1]
+    antenna_count = batch.antenna_frequency_mhz.shape[1]
+    total_received = np.zeros(batch.size)
+    total_harvested = np.zeros(batch.size)
+    if batch.size == 0:
+        return _totals(total_received, total_harvested)
+
+    # Split rows first, then sources, until a block fits in max_elements
+    row_step = max(1, min(batch.size,
+                          max_elements //
+                          max(1, source_count * antenna_count)))
+    source_step = max(1, max_elements // (row_step * max(1, antenna_count)))
+    for row_start in range(0, batch.size, row_step):
+        rows = slice(row_start, row_start + row_step)
+        group_received = _group_received(batch, rows, source_step)
+        for source_start in range(0, source_count, source_step):
+            sources = slice(source_start, source_start + source_step)
+            pairs = _evaluate_pairs(batch, rows, sources, group_received)
+            total_received[rows] = _sequential_sum(
+                pairs['received_uw'], total_received[rows])
+            total_harvested[rows] = _sequential_sum(
+                pairs['harvested_uw'], total_harvested[rows])
+
+    return _totals(total_received, total_harvested)
+
+
+def batch_results(harvesters: Sequence[RFEnergyHarvester],
+                  evaluated: Dict[str, np.ndarray],
+                  row: int) -> Dict:
+    """
+    Turn one row of evaluate_batch output into the usual results dict
+
+    The returned dict has the same layout and values as
+    harvesters[row].calculate_total_harvested_power().
+    """
+    harvester = harvesters[row]
+    # np.nonzero walks the matrix row by row = source by source, which is
+    # the same order as the nested loop in the scalar version
+    s, a = np.nonzero(evaluated['match'][row])
+    sources = HarvestResult(
+        s, a, evaluated['received_uw'][row][s, a],
+        evaluated['harvested_uw'][row][s, a],
+        evaluated['efficiency'][row][s, a],
+        harvester.rf_sources.column('name'),
+        harvester.rf_sources.column('frequency_mhz'))
+
+    return {
+        'sources': sources,
+        'total_received_uw': evaluated['total_received_uw'][row].item(),
+        'total_harvested_uw': evaluated['total_harvested_uw'][row].item(),
+        'total_harvested_mw': evaluated['total_harvested_mw'][row].item(),
+        'system_efficiency': evaluated['system_efficiency'][row].item()
+    }
+
+
+def evaluate_harvesters(
+        harvesters: Sequence[RFEnergyHarvester],
+        batch: Optional[HarvesterBatch] = None) -> List[Dict]:
+    """
+    Vectorized drop-in for calling calculate_total_harvested_power on
+    each harvester in a list
+    """
+    if batch is None:
+        batch = pack_harvesters(harvesters)
+    evaluated = evaluate_batch(batch)
+    return [batch_results(harvesters, evaluated, row)
+            for row in range(len(harvesters))]
+
+
+# Gradients ------------------------------------------------------------------
+
+# Inputs evaluate_gradients differentiates with respect to (HarvesterBatch
+# field names; each gradient has the same shape as its field)
+GRADIENT_FIELDS = ('source_power_density_uw_per_m2', 'source_availability',
+                   'antenna_effective_area_m2', 'antenna_efficiency',
+                   'matching_efficiency', 'filter_efficiency',
+                   'resonance_boost', 'curve_power_uw', 'curve_efficiency')
+
+
+def _rectifier_derivatives(batch: HarvesterBatch, rows: slice,
+                           input_power_uw: np.ndarray) -> Dict:
+    """
+    How the rectifier efficiency of each input moves with the input
+    and with the curve points around it
+
+    Uses the same segment and clamping rules as _rectifier_efficiency,
+    so at a curve point (a kink) the slope is that of the segment the
+    lookup used, the one to the left.  Returns arrays shaped like
+    input_power_uw: 'slope' (dR/dP), 'lower' / 'upper' (curve positions
+    of the two points the value depends on), 'd_lower_efficiency',
+    'd_upper_efficiency', 'd_lower_power', 'd_upper_power'.
+    """
+    powers = batch.curve_power_uw[rows]
+    effs = batch.curve_efficiency[rows]
+    sizes = batch.curve_size[rows]
+    count = powers.shape[0]
+    flat = input_power_uw.reshape(count, -1)
+
+    below = np.zeros(flat.shape, dtype=np.int64)
+    for k in range(powers.shape[1]):
+        below += flat > powers[:, k:k + 1]
+    lower = np.clip(below - 1, 0, powers.shape[1] - 2)
+    upper = lower + 1
+    p1 = np.take_along_axis(powers, lower, axis=1)
+    p2 = np.take_along_axis(powers, upper, axis=1)
+    e1 = np.take_along_axis(effs, lower, axis=1)
+    e2 = np.take_along_axis(effs, upper, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        width = p2 - p1
+        position = (flat - p1) / width  # 0 at p1 ... 1 at p2
+        slope = (e2 - e1) / width
+        d_lower_power = slope * (flat - p2) / width
+        d_upper_power = -slope * position
+    d_lower_eff = 1.0 - position
+    d_upper_eff = position
+
+    # Flat ends: the value is simply the first / last efficiency
+    last = np.maximum(sizes - 1, 0)[:, None]
+    low = flat <= powers[:, :1]
+    high = ~low & (flat >= np.take_along_axis(powers, last, axis=1))
+    clamped = low | high
+    lower = np.where(low, 0, np.where(high, last, lower))
+    d_lower_eff = np.where(clamped, 1.0, d_lower_eff)
+    no_rectifier = (sizes == 0)[:, None]
+    unused = clamped | no_rectifier
+    slope = np.where(unused, 0.0, slope)
+    d_upper_eff = np.where(unused, 0.0, d_upper_eff)
+    d_lower_power = np.where(unused, 0.0, d_lower_power)
+    d_upper_power = np.where(unused, 0.0, d_upper_power)
+    d_lower_eff = np.where(no_rectifier, 0.0, d_lower_eff)
+
+    shape = input_power_uw.shape
+    return {
+        'slope': slope.reshape(shape),
+        'lower': lower.reshape(shape),
+        'upper': upper.reshape(shape),
+        'd_lower_efficiency': d_lower_eff.reshape(shape),
+        'd_upper_efficiency': d_upper_eff.reshape(shape),
+        'd_lower_power': d_lower_power.reshape(shape),
+        'd_upper_power': d_upper_power.reshape(shape),
+    }
+
+
+def _add_curve_gradients(gradients: Dict[str, np.ndarray], rows: slice,
+                         weight: np.ndarray, rectifier_d: Dict):
+    """
+    Add weight x (d efficiency / d curve point) for the two curve points
+    each efficiency came from (weight = harvested power per unit of
+    rectifier efficiency, shaped like the inputs of rectifier_d)
+    """
+    count = weight.shape[0]
+    weight = weight.reshape(count, -1)
+    curve_power = gradients['curve_power_uw'][rows]
+    curve_eff = gradients['curve_efficiency'][rows]
+    for end in ('lower', 'upper'):
+        position = rectifier_d[end].reshape(count, -1)
+        d_eff = weight * rectifier_d[f'd_{end}_efficiency'].reshape(
+            count, -1)
+        d_power = weight * rectifier_d[f'd_{end}_power'].reshape(count, -1)
+        for k in range(curve_eff.shape[1]):
+            at = position == k
+            curve_eff[:, k] += np.where(at, d_eff, 0.0).sum(axis=1)
+            curve_power[:, k] += np.where(at, d_power, 0.0).sum(axis=1)
+
+
+def _pair_gradients(batch: HarvesterBatch, rows: slice, sources: slice,
+                    gradients: Dict[str, np.ndarray],
+                    group_received: Optional[np.ndarray] = None,
+                    group_weight: Optional[np.ndarray] = None
+                    ) -> np.ndarray:
+    """
+    Harvested power of a block (as _evaluate_pairs gives it) and its
+    derivatives, added into gradients
+
+    Per pair, with received power r = density x area x antenna_eff x
+    availability x boost and rectifier efficiency R(r):
+
+        harvested = r x antenna_eff x matching x R(r) x filter
+
+    so d harvested / d r = antenna_eff x matching x filter x
+    (R + r x R'), and the chain rule does the rest.  Frequency-matched
+    pairs that receive nothing (zero density or availability) add their
+    derivative for increasing that value from zero.
+
+    With a shared rectifier R is evaluated at the group's total G, and
+    raising r moves R for the whole group: d harvested / d r =
+    antenna_eff x matching x filter x R(G) + R'(G) x group_weight, where
+    group_weight is the group's harvested power per unit of R.  The
+    group's curve gradients are added by evaluate_gradients, once.
+    """
+    pairs = _evaluate_pairs(batch, rows, sources, group_received)
+    received = pairs['received_uw']
+    rectifier = pairs['rectifier_efficiency']
+
+    density = batch.source_power_density_uw_per_m2[rows, sources, None]
+    availability = batch.source_availability[rows, sources, None]
+    area = batch.antenna_effective_area_m2[rows, None, :]
+    antenna_eff = batch.antenna_efficiency[rows, None, :]
+    boost = batch.resonance_boost[rows, None, None]
+    matching = batch.matching_efficiency[rows, None, None]
+    filtering = batch.filter_efficiency[rows, None, None]
+
+    source_freq = batch.source_frequency_mhz[rows, sources, None]
+    antenna_freq = batch.antenna_frequency_mhz[rows, None, :]
+    tolerance = DEFAULT_MATCH_TOLERANCE
+    if batch.antenna_tolerance is not None:
+        tolerance = batch.antenna_tolerance[rows, None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tuned = (np.abs(source_freq - antenna_freq) / antenna_freq
+                 < tolerance)
+    counted = pairs['match'] | (tuned & (received == 0))
+    mask = counted.astype(float)
+
+    rectifier_d = _rectifier_derivatives(batch, rows, received)
+    # d harvested / d received, and harvested per unit of R
+    chain = antenna_eff * matching * filtering * mask
+    d_received = chain * (rectifier + received * rectifier_d['slope'])
+    d_rectifier = received * chain
+    if group_received is not None:
+        shared = (batch.rectifier_group[rows] >= 0)[:, None, :]
+        group_slope = _rectifier_derivatives(
+            batch, rows, group_received)['slope']
+        slope_term = _by_antenna(batch, rows, group_slope * group_weight)
+        d_received = np.where(
+            shared, chain * rectifier + mask * slope_term[:, None, :],
+            d_received)
+        d_rectifier = np.where(shared, 0.0, d_rectifier)
+
+    d_density = d_received * area * antenna_eff * availability * boost
+    d_availability = d_received * density * area * antenna_eff * boost
+    d_area = d_received * density * antenna_eff * availability * boost
+    d_antenna_eff = (d_received * density * area * availability * boost +
+                     received * matching * rectifier * filtering * mask)
+    d_boost = d_received * density * area * antenna_eff * availability
+    unit_matching = received * antenna_eff * rectifier * filtering * mask
+    unit_filter = received * antenna_eff * matching * rectifier * mask
+
+    gradients['source_power_density_uw_per_m2'][rows, sources] += \
+        d_density.sum(axis=2)
+    gradients['source_availability'][rows, sources] += \
+        d_availability.sum(axis=2)
+    gradients['antenna_effective_area_m2'][rows] += d_area.sum(axis=1)
+    gradients['antenna_efficiency'][rows] += d_antenna_eff.sum(axis=1)
+    gradients['resonance_boost'][rows] += d_boost.sum(axis=(1, 2))
+    gradients['matching_efficiency'][rows] += \
+        unit_matching.sum(axis=(1, 2))
+    gradients['filter_efficiency'][rows] += unit_filter.sum(axis=(1, 2))
+
+    # Each pair rectified on its own moves the two curve points its
+    # efficiency came from
+    _add_curve_gradients(gradients, rows, d_rectifier, rectifier_d)
+    return pairs['harvested_uw']
+
+
+def evaluate_gradients(batch: HarvesterBatch,
+                       max_elements: int = 1 << 20) -> Dict:
+    """
+    Total harvested power and its exact derivatives, in one pass
+
+    Returns 'total_harvested_uw' (B,) - identical to evaluate_totals -
+    and 'gradients': d total_harvested_uw / d field for every name in
+    GRADIENT_FIELDS, each shaped like that batch field (padding entries
+    stay 0).  Curve gradients follow the batch's sorted curve points.
+
+    Everything is piecewise smooth: on a kink (a pair exactly at a
+    rectifier curve point or the edge of a frequency band) the
+    derivative of the side the forward evaluation used is given.
+    Frequencies and tolerances only switch pairs on or off, so they
+    have no derivative.  Shared rectifiers (rectifier_group) are
+    handled: every pair then moves its whole group's efficiency.  Works
+    in blocks of about max_elements pairs.
+    """
+    gradients = {name: np.zeros(np.shape(getattr(batch, name)))
+                 for name in GRADIENT_FIELDS}
+    total_harvested = np.zeros(batch.size)
+    source_count = batch.source_frequency_mhz.shape[1]
+    antenna_count = batch.antenna_frequency_mhz.shape[1]
+    if batch.size == 0:
+        return {'total_harvested_uw': total_harvested,
+                'gradients': gradients}
+
+    row_step = max(1, min(batch.size,
+                          max_elements //
+                          max(1, source_count * antenna_count)))
+    source_step = max(1, max_elements // (row_step * max(1, antenna_count)))
+    for row_start in range(0, batch.size, row_step):
+        rows = slice(row_start, row_start + row_step)
+        group_received = group_weight = None
+        if _shared_rows(batch, rows):
+            antenna_received = _antenna_received(batch, rows, source_step)
+            group_received = _group_sum(batch, rows, antenna_received)
+            # Harvested power of each group per unit of its efficiency
+            group_weight = _group_sum(
+                batch, rows,
+                antenna_received * batch.antenna_efficiency[rows] *
+                (batch.matching_efficiency[rows] *
+                 batch.filter_efficiency[rows])[:, None])
+            _add_curve_gradients(
+                gradients, rows, group_weight,
+                _rectifier_derivatives(batch, rows, group_received))
+        for source_start in range(0, source_count, source_step):
+            sources = slice(source_start, source_start + source_step)
+            harvested = _pair_gradients(batch, rows, sources, gradients,
+                                        group_received, group_weight)
+            total_harvested[rows] = _sequential_sum(
+                harvested, total_harvested[rows])
+    return {'total_harvested_uw': total_harvested, 'gradients': gradients}
+
+
+def harvester_gradients(
+        harvesters: Sequence[RFEnergyHarvester],
+        batch: Optional[HarvesterBatch] = None) -> List[Dict]:
+    """
+    evaluate_gradients for a list of harvesters, as one dict each:
+
+        {'total_harvested_uw': ...,
+         'sources': [{'source', 'power_density_uw_per_m2',
+                      'availability'}, ...],          # in source order
+         'antennas': [{'frequency_mhz', 'effective_area_m2',
+                       'efficiency'}, ...],           # in antenna order
+         'matching_efficiency': ..., 'filter_efficiency': ...,
+         'resonance_boost': ...,
+         'rectifier': [{'power_uw', 'd_power_uw', 'd_efficiency'}, ...]}
+
+    Every number except the names, frequencies, power_uw and the total
+    is a derivative of total_harvested_uw (μW per unit of that input).
+    """
+    if batch is None:
+        batch = pack_harvesters(harvesters)
+    evaluated = evaluate_gradients(batch)
+    gradients = {name: values.tolist()
+                 for name, values in evaluated['gradients'].items()}
+    results = []
+    for row, harvester in enumerate(harvesters):
+        count_s = len(harvester.rf_sources)
+        count_a = len(harvester.antennas)
+        size = int(batch.curve_size[row])
+        results.append({
+            'total_harvested_uw': evaluated['total_harvested_uw'][row].item(),
+            'sources': [
+                {'source': name, 'power_density_uw_per_m2': density,
+                 'availability': availability}
+                for name, density, availability in zip(
+                    harvester.rf_sources.column('name'),
+                    gradients['source_power_density_uw_per_m2'][row][
+                        :count_s],
+                    gradients['source_availability'][row][:count_s])],
+            'antennas': [
+                {'frequency_mhz': frequency, 'effective_area_m2': area,
+                 'efficiency': efficiency}
+                for frequency, area, efficiency in zip(
+                    harvester.antennas.column('frequency_mhz').tolist(),
+                    gradients['antenna_effective_area_m2'][row][:count_a],
+                    gradients['antenna_efficiency'][row][:count_a])],
+            'matching_efficiency': gradients['matching_efficiency'][row],
+            'filter_efficiency': gradients['filter_efficiency'][row],
+            'resonance_boost': gradients['resonance_boost'][row],
+            'rectifier': [
+                {'power_uw': power, 'd_power_uw': d_power,
+                 'd_efficiency': d_eff}
+                for power, d_power, d_eff in zip(
+                    batch.curve_power_uw[row][:size].tolist(),
+                    gradients['curve_power_uw'][row][:size],
+                    gradients['curve_efficiency'][row][:size])],
+        })
+    return results
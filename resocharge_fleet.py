@@ -0,0 +1,408 @@
+# ResoCharge: Fleet Simulation
+# Thousands of deployed battery-free nodes, each in its own spot
+#
+# What this does:
+# - Holds a whole fleet as one HarvesterBatch: one row per node with its
+#   own RF environment, antenna set and rectifier, plus the device each
+#   node has to run (its load)
+# - Works out every node's harvested power and energy per day, and
+#   which device classes (DEVICE_POWER_REQUIREMENTS_MW) it could run
+# - Splits the nodes across worker processes through shared memory:
+#   the fleet's arrays are copied into one shared block once, and tasks
+#   only carry (start, stop) - no per-node objects are ever pickled
+# - Sums it all up: how many nodes can run each device continuously,
+#   how many only duty-cycled, and how well each load is served
+#
+# Per-node numbers are exactly what RFEnergyHarvester gives
+# (calculate_total_harvested_power, calculate_energy_per_day and
+# estimate_charging_capability), just for 10^5+ nodes at a time.
+#
+# Example:
+#   fleet = synthetic_fleet(100_000)
+#   result = simulate_fleet(fleet, workers=8)
+#   print(result.format())
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from resocharge_engine import DEFAULT_MATCH_TOLERANCE, HarvesterBatch, \
+    evaluate_totals, pack_harvesters
+from resocharge_simulator import DEVICE_POWER_REQUIREMENTS_MW, \
+    PARTIAL_POWER_FRACTION, RFEnergyHarvester, \
+    create_near_cell_tower_scenario, create_rural_scenario, \
+    create_urban_apartment_scenario
+
+
+# Device classes in a fixed order; loads and feasibility columns are
+# positions in this tuple
+DEVICE_CLASSES = tuple(DEVICE_POWER_REQUIREMENTS_MW)
+
+# Feasibility codes, and the words estimate_charging_capability uses
+NOT_FEASIBLE, PARTIAL, CONTINUOUS = 0, 1, 2
+FEASIBILITY_LABELS = ('No', 'Partial', 'Continuous')
+
+# Loads drawn by synthetic_fleet: what battery-free nodes actually run
+SENSOR_LOADS = ('Low-power MCU (sleep)', 'Temperature sensor',
+                'E-ink display (static)', 'Low-power MCU (active)')
+
+# Nodes per worker task
+DEFAULT_CHUNK_SIZE = 8192
+
+# Shared-memory arrays start on cache-line boundaries
+_ALIGNMENT = 64
+
+
+@dataclass
+class Fleet:
+    """
+    A fleet of deployed nodes
+
+    Think of this as an inventory spreadsheet: row n of batch is node
+    n's environment and hardware, and load[n] says which device class
+    (position in DEVICE_CLASSES) it powers.
+    """
+    batch: HarvesterBatch
+    load: np.ndarray  # (N,) device class codes
+    names: Optional[List[str]] = None  # Node names (optional)
+
+    @property
+    def size(self) -> int:
+        """Number of nodes"""
+        return self.batch.size
+
+
+def device_code(device: str) -> int:
+    """Position of a device class in DEVICE_CLASSES"""
+    try:
+        return DEVICE_CLASSES.index(device)
+    except ValueError:
+        raise ValueError(f"Unknown device class: {device!r}") from None
+
+
+def fleet_from_harvesters(harvesters: Sequence[RFEnergyHarvester],
+                          loads: Sequence[str]) -> Fleet:
+    """A fleet with one node per harvester, running the named devices"""
+    if len(loads) != len(harvesters):
+        raise ValueError(f"{len(harvesters)} harvesters but "
+                         f"{len(loads)} loads")
+    return Fleet(batch=pack_harvesters(harvesters),
+                 load=np.array([device_code(d) for d in loads],
+                               dtype=np.int64),
+                 names=[h.name for h in harvesters])
+
+
+def synthetic_fleet(nodes: int, seed: int = 0,
+                    loads: Sequence[str] = SENSOR_LOADS) -> Fleet:
+    """
+    A random fleet for trying things out
+
+    Each node starts from one of the built-in environments (urban,
+    near a tower, rural), then gets its own signal strengths (each
+    source x0.25 to x4, log-normal) and antenna sizes (x0.5 to x2), and
+    a random load from loads.  Built straight as arrays, so a million
+    nodes take a second or two.
+    """
+    rng = np.random.default_rng(seed)
+    base = pack_harvesters([create_urban_apartment_scenario(),
+                            create_near_cell_tower_scenario(),
+                            create_rural_scenario()])
+    pick = rng.integers(base.size, size=nodes)
+    batch = replace(base, **{f.name: getattr(base, f.name)[pick]
+                             for f in fields(HarvesterBatch)
+                             if getattr(base, f.name) is not None})
+    batch.source_power_density_uw_per_m2 = (
+        batch.source_power_density_uw_per_m2 *
+        np.clip(rng.lognormal(0.0, 0.7, batch.source_frequency_mhz.shape),
+                0.25, 4.0))
+    batch.antenna_effective_area_m2 = (
+        batch.antenna_effective_area_m2 *
+        rng.uniform(0.5, 2.0, (nodes, 1)))
+    codes = np.array([device_code(d) for d in loads], dtype=np.int64)
+    return Fleet(batch=batch, load=codes[rng.integers(len(codes),
+                                                      size=nodes)])
+
+
+def _batch_rows(batch: HarvesterBatch, start: int,
+                stop: int) -> HarvesterBatch:
+    """Rows start..stop-1 of a batch (views, no copies)"""
+    return replace(batch, **{
+        f.name: getattr(batch, f.name)[start:stop]
+        for f in fields(HarvesterBatch)
+        if getattr(batch, f.name) is not None})
+
+
+# Shared memory ------------------------------------------------------------
+
+def _share_batch(batch: HarvesterBatch, outputs: int
+                 ) -> Tuple[shared_memory.SharedMemory, List[Tuple]]:
+    """
+    Copy a batch into one shared-memory block, followed by room for
+    outputs result columns; returns the block and its layout
+    ((name, shape, dtype, offset) per array, outputs last as 'out')
+    """
+    arrays = {f.name: getattr(batch, f.name)
+              for f in fields(HarvesterBatch)}
+    if arrays['antenna_tolerance'] is None:
+        arrays['antenna_tolerance'] = np.full(
+            batch.antenna_frequency_mhz.shape, DEFAULT_MATCH_TOLERANCE)
+    # Other optional arrays that aren't set stay at their default
+    arrays = {name: values for name, values in arrays.items()
+              if values is not None}
+    arrays['out'] = np.zeros((outputs, batch.size))
+
+    layout, offset = [], 0
+    for name, values in arrays.items():
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        layout.append((name, values.shape, values.dtype.str, offset))
+        offset += values.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, shape, dtype, start in layout:
+        np.ndarray(shape, dtype, buffer=block.buf,
+                   offset=start)[...] = arrays[name]
+    return block, layout
+
+
+def _attach(buffer, layout: List[Tuple]
+            ) -> Tuple[HarvesterBatch, np.ndarray]:
+    """The batch and output arrays inside a shared block"""
+    arrays = {name: np.ndarray(shape, dtype, buffer=buffer, offset=start)
+              for name, shape, dtype, start in layout}
+    out = arrays.pop('out')
+    return HarvesterBatch(**arrays), out
+
+
+# Set up once in each worker process
+_worker_block: Optional[shared_memory.SharedMemory] = None
+_worker_arrays: Optional[Tuple[HarvesterBatch, np.ndarray]] = None
+
+
+def _init_worker(block_name: str, layout: List[Tuple]):
+    global _worker_block, _worker_arrays
+    _worker_block = shared_memory.SharedMemory(name=block_name)
+    _worker_arrays = _attach(_worker_block.buf, layout)
+
+
+def _evaluate_rows(batch: HarvesterBatch, out: np.ndarray, start: int,
+                   stop: int):
+    """Totals for nodes start..stop-1, written into out"""
+    totals = evaluate_totals(_batch_rows(batch, start, stop))
+    out[0, start:stop] = totals['total_received_uw']
+    out[1, start:stop] = totals['total_harvested_uw']
+
+
+def _evaluate_chunk(start: int, stop: int):
+    batch, out = _worker_arrays
+    _evaluate_rows(batch, out, start, stop)
+
+
+def _fleet_totals(batch: HarvesterBatch, chunk_size: int,
+                  workers: Optional[int]) -> np.ndarray:
+    """(received, harvested) μW per node, shape (2, N)"""
+    bounds = [(start, min(start + chunk_size, batch.size))
+              for start in range(0, batch.size, chunk_size)]
+    if workers == 1 or len(bounds) <= 1:
+        out = np.zeros((2, batch.size))
+        for start, stop in bounds:
+            _evaluate_rows(batch, out, start, stop)
+        return out
+
+    block, layout = _share_batch(batch, outputs=2)
+    try:
+        with ProcessPoolExecutor(
+                max_workers=min(workers or os.cpu_count() or 1,
+                                len(bounds)),
+                initializer=_init_worker,
+                initargs=(block.name, layout)) as pool:
+            for future in [pool.submit(_evaluate_chunk, start, stop)
+                           for start, stop in bounds]:
+                future.result()  # Re-raises a worker's error
+        _, out = _attach(block.buf, layout)
+        out = out.copy()
+    finally:
+        block.close()
+        block.unlink()
+    return out
+
+
+# Results ------------------------------------------------------------------
+
+def feasibility(power_mw: np.ndarray) -> np.ndarray:
+    """
+    What each power level can run: (N, devices) codes NOT_FEASIBLE /
+    PARTIAL / CONTINUOUS, same rule as estimate_charging_capability
+    """
+    required = np.array(list(DEVICE_POWER_REQUIREMENTS_MW.values()))
+    power = np.asarray(power_mw, dtype=float)[:, None]
+    return np.where(power >= required, CONTINUOUS,
+                    np.where(power >= required * PARTIAL_POWER_FRACTION,
+                             PARTIAL, NOT_FEASIBLE)).astype(np.int8)
+
+
+@dataclass
+class FleetResult:
+    """
+    Per-node results of a fleet simulation
+
+    columns holds one array per node: total_received_uw,
+    total_harvested_uw, power_mw, energy_per_day_mwh, energy_per_day_j,
+    load (device code), load_duty_cycle (fraction of the time the load
+    can run, up to 1) and load_feasibility; feasibility is the
+    (N, devices) code matrix for every device class.
+    """
+    columns: Dict[str, np.ndarray]
+    feasibility: np.ndarray
+    elapsed_s: float
+
+    @property
+    def size(self) -> int:
+        return len(self.columns['power_mw'])
+
+    def node(self, index: int) -> Dict:
+        """One node's results in the layout of calculate_energy_per_day
+        and estimate_charging_capability"""
+        values = {name: column[index].item()
+                  for name, column in self.columns.items()}
+        values['load'] = DEVICE_CLASSES[values['load']]
+        values['load_feasibility'] = FEASIBILITY_LABELS[
+            values['load_feasibility']]
+        values['capabilities'] = {
+            device: FEASIBILITY_LABELS[code]
+            for device, code in zip(DEVICE_CLASSES,
+                                    self.feasibility[index].tolist())}
+        return values
+
+    def aggregates(self) -> Dict:
+        """
+        Fleet-level summary
+
+        devices: for every device class, the fraction of nodes that
+        could run it continuously / only duty-cycled.
+        loads: for every device class actually carried, how many nodes
+        carry it, the fraction running it continuously and the mean
+        duty cycle.
+        """
+        count = self.size
+        harvested = self.columns['total_harvested_uw']
+        summary = {
+            'nodes': count,
+            'total_harvested_mw': harvested.sum().item() / 1000.0,
+            'energy_per_day_wh': (
+                self.columns['energy_per_day_mwh'].sum().item() / 1000.0),
+            'harvested_uw_percentiles': {
+                p: np.percentile(harvested, p).item() if count else 0.0
+                for p in (5, 25, 50, 75, 95)},
+            'devices': {},
+            'loads': {},
+        }
+        # bincount per column: how many nodes got each code
+        for column, device in enumerate(DEVICE_CLASSES):
+            counts = np.bincount(self.feasibility[:, column],
+                                 minlength=3) / max(count, 1)
+            summary['devices'][device] = {
+                'continuous': counts[CONTINUOUS].item(),
+                'partial': counts[PARTIAL].item()}
+
+        load = self.columns['load']
+        for code in np.unique(load).tolist():
+            carried = load == code
+            summary['loads'][DEVICE_CLASSES[code]] = {
+                'nodes': int(carried.sum()),
+                'continuous': (self.columns['load_feasibility'][carried]
+                               == CONTINUOUS).mean().item(),
+                'mean_duty_cycle': self.columns['load_duty_cycle'][
+                    carried].mean().item()}
+        return summary
+
+    def format(self) -> str:
+        """Text summary of the aggregates"""
+        summary = self.aggregates()
+        median = summary['harvested_uw_percentiles'][50]
+        low = summary['harvested_uw_percentiles'][5]
+        high = summary['harvested_uw_percentiles'][95]
+        lines = [f"Fleet of {summary['nodes']:,} nodes "
+                 f"({self.elapsed_s:.2f} s)",
+                 f"  Harvested in total: "
+                 f"{summary['total_harvested_mw']:.3f} mW "
+                 f"({summary['energy_per_day_wh']:.3f} Wh/day)",
+                 f"  Per node: median {median:.2f} μW "
+                 f"(5%: {low:.2f} μW, 95%: {high:.2f} μW)",
+                 "",
+                 f"  {'Device':26s} {'Continuous':>11s} "
+                 f"{'Partial':>9s}"]
+        for device, share in summary['devices'].items():
+            lines.append(f"  {device:26s} "
+                         f"{share['continuous'] * 100:10.1f}% "
+                         f"{share['partial'] * 100:8.1f}%")
+        lines += ["", f"  {'Load carried':26s} {'Nodes':>9s} "
+                      f"{'Continuous':>11s} {'Duty cycle':>11s}"]
+        for device, load in summary['loads'].items():
+            lines.append(f"  {device:26s} {load['nodes']:9,d} "
+                         f"{load['continuous'] * 100:10.1f}% "
+                         f"{load['mean_duty_cycle'] * 100:10.1f}%")
+        return "\n".join(lines)
+
+
+def simulate_fleet(fleet: Fleet, workers: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> FleetResult:
+    """
+    Evaluate every node of a fleet
+
+    workers    - process count (None = all cores, 1 = no pool)
+    chunk_size - nodes per worker task
+
+    Harvested power comes from the batch engine (exactly
+    calculate_total_harvested_power); energy and feasibility use the
+    formulas of calculate_energy_per_day and
+    estimate_charging_capability, applied to whole columns.
+    """
+    started = time.perf_counter()
+    received, harvested = _fleet_totals(fleet.batch, chunk_size, workers)
+
+    power_mw = harvested / 1000.0
+    energy_mwh = power_mw * 24
+    status = feasibility(power_mw)
+    load = np.asarray(fleet.load, dtype=np.int64)
+    required = np.array(list(DEVICE_POWER_REQUIREMENTS_MW.values()))[load]
+    columns = {
+        'total_received_uw': received,
+        'total_harvested_uw': harvested,
+        'power_mw': power_mw,
+        'energy_per_day_mwh': energy_mwh,
+        'energy_per_day_j': power_mw * 24 * 3600 / 1000.0,
+        'load': load,
+        'load_duty_cycle': np.minimum(power_mw / required, 1.0),
+        'load_feasibility': status[np.arange(len(load)), load],
+    }
+    return FleetResult(columns=columns, feasibility=status,
+                       elapsed_s=time.perf_counter() - started)
+
+
+def main():
+    """Command-line demo: a random sensor fleet"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge fleet simulation (random sensor fleet)')
+    parser.add_argument('--nodes', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int,
+                        default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fleet = synthetic_fleet(args.nodes, seed=args.seed)
+    print(f"Built {fleet.size:,} nodes in "
+          f"{time.perf_counter() - started:.2f} s")
+    result = simulate_fleet(fleet, workers=args.workers,
+                            chunk_size=args.chunk_size)
+    print(result.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# ResoCharge: Inverse Solver
+# "How big would it have to be?" instead of "is it big enough?"
+#
+# What this does:
+# - For every scenario, every device in DEVICE_POWER_REQUIREMENTS_MW and
+#   every design knob, finds the smallest value that powers the device
+#   continuously (or at a chosen duty cycle)
+# - Knobs: the effective area of each antenna (or all antennas scaled
+#   together), the power density of each source (or all of them), and
+#   the availability of each source (or all of them, each capped at 1)
+# - Runs one bracketed bisection for all scenario x knob x device
+#   combinations at once: every step is a single batch engine call, so
+#   the piecewise-linear rectifier curve, resonance boost, rectification
+#   mode and efficiency chain are exactly those of
+#   calculate_total_harvested_power
+#
+# Answers are on the safe side: the value found always passes the
+# estimate_charging_capability test, and is within rtol (relative) of
+# the exact threshold.  0 means the device runs even without that
+# antenna or source; inf means no value of that knob is enough (an
+# antenna that catches nothing, or availability that would need to be
+# above 100%).
+#
+# Example:
+#   result = solve_requirements([create_urban_apartment_scenario()],
+#                               duty_cycle=0.1)
+#   print(result.format())
+
+import argparse
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from resocharge_engine import HarvesterBatch, evaluate_totals, \
+    pack_harvesters
+from resocharge_simulator import DEVICE_POWER_REQUIREMENTS_MW, \
+    RFEnergyHarvester, create_near_cell_tower_scenario, \
+    create_rural_scenario, create_urban_apartment_scenario
+
+# What can be solved for, and the batch array each one scales
+KNOB_KINDS = {
+    'antenna_area': 'antenna_effective_area_m2',
+    'source_density': 'source_power_density_uw_per_m2',
+    'source_availability': 'source_availability',
+}
+
+# Search range for the scale factor of a knob
+MIN_SCALE = 1e-15
+MAX_SCALE = 1e15
+
+# Default relative precision of the answers
+DEFAULT_RTOL = 1e-9
+
+
+@dataclass
+class Knob:
+    """
+    One thing the solver may change in a scenario
+
+    index is the antenna or source row, or None for "all of them,
+    scaled together" (then the answer is a scale factor).
+    """
+    scenario: int  # Position in the scenario list
+    kind: str  # Key of KNOB_KINDS
+    index: Optional[int]
+    label: str
+    current: float  # Present value (1.0 = present scale for index None)
+
+
+def scenario_knobs(harvester: RFEnergyHarvester, scenario: int = 0,
+                   kinds: Sequence[str] = tuple(KNOB_KINDS),
+                   each: bool = True) -> List[Knob]:
+    """The knobs of one scenario: per kind one "all together" knob,
+    plus one per antenna / source if each is set"""
+    knobs = []
+    for kind in kinds:
+        if kind not in KNOB_KINDS:
+            raise ValueError(f"Unknown knob kind {kind!r} "
+                             f"(choose from {', '.join(KNOB_KINDS)})")
+        if kind == 'antenna_area':
+            knobs.append(Knob(scenario, kind, None, 'all antenna areas',
+                              1.0))
+            if each:
+                knobs.extend(
+                    Knob(scenario, kind, i,
+                         f'area of {antenna.frequency_mhz:g} MHz antenna',
+                         antenna.effective_area_m2)
+                    for i, antenna in enumerate(harvester.antennas))
+            continue
+        field_name = ('power_density_uw_per_m2' if kind == 'source_density'
+                      else 'availability')
+        what = 'density' if kind == 'source_density' else 'availability'
+        knobs.append(Knob(scenario, kind, None, f'all source {what}', 1.0))
+        if each:
+            knobs.extend(Knob(scenario, kind, i, f'{source.name} {what}',
+                              getattr(source, field_name))
+                         for i, source in enumerate(harvester.rf_sources))
+    return knobs
+
+
+class _Problem:
+    """
+    Every (knob, device) combination as one row of a batch
+
+    Row r is its scenario's batch row with the knob's antennas or
+    sources multiplied by scale[r]; harvested(scale) evaluates all rows
+    in one engine call.
+    """
+
+    def __init__(self, base: HarvesterBatch, knobs: List[Knob],
+                 devices: int):
+        scenario = np.repeat([knob.scenario for knob in knobs], devices)
+        self.batch = replace(base, **{
+            f.name: getattr(base, f.name)[scenario]
+            for f in fields(HarvesterBatch)
+            if getattr(base, f.name) is not None})
+        rows = len(scenario)
+        kinds = np.repeat([knob.kind for knob in knobs], devices)
+        index = np.repeat([-1 if knob.index is None else knob.index
+                           for knob in knobs], devices)
+
+        # Which entries each row scales (padding stays untouched: zero
+        # areas and densities stay zero, NaN frequencies never match)
+        self.masks = {}
+        for kind, name in KNOB_KINDS.items():
+            width = getattr(self.batch, name).shape[1]
+            columns = np.arange(width)[None, :]
+            self.masks[name] = ((kinds == kind)[:, None] &
+                                ((index[:, None] == -1) |
+                                 (index[:, None] == columns)))
+        self.rows = rows
+
+        # Availability can't go above 1: beyond the scale that takes the
+        # smallest scaled availability to 1, nothing changes any more
+        availability = self.batch.source_availability
+        mask = self.masks['source_availability'] & (availability > 0)
+        with np.errstate(divide='ignore'):
+            limits = np.where(mask, 1.0 / availability, 0.0)
+        self.max_scale = np.where(kinds == 'source_availability',
+                                  np.minimum(limits.max(axis=1, initial=0),
+                                             MAX_SCALE),
+                                  MAX_SCALE)
+
+    def harvested_uw(self, scale: np.ndarray) -> np.ndarray:
+        """Total harvested power of every row at these scales"""
+        arrays = {}
+        for name, mask in self.masks.items():
+            values = getattr(self.batch, name)
+            arrays[name] = np.where(mask, values * scale[:, None], values)
+        arrays['source_availability'] = np.minimum(
+            arrays['source_availability'],
+            np.maximum(self.batch.source_availability, 1.0))
+        return evaluate_totals(replace(self.batch, **arrays))[
+            'total_harvested_uw']
+
+
+@dataclass
+class InverseResult:
+    """
+    Smallest knob values that power each device
+
+    scale[k, d] is the factor knob k has to be multiplied by for device
+    d (inf = not reachable, 0 = not needed at all).
+    """
+    scenarios: List[str]
+    knobs: List[Knob]
+    devices: Tuple[str, ...]
+    duty_cycle: np.ndarray  # (devices,)
+    scale: np.ndarray  # (knobs, devices)
+    elapsed_s: float
+    evaluations: int  # Batch engine calls
+
+    def required(self) -> np.ndarray:
+        """Needed value per knob and device, in the knob's own unit
+        (scale factor for "all together" knobs, capped at 1 for an
+        availability)"""
+        current = np.array([knob.current for knob in self.knobs])
+        with np.errstate(invalid='ignore'):
+            values = current[:, None] * self.scale
+        availability = np.array([knob.kind == 'source_availability' and
+                                 knob.index is not None
+                                 for knob in self.knobs])
+        return np.where(availability[:, None] & np.isfinite(values),
+                        np.minimum(values, 1.0), values)
+
+    def records(self) -> List[Dict]:
+        """One dict per scenario x knob x device"""
+        required = self.required()
+        return [{'scenario': self.scenarios[knob.scenario],
+                 'knob': knob.label, 'kind': knob.kind,
+                 'index': knob.index, 'current': knob.current,
+                 'device': device,
+                 'duty_cycle': self.duty_cycle[d].item(),
+                 'scale': self.scale[k, d].item(),
+                 'required': required[k, d].item()}
+                for k, knob in enumerate(self.knobs)
+                for d, device in enumerate(self.devices)]
+
+    def format(self, devices: Optional[Sequence[str]] = None) -> str:
+        """Table per scenario: knob value needed for each device"""
+        devices = list(devices or self.devices)
+        columns = [self.devices.index(device) for device in devices]
+        widths = [max(len(device), 10) for device in devices]
+        required = self.required()
+        lines = [f"Requirements solved in {self.elapsed_s * 1000:.0f} ms "
+                 f"({self.evaluations} batch evaluations)"]
+        for scenario, name in enumerate(self.scenarios):
+            lines += ["", name,
+                      f"  {'knob':34s} {'now':>10s}" +
+                      "".join(f" {device:>{width}s}"
+                              for device, width in zip(devices, widths))]
+            for k, knob in enumerate(self.knobs):
+                if knob.scenario != scenario:
+                    continue
+                cells = "".join(
+                    f" {_number(required[k, d], knob.index is None):>{w}s}"
+                    for d, w in zip(columns, widths))
+                lines.append(f"  {knob.label[:34]:34s} "
+                             f"{_number(knob.current):>10s}{cells}")
+        return "\n".join(lines)
+
+
+def _number(value: float, factor: bool = False) -> str:
+    if value == 0:
+        return "0"
+    if not np.isfinite(value):
+        return "never"
+    return f"{'x' if factor else ''}{value:.3g}"
+
+
+def solve_requirements(harvesters: Sequence[RFEnergyHarvester],
+                       devices: Optional[Sequence[str]] = None,
+                       duty_cycle=1.0,
+                       kinds: Sequence[str] = tuple(KNOB_KINDS),
+                       each: bool = True,
+                       rtol: float = DEFAULT_RTOL) -> InverseResult:
+    """
+    Smallest knob values that power each device
+
+    devices    - names from DEVICE_POWER_REQUIREMENTS_MW (default: all)
+    duty_cycle - fraction of the time each device must run (one value,
+                 or one per device); 1 = continuously
+    kinds      - which KNOB_KINDS to solve for
+    each       - also solve per antenna / source, not just all together
+
+    Harvested power only grows with every knob as long as the rectifier
+    efficiency never falls faster than 1 / input power, which holds for
+    realistic curves; otherwise the value found is a crossing of the
+    requirement, not necessarily the smallest.
+    """
+    started = time.perf_counter()
+    devices = tuple(devices or DEVICE_POWER_REQUIREMENTS_MW)
+    duty = np.broadcast_to(np.asarray(duty_cycle, dtype=float),
+                           (len(devices),)).copy()
+    knobs = [knob for s, harvester in enumerate(harvesters)
+             for knob in scenario_knobs(harvester, s, kinds, each)]
+    required_mw = np.array([DEVICE_POWER_REQUIREMENTS_MW[device]
+                            for device in devices]) * duty
+    target_mw = np.tile(required_mw, len(knobs))
+
+    problem = _Problem(pack_harvesters(harvesters), knobs, len(devices))
+
+    def enough(scale):
+        # Same test as estimate_charging_capability ('Yes - Continuous')
+        return problem.harvested_uw(scale) / 1000.0 >= target_mw
+
+    # Bracket: [low, high] with high always enough, low never
+    high = problem.max_scale.copy()
+    reachable = enough(high)
+    not_needed = enough(np.zeros(problem.rows))
+    tiny = enough(np.full(problem.rows, MIN_SCALE))
+    evaluations = 3
+    low = np.full(problem.rows, MIN_SCALE)
+    active = reachable & ~tiny
+    # Bisect in log space: the answers can be anywhere in 30 decades
+    while np.any(active & (high > low * (1.0 + rtol))):
+        middle = np.sqrt(low * high)
+        ok = enough(middle)
+        evaluations += 1
+        high = np.where(active & ok, middle, high)
+        low = np.where(active & ~ok, middle, low)
+
+    scale = np.where(not_needed, 0.0,
+                     np.where(~reachable, np.inf,
+                              np.where(tiny, MIN_SCALE, high)))
+    return InverseResult(
+        scenarios=[harvester.name for harvester in harvesters],
+        knobs=knobs, devices=devices, duty_cycle=duty,
+        scale=scale.reshape(len(knobs), len(devices)),
+        elapsed_s=time.perf_counter() - started, evaluations=evaluations)
+
+
+def main():
+    """Requirements for the built-in scenarios"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge inverse solver: what it would take to '
+                    'power each device')
+    parser.add_argument('--duty-cycle', type=float, default=1.0,
+                        help='fraction of the time devices must run')
+    parser.add_argument('--devices', nargs='+',
+                        default=['Low-power MCU (sleep)',
+                                 'Temperature sensor',
+                                 'Low-power MCU (active)',
+                                 'Bluetooth LE transmit'])
+    args = parser.parse_args()
+
+    harvesters = [create_urban_apartment_scenario(),
+                  create_near_cell_tower_scenario(),
+                  create_rural_scenario()]
+    result = solve_requirements(harvesters, duty_cycle=args.duty_cycle)
+    print(result.format(args.devices))
+
+
+if __name__ == "__main__":
+    main()
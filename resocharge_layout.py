@@ -0,0 +1,500 @@
+# ResoCharge: Antenna Layout Optimizer
+# Pick the antennas that harvest the most power from a limited area
+#
+# What this does:
+# - Takes a harvester (its RF sources, rectifier and efficiencies),
+#   a total effective-area budget and a catalogue of candidate antennas
+# - Chooses which candidates to build so that total_harvested_uw is as
+#   large as possible, rectifier efficiency curve included
+#
+# Why this is fast: in RFEnergyHarvester every source x antenna pair is
+# converted on its own (the rectifier efficiency depends on the power of
+# that pair only), or in 'antenna' rectification mode every antenna has
+# a rectifier of its own.  Either way an antenna's contribution to
+# total_harvested_uw doesn't depend on which other antennas are present.
+# ('chain' mode shares rectifiers between antennas, so contributions
+# don't simply add up; it is not supported here.)  We work out each
+# candidate's contribution once (one column of pairs, evaluated for the
+# whole catalogue at once by the batch engine) and after that adding or
+# removing an antenna is just adding or subtracting one number.
+#
+# The choice itself is a knapsack problem: areas are the weights and
+# contributions the values.  By default at most one antenna is built
+# among candidates whose tolerance bands catch a common source (two such
+# antennas would double count the same signal), which is solved by
+# dynamic programming over the area budget cut into equal steps.  The
+# step is the largest one that all candidate areas and the budget are
+# whole multiples of (0.001 m² for DEFAULT_AREAS_M2), which makes the
+# answer exact.  Catalogues without such a step (or with more than
+# MAX_DP_STEPS of them in the budget) use budget / FALLBACK_DP_STEPS
+# with areas rounded up, and the greedy layout is kept if it does
+# better.
+
+import argparse
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from resocharge_engine import _antenna_received, _evaluate_pairs, \
+    pack_harvesters
+from resocharge_simulator import AntennaConfig, AntennaTable, \
+    RFEnergyHarvester, create_urban_apartment_scenario
+
+
+# Effective areas (m²) tried for every frequency by default_catalogue
+DEFAULT_AREAS_M2 = (0.001, 0.002, 0.003, 0.005, 0.008, 0.010, 0.015,
+                    0.020, 0.030)
+
+# Candidates evaluated per engine call (keeps the S x block pair
+# matrices small however big the catalogue is)
+CONTRIBUTION_BLOCK = 1 << 16
+
+# Most area steps of an exact dynamic programme, and the number of
+# (rounded) steps used when there is no exact step
+MAX_DP_STEPS = 10_000
+FALLBACK_DP_STEPS = 1000
+
+
+def antenna_catalogue(frequencies_mhz: Sequence[float],
+                      areas_m2: Sequence[float] = DEFAULT_AREAS_M2,
+                      efficiency: float = 0.80,
+                      tolerance: float = 0.15) -> List[AntennaConfig]:
+    """
+    Build a catalogue with every frequency x area combination
+
+    Example: 8 frequencies x 9 areas = 72 candidate antennas.
+    """
+    return [AntennaConfig(float(frequency), float(area), efficiency,
+                          tolerance)
+            for frequency in frequencies_mhz for area in areas_m2]
+
+
+def default_catalogue(harvester: RFEnergyHarvester,
+                      efficiency: float = 0.80) -> List[AntennaConfig]:
+    """Candidates tuned to each source frequency, in DEFAULT_AREAS_M2"""
+    frequencies = sorted({source.frequency_mhz
+                          for source in harvester.rf_sources})
+    return antenna_catalogue(frequencies, DEFAULT_AREAS_M2, efficiency)
+
+
+def _rectification_mode(harvester: RFEnergyHarvester) -> str:
+    """The harvester's rectification mode, if contributions add up"""
+    mode = harvester.rectification_mode
+    if mode not in ('pair', 'antenna'):
+        raise ValueError(f"Layout optimization needs rectification_mode "
+                         f"'pair' or 'antenna', not {mode!r} (antennas "
+                         f"sharing a rectifier don't add up independently)")
+    return mode
+
+
+def candidate_contributions(harvester: RFEnergyHarvester,
+                            candidates: Sequence[AntennaConfig],
+                            block: int = CONTRIBUTION_BLOCK
+                            ) -> np.ndarray:
+    """
+    Harvested power (μW) each candidate would add to the harvester
+
+    Every source x candidate pair is evaluated with the batch engine,
+    using the harvester's sources, rectifier and efficiencies (its own
+    antennas are ignored).  candidates may be a list or an AntennaTable
+    (no copy needed for a table).  The pair values are exactly those of
+    calculate_total_harvested_power; each candidate's pairs are summed
+    in source order.
+    """
+    mode = _rectification_mode(harvester)
+    count = len(candidates)
+    if not isinstance(candidates, AntennaTable):
+        candidates = AntennaTable(candidates)
+    frequency = candidates.column('frequency_mhz')
+    area = candidates.column('effective_area_m2')
+    efficiency = candidates.column('efficiency')
+    tolerance = candidates.column('tolerance')
+
+    # Sources, rectifier curve and efficiencies of the harvester as a
+    # one-row batch; the antenna columns are swapped in block by block
+    base = pack_harvesters([harvester])
+    contributions = np.zeros(count)
+    for start in range(0, count, block):
+        stop = min(start + block, count)
+        batch = replace(
+            base,
+            antenna_frequency_mhz=frequency[None, start:stop],
+            antenna_effective_area_m2=area[None, start:stop],
+            antenna_efficiency=efficiency[None, start:stop],
+            antenna_tolerance=tolerance[None, start:stop],
+            rectifier_group=None)
+        group_received = None
+        if mode == 'antenna':
+            # Every candidate is its own group: its rectifier sees the
+            # candidate's received power summed over all sources
+            batch = replace(batch, rectifier_group=np.arange(
+                stop - start)[None, :])
+            group_received = _antenna_received(
+                batch, slice(None), batch.source_frequency_mhz.shape[1])
+        harvested = _evaluate_pairs(batch, slice(None), slice(None),
+                                    group_received)['harvested_uw'][0]
+        column = contributions[start:stop]
+        for source_row in harvested:
+            column += source_row
+    return contributions
+
+
+def antenna_contribution(harvester: RFEnergyHarvester,
+                         antenna: AntennaConfig) -> float:
+    """
+    Harvested power (μW) one antenna would add - only its own pairs
+
+    Same efficiency chain as calculate_total_harvested_power, for a
+    single antenna.  Handy for trying out antennas one at a time.
+    """
+    mode = _rectification_mode(harvester)
+    received = [harvester.calculate_received_power(source, antenna)
+                for source in harvester.rf_sources]
+    if mode == 'antenna':
+        # One rectifier for the whole antenna
+        shared = harvester.get_rectifier_efficiency(
+            sum(power for power in received if power > 0))
+    total = 0.0
+    for power in received:
+        if power > 0:
+            rectifier_eff = shared if mode == 'antenna' else \
+                harvester.get_rectifier_efficiency(power)
+            total += power * (antenna.efficiency *
+                              harvester.matching_efficiency *
+                              rectifier_eff *
+                              harvester.filter_efficiency)
+    return total
+
+
+class LayoutState:
+    """
+    A partly built antenna layout with incremental (delta) evaluation
+
+    Think of this as a scratch pad for trying out layouts: each
+    candidate's contribution is worked out once, and then adding,
+    removing or swapping antennas just updates a running total instead
+    of re-running the whole harvester.
+
+    Example:
+        state = LayoutState(harvester, catalogue)
+        state.add(3)
+        state.delta_add(7)  # How much would antenna 7 add?
+    """
+
+    def __init__(self, harvester: RFEnergyHarvester,
+                 candidates: Sequence[AntennaConfig],
+                 contributions: Optional[np.ndarray] = None):
+        self.harvester = harvester
+        # Our own copy: add_candidate must not grow the caller's table
+        if isinstance(candidates, AntennaTable):
+            candidates = AntennaTable.from_arrays(**{
+                f.name: np.array(candidates.column(f.name))
+                for f in fields(AntennaConfig)})
+        else:
+            candidates = AntennaTable(candidates)
+        self.candidates = candidates
+        if contributions is None:
+            contributions = candidate_contributions(harvester,
+                                                    self.candidates)
+        self.contributions = np.asarray(contributions, dtype=float)
+        self.selected: List[int] = []
+        self.total_harvested_uw = 0.0
+        self.area_m2 = 0.0
+
+    def add_candidate(self, antenna: AntennaConfig) -> int:
+        """Add a new antenna to the catalogue (only its pairs are
+        evaluated) and return its index"""
+        self.candidates.append(antenna)
+        self.contributions = np.append(
+            self.contributions, antenna_contribution(self.harvester,
+                                                     antenna))
+        return len(self.candidates) - 1
+
+    def delta_add(self, index: int) -> float:
+        """Change in harvested power if candidate index were added"""
+        return float(self.contributions[index])
+
+    def delta_remove(self, index: int) -> float:
+        """Change in harvested power if candidate index were removed"""
+        return -float(self.contributions[index])
+
+    def add(self, index: int):
+        """Build candidate index"""
+        self.selected.append(index)
+        self.total_harvested_uw += self.contributions[index]
+        self.area_m2 += self.candidates[index].effective_area_m2
+
+    def remove(self, index: int):
+        """Take candidate index out of the layout again"""
+        self.selected.remove(index)
+        self.total_harvested_uw -= self.contributions[index]
+        self.area_m2 -= self.candidates[index].effective_area_m2
+
+    def antennas(self) -> List[AntennaConfig]:
+        """The selected antennas, lowest frequency first"""
+        chosen = [self.candidates.row(i) for i in self.selected]
+        return sorted(chosen, key=lambda a: (a.frequency_mhz,
+                                             a.effective_area_m2))
+
+
+@dataclass
+class LayoutResult:
+    """The best layout found, and how it was found"""
+    antennas: List[AntennaConfig]
+    harvester: RFEnergyHarvester  # Harvester built with these antennas
+    total_harvested_uw: float  # Recomputed with the harvester itself
+    area_used_m2: float
+    area_budget_m2: float
+    method: str
+    candidates: int
+    elapsed_s: float
+
+    def format(self) -> str:
+        """Short text summary"""
+        lines = [f"Layout ({self.method}, {self.candidates} candidates, "
+                 f"{self.elapsed_s * 1000:.1f} ms):",
+                 f"  Area used: {self.area_used_m2 * 1e4:.1f} of "
+                 f"{self.area_budget_m2 * 1e4:.1f} cm²",
+                 f"  Harvested: {self.total_harvested_uw:.3f} μW"]
+        for antenna in self.antennas:
+            lines.append(f"    {antenna.frequency_mhz:7.0f} MHz  "
+                         f"{antenna.effective_area_m2 * 1e4:6.1f} cm²  "
+                         f"eff {antenna.efficiency:.2f}")
+        return "\n".join(lines)
+
+
+def _groups(candidates: AntennaTable, source_frequency_mhz: np.ndarray,
+            one_per_frequency: bool) -> List[np.ndarray]:
+    """
+    Candidate indices that compete for the same slot
+
+    Two candidates compete when some source falls inside both of their
+    tolerance bands - building both would count that source twice.  A
+    group is a connected set of such candidates (e.g. 2450 and 2600 MHz
+    antennas that both catch WiFi 2.4GHz), so at most one antenna per
+    group is built.  This is on the safe side: in a chain A-B-C where
+    only neighbours share a source, A and C together are never tried.
+    """
+    count = len(candidates)
+    if not one_per_frequency:
+        return [np.array([i]) for i in range(count)]
+    frequency = candidates.column('frequency_mhz')
+    tolerance = candidates.column('tolerance')
+
+    # Label propagation: the candidates catching one source all take
+    # the smallest label among them (same test as _frequency_match)
+    label = np.arange(count)
+    for source_frequency in np.unique(source_frequency_mhz):
+        caught = np.abs(source_frequency - frequency) / frequency < \
+            tolerance
+        if np.count_nonzero(caught) < 2:
+            continue
+        joined = np.unique(label[caught])
+        label[np.isin(label, joined)] = joined[0]
+
+    _, inverse = np.unique(label, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    cuts = np.nonzero(np.diff(inverse[order]))[0] + 1
+    return np.split(order, cuts)
+
+
+def _area_step(areas: np.ndarray, area_budget_m2: float,
+               max_digits: int = 12) -> Optional[float]:
+    """
+    Largest step that the budget and every area fitting in it are
+    whole multiples of (at most MAX_DP_STEPS steps in the budget), or
+    None if there is no such step
+    """
+    values = np.append(areas[areas <= area_budget_m2], area_budget_m2)
+    for digits in range(max_digits + 1):
+        scaled = values * 10.0 ** digits
+        whole = np.round(scaled)
+        if np.all(np.abs(scaled - whole) <= 1e-9 * np.maximum(whole, 1)):
+            break
+    else:
+        return None
+    units = whole.astype(np.int64)
+    divisor = int(np.gcd.reduce(units))
+    if divisor == 0 or units[-1] // divisor > MAX_DP_STEPS:
+        return None
+    return divisor / 10.0 ** digits
+
+
+def _solve_dp(state: LayoutState, groups: List[np.ndarray],
+              area_budget_m2: float, area_step_m2: float):
+    """
+    Multiple-choice knapsack over the discretized area budget
+
+    best[c] = most power that fits in c area steps using the groups
+    seen so far.  Areas are rounded up to whole steps, so the layout
+    never goes over the real budget; the answer is exact when every
+    area is a whole number of steps (see _area_step).
+    """
+    capacity = int(area_budget_m2 / area_step_m2 + 1e-9)
+    area = state.candidates.column('effective_area_m2')
+    weight = np.ceil(area / area_step_m2 - 1e-9).astype(np.int64)
+    value = state.contributions
+
+    best = np.zeros(capacity + 1)
+    picks = []
+    for group in groups:
+        # Only candidates that fit and actually harvest something
+        group = group[(weight[group] <= capacity) & (value[group] > 0)]
+        pick = np.zeros(capacity + 1, dtype=np.min_scalar_type(len(group)))
+        new_best = best.copy()
+        for slot, index in enumerate(group, start=1):
+            w = weight[index]
+            candidate = best[:capacity + 1 - w] + value[index]
+            better = candidate > new_best[w:]
+            new_best[w:][better] = candidate[better]
+            pick[w:][better] = slot
+        picks.append((group, pick))
+        best = new_best
+
+    # Walk back through the groups to recover the choices
+    c = capacity
+    for group, pick in reversed(picks):
+        slot = int(pick[c])
+        if slot:
+            index = int(group[slot - 1])
+            state.add(index)
+            c -= weight[index]
+
+
+def _solve_greedy(state: LayoutState, groups: List[np.ndarray],
+                  area_budget_m2: float, max_passes: int = 5):
+    """
+    Best power per area first, then improve one group at a time
+
+    Each improvement step asks "what is the best option for this
+    frequency given the area the others leave free?" using delta
+    evaluation only.  Fast, not guaranteed optimal.
+    """
+    area = state.candidates.column('effective_area_m2')
+    value = state.contributions
+    group_of = np.empty(len(state.candidates), dtype=np.int64)
+    for g, group in enumerate(groups):
+        group_of[group] = g
+    chosen: Dict[int, int] = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density = np.where(area > 0, value / area, np.inf)
+    for index in np.argsort(-density, kind='stable'):
+        g = int(group_of[index])
+        if value[index] <= 0 or g in chosen:
+            continue
+        if state.area_m2 + area[index] <= area_budget_m2:
+            state.add(int(index))
+            chosen[g] = int(index)
+
+    for _ in range(max_passes):
+        improved = False
+        for g, group in enumerate(groups):
+            current = chosen.get(g)
+            free = area_budget_m2 - state.area_m2
+            gain_now = 0.0
+            if current is not None:
+                free += area[current]
+                gain_now = state.delta_add(current)
+            fits = group[area[group] <= free]
+            if len(fits) == 0:
+                continue
+            best = int(fits[np.argmax(value[fits])])
+            if value[best] > gain_now:
+                if current is not None:
+                    state.remove(current)
+                state.add(best)
+                chosen[g] = best
+                improved = True
+        if not improved:
+            break
+
+
+def optimize_layout(harvester: RFEnergyHarvester, area_budget_m2: float,
+                    catalogue: Optional[Sequence[AntennaConfig]] = None,
+                    method: str = 'dp', one_per_frequency: bool = True,
+                    area_step_m2: Optional[float] = None) -> LayoutResult:
+    """
+    Choose antennas from a catalogue to maximize total_harvested_uw
+
+    harvester supplies the RF sources, rectifier and efficiencies (its
+    own antennas are not used) and its rectification mode, 'pair' or
+    'antenna'.  area_budget_m2 limits the summed effective area of the
+    chosen antennas.
+
+    method:
+      'dp'     - dynamic programming over area steps of area_step_m2;
+                 by default the step all candidate areas and the
+                 budget are multiples of, so the answer is exact (if
+                 there is none, the better of budget /
+                 FALLBACK_DP_STEPS and greedy)
+      'greedy' - best power per area first plus local improvement;
+                 for very large catalogues
+    """
+    started = time.perf_counter()
+    if catalogue is None:
+        catalogue = default_catalogue(harvester)
+    state = LayoutState(harvester, catalogue)
+    groups = _groups(state.candidates,
+                     harvester.rf_sources.column('frequency_mhz'),
+                     one_per_frequency)
+
+    if method == 'dp':
+        step = area_step_m2 or _area_step(
+            state.candidates.column('effective_area_m2'), area_budget_m2)
+        _solve_dp(state, groups, area_budget_m2,
+                  step or area_budget_m2 / FALLBACK_DP_STEPS)
+        if step is None:
+            # Rounded areas may waste budget: keep greedy if it wins
+            greedy = LayoutState(harvester, state.candidates,
+                                 state.contributions)
+            _solve_greedy(greedy, groups, area_budget_m2)
+            if greedy.total_harvested_uw > state.total_harvested_uw:
+                state, method = greedy, 'greedy'
+    elif method == 'greedy':
+        _solve_greedy(state, groups, area_budget_m2)
+    else:
+        raise ValueError(f"Unknown method: {method!r}")
+
+    # Build the real harvester and let it compute the final numbers
+    antennas = state.antennas()
+    built = harvester.clone(rf_sources=harvester.rf_sources.to_list(),
+                            antennas=antennas)
+    total = built.calculate_total_harvested_power()['total_harvested_uw']
+
+    return LayoutResult(
+        antennas=antennas,
+        harvester=built,
+        total_harvested_uw=total,
+        area_used_m2=sum(a.effective_area_m2 for a in antennas),
+        area_budget_m2=area_budget_m2,
+        method=method,
+        candidates=len(state.candidates),
+        elapsed_s=time.perf_counter() - started)
+
+
+def main():
+    """Command-line demo: re-plan the urban apartment's antenna array"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge antenna layout optimizer')
+    parser.add_argument('--method', choices=('dp', 'greedy'), default='dp')
+    parser.add_argument('--budget-cm2', type=float, default=None,
+                        help='area budget (default: the hand-picked '
+                             'array\'s total area)')
+    args = parser.parse_args()
+
+    harvester = create_urban_apartment_scenario()
+    hand_picked = harvester.calculate_total_harvested_power()
+    budget = (args.budget_cm2 / 1e4 if args.budget_cm2 else
+              sum(a.effective_area_m2 for a in harvester.antennas))
+    print(f"Hand-picked array: "
+          f"{hand_picked['total_harvested_uw']:.3f} μW")
+
+    result = optimize_layout(harvester, budget, method=args.method)
+    print(result.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# ResoCharge: Monte Carlo Uncertainty Engine
+# How much power do we *really* get when the inputs are uncertain?
+#
+# What this does:
+# - Lets any source, antenna or rectifier number be a distribution
+#   instead of a single hard-coded estimate
+# - Draws samples in large vectorized batches (millions in total)
+# - Tracks percentiles of harvested power and iPhone days-to-charge with
+#   streaming quantile sketches, so memory does not grow with samples
+# - Stops early once the confidence intervals are tight enough
+#
+# The docs say real power densities vary widely by location - this
+# turns "30 μW/m²" into "somewhere between 5 and 150 μW/m²" and shows
+# what that does to the answer.
+
+import argparse
+import math
+import time
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from resocharge_engine import HarvesterBatch, evaluate_totals, \
+    pack_harvesters
+from resocharge_simulator import IPHONE_BATTERY_WH, RFEnergyHarvester, \
+    create_urban_apartment_scenario
+
+
+# Distributions ------------------------------------------------------------
+
+@dataclass
+class Uniform:
+    """Any value between low and high is equally likely"""
+    low: float
+    high: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.uniform(self.low, self.high, size)
+
+
+@dataclass
+class Normal:
+    """Bell curve around mean (std = spread)"""
+    mean: float
+    std: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.normal(self.mean, self.std, size)
+
+
+@dataclass
+class LogNormal:
+    """
+    Bell curve in log space - good for power densities
+
+    median is the typical value; sigma is the spread of ln(value).
+    Example: LogNormal(30, 0.7) is mostly within 15-60 μW/m².
+    """
+    median: float
+    sigma: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.lognormal(math.log(self.median), self.sigma, size)
+
+
+@dataclass
+class Triangular:
+    """Between low and high, most likely near mode"""
+    low: float
+    mode: float
+    high: float
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return rng.triangular(self.low, self.mode, self.high, size)
+
+
+Distribution = Union[Uniform, Normal, LogNormal, Triangular]
+
+
+# Streaming quantiles ------------------------------------------------------
+
+class QuantileSketch:
+    """
+    Streaming quantile estimator with bounded memory
+
+    Values are counted in buckets whose edges grow by a constant factor
+    (gamma), so any quantile is known to within relative_accuracy no
+    matter how many values were added.  Memory depends only on the
+    range of values (a few thousand buckets for 10^-6 ... 10^9), never
+    on the sample count.  Zero and +inf are counted separately.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.005):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0  # Bucket number of counts[0]
+        self.zero_count = 0
+        self.inf_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray):
+        """Add a batch of non-negative values"""
+        values = np.asarray(values, dtype=float).ravel()
+        self.count += len(values)
+        positive = values > 0
+        finite = np.isfinite(values)
+        self.inf_count += int(np.count_nonzero(~finite))
+        self.zero_count += int(np.count_nonzero(finite & ~positive))
+        values = values[positive & finite]
+        if len(values) == 0:
+            return
+
+        buckets = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        low, high = int(buckets.min()), int(buckets.max())
+        self._grow(low, high)
+        self.counts += np.bincount(buckets - self.offset,
+                                   minlength=len(self.counts))
+
+    def _grow(self, low: int, high: int):
+        """Make room for bucket numbers low..high"""
+        if len(self.counts) == 0:
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_low = min(low, self.offset)
+        new_high = max(high, self.offset + len(self.counts) - 1)
+        if new_low == self.offset and \
+                new_high == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(new_high - new_low + 1, dtype=np.int64)
+        start = self.offset - new_low
+        counts[start:start + len(self.counts)] = self.counts
+        self.counts, self.offset = counts, new_low
+
+    def merge(self, other: 'QuantileSketch'):
+        """Add all values counted by another sketch (same accuracy)"""
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+        self.zero_count += other.zero_count
+        self.inf_count += other.inf_count
+        self.count += other.count
+
+    def value_at_rank(self, rank: float) -> float:
+        """Approximate value of the rank-th smallest value (0-based)"""
+        if self.count == 0:
+            return float('nan')
+        rank = min(max(rank, 0.0), self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count + np.cumsum(self.counts)
+        bucket = int(np.searchsorted(cumulative, rank, side='right'))
+        if bucket >= len(self.counts):
+            return float('inf')
+        # Middle of the bucket, in the sense of relative error
+        return 2.0 * self.gamma ** (bucket + self.offset) / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (q between 0 and 1)"""
+        return self.value_at_rank(q * (self.count - 1))
+
+
+# The model ----------------------------------------------------------------
+
+# Fields that can be varied, and the range they are clipped to
+SOURCE_FIELDS = {
+    'power_density_uw_per_m2': ('source_power_density_uw_per_m2',
+                                0.0, math.inf),
+    'availability': ('source_availability', 0.0, 1.0),
+}
+ANTENNA_FIELDS = {
+    'effective_area_m2': ('antenna_effective_area_m2', 0.0, math.inf),
+    'efficiency': ('antenna_efficiency', 0.0, 1.0),
+}
+HARVESTER_FIELDS = {
+    'matching_efficiency': ('matching_efficiency', 0.0, 1.0),
+    'filter_efficiency': ('filter_efficiency', 0.0, 1.0),
+    'resonance_boost': ('resonance_boost', 0.0, math.inf),
+}
+
+
+class MonteCarloModel:
+    """
+    A harvester whose numbers can be uncertain
+
+    Start from any RFEnergyHarvester, then say which numbers vary:
+
+        model = MonteCarloModel(create_urban_apartment_scenario())
+        model.vary_source('WiFi 2.4GHz', 'power_density_uw_per_m2',
+                          LogNormal(30, 0.8))
+        model.vary_antenna(3, 'efficiency', Uniform(0.7, 0.9))
+        model.vary_rectifier(10.0, Normal(0.40, 0.05))
+
+    Everything not varied keeps its value from the harvester.  Samples
+    are clipped to sensible ranges (availability and efficiencies to
+    0-1, densities and areas to >= 0).
+    """
+
+    def __init__(self, harvester: RFEnergyHarvester):
+        self.harvester = harvester
+        self.base = pack_harvesters([harvester])
+        # (batch attribute, column or None, low, high, distribution)
+        self.variations: List[Tuple[str, Optional[Tuple], float, float,
+                                    Distribution]] = []
+
+    def _source_columns(self, source: Union[int, str, None]) -> List[int]:
+        if source is None:
+            return list(range(len(self.harvester.rf_sources)))
+        if isinstance(source, int):
+            return [source]
+        columns = [i for i, s in enumerate(self.harvester.rf_sources)
+                   if s.name == source]
+        if not columns:
+            raise KeyError(f"No RF source named {source!r}")
+        return columns
+
+    def vary_source(self, source: Union[int, str, None], field_name: str,
+                    distribution: Distribution):
+        """
+        Make a source field uncertain
+
+        source is an index, a source name (all sources with that name)
+        or None for every source (each drawn independently).
+        """
+        attribute, low, high = SOURCE_FIELDS[field_name]
+        for column in self._source_columns(source):
+            self.variations.append(
+                (attribute, (column,), low, high, distribution))
+
+    def vary_antenna(self, antenna: Optional[int], field_name: str,
+                     distribution: Distribution):
+        """Make an antenna field uncertain (None = every antenna)"""
+        attribute, low, high = ANTENNA_FIELDS[field_name]
+        columns = (range(len(self.harvester.antennas))
+                   if antenna is None else [antenna])
+        for column in columns:
+            self.variations.append(
+                (attribute, (column,), low, high, distribution))
+
+    def vary_rectifier(self, power_uw: float, distribution: Distribution):
+        """Make the rectifier efficiency at one curve point uncertain"""
+        if not self.harvester.rectifier:
+            raise ValueError("Harvester has no rectifier to vary")
+        levels = self.harvester.rectifier.curve.power_levels
+        if power_uw not in levels:
+            raise KeyError(f"{power_uw} μW is not a rectifier curve point")
+        self.variations.append(('curve_efficiency',
+                                (levels.index(power_uw),),
+                                0.0, 1.0, distribution))
+
+    def vary(self, field_name: str, distribution: Distribution):
+        """Make matching_efficiency, filter_efficiency or
+        resonance_boost uncertain"""
+        attribute, low, high = HARVESTER_FIELDS[field_name]
+        self.variations.append((attribute, None, low, high, distribution))
+
+    def sample_batch(self, rng: np.random.Generator,
+                     size: int) -> HarvesterBatch:
+        """Draw `size` random harvesters as one HarvesterBatch"""
+        arrays = {}
+        for name, value in vars(self.base).items():
+            if isinstance(value, np.ndarray):
+                arrays[name] = np.broadcast_to(
+                    value, (size,) + value.shape[1:])
+            else:
+                arrays[name] = value
+
+        copied = set()
+        for attribute, column, low, high, distribution in self.variations:
+            if attribute not in copied:
+                # Only varied arrays get their own writable copy
+                arrays[attribute] = np.array(arrays[attribute])
+                copied.add(attribute)
+            values = np.clip(distribution.sample(rng, size), low, high)
+            if column is None:
+                arrays[attribute][:] = values
+            else:
+                arrays[attribute][(slice(None),) + column] = values
+        return HarvesterBatch(**arrays)
+
+
+@dataclass
+class MonteCarloResult:
+    """Percentiles (with confidence intervals) from a Monte Carlo run"""
+    samples: int
+    converged: bool
+    elapsed_s: float
+    mean_power_uw: float
+    # percentile -> value, and percentile -> (low, high) interval
+    power_uw: Dict[float, float] = field(default_factory=dict)
+    power_uw_ci: Dict[float, Tuple[float, float]] = field(
+        default_factory=dict)
+    days_to_charge: Dict[float, float] = field(default_factory=dict)
+    days_to_charge_ci: Dict[float, Tuple[float, float]] = field(
+        default_factory=dict)
+    power_sketch: Optional[QuantileSketch] = None
+    days_sketch: Optional[QuantileSketch] = None
+
+    def format(self) -> str:
+        """Human-readable summary table"""
+        lines = [f"Monte Carlo: {self.samples:,} samples in "
+                 f"{self.elapsed_s:.2f} s "
+                 f"({'converged' if self.converged else 'NOT converged'})",
+                 f"Mean harvested power: {self.mean_power_uw:.2f} μW",
+                 f"{'Percentile':>10} {'Power (μW)':>14} "
+                 f"{'iPhone charge (days)':>22}"]
+        for p in self.power_uw:
+            lines.append(f"{p:>9g}% {self.power_uw[p]:>14.3f} "
+                         f"{self.days_to_charge[p]:>22.0f}")
+        return "\n".join(lines)
+
+
+def iphone_days_to_charge(power_uw: np.ndarray) -> np.ndarray:
+    """iPhone days-to-charge for an array of harvested powers (inf at 0)"""
+    # Same formula as calculate_energy_per_day/estimate_charging_capability
+    energy_wh = power_uw / 1000.0 * 24 / 1000.0
+    with np.errstate(divide='ignore'):
+        return np.where(energy_wh > 0, IPHONE_BATTERY_WH / energy_wh,
+                        np.inf)
+
+
+def _interval(sketch: QuantileSketch, q: float,
+              z: float) -> Tuple[float, float]:
+    """Distribution-free confidence interval for the q-quantile
+
+    The rank of the true quantile among n samples is Binomial(n, q),
+    so the interval spans ranks ± z*sqrt(n*q*(1-q)) around the estimate.
+    """
+    n = sketch.count
+    rank = q * (n - 1)
+    spread = z * math.sqrt(n * q * (1 - q))
+    return (sketch.value_at_rank(rank - spread),
+            sketch.value_at_rank(rank + spread))
+
+
+def run_monte_carlo(model: MonteCarloModel,
+                    percentiles: Sequence[float] = (5, 25, 50, 75, 95),
+                    seed: int = 0,
+                    batch_size: int = 100_000,
+                    max_samples: int = 10_000_000,
+                    min_samples: int = 100_000,
+                    relative_tolerance: float = 0.01,
+                    confidence: float = 0.95,
+                    relative_accuracy: float = 0.002) -> MonteCarloResult:
+    """
+    Run the Monte Carlo simulation
+
+    Draws batch_size samples at a time until every requested percentile
+    of harvested power has a confidence interval no wider than
+    ±relative_tolerance (after at least min_samples), or until
+    max_samples.  The same seed always gives the same result.
+    """
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    power_sketch = QuantileSketch(relative_accuracy)
+    days_sketch = QuantileSketch(relative_accuracy)
+    quantiles = [p / 100.0 for p in percentiles]
+    total_power = 0.0
+    converged = False
+    started = time.perf_counter()
+
+    while power_sketch.count < max_samples:
+        size = min(batch_size, max_samples - power_sketch.count)
+        power = evaluate_totals(model.sample_batch(rng, size))[
+            'total_harvested_uw']
+        power_sketch.add(power)
+        days_sketch.add(iphone_days_to_charge(power))
+        total_power += float(power.sum())
+
+        if power_sketch.count >= min_samples:
+            converged = True
+            for q in quantiles:
+                low, high = _interval(power_sketch, q, z)
+                estimate = power_sketch.quantile(q)
+                if estimate > 0 and \
+                        (high - low) / 2 > relative_tolerance * estimate:
+                    converged = False
+                    break
+            if converged:
+                break
+
+    result = MonteCarloResult(
+        samples=power_sketch.count, converged=converged,
+        elapsed_s=time.perf_counter() - started,
+        mean_power_uw=total_power / max(power_sketch.count, 1),
+        power_sketch=power_sketch, days_sketch=days_sketch)
+    for p, q in zip(percentiles, quantiles):
+        result.power_uw[p] = power_sketch.quantile(q)
+        result.power_uw_ci[p] = _interval(power_sketch, q, z)
+        # More power = fewer days, so the p-th power percentile matches
+        # the (100-p)-th days percentile
+        result.days_to_charge[p] = days_sketch.quantile(1 - q)
+        result.days_to_charge_ci[p] = _interval(days_sketch, 1 - q, z)
+    return result
+
+
+def main():
+    """Command-line demo: urban apartment with uncertain densities"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge Monte Carlo uncertainty analysis')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-samples', type=int, default=10_000_000)
+    parser.add_argument('--tolerance', type=float, default=0.01)
+    args = parser.parse_args()
+
+    harvester = create_urban_apartment_scenario()
+    model = MonteCarloModel(harvester)
+    # Densities vary by roughly 2x either way; availability ±20%
+    for i, source in enumerate(harvester.rf_sources):
+        model.vary_source(i, 'power_density_uw_per_m2',
+                          LogNormal(source.power_density_uw_per_m2, 0.7))
+        model.vary_source(i, 'availability',
+                          Uniform(source.availability * 0.8,
+                                  source.availability * 1.2))
+    model.vary_antenna(None, 'efficiency', Triangular(0.6, 0.8, 0.9))
+
+    result = run_monte_carlo(model, seed=args.seed,
+                             max_samples=args.max_samples,
+                             relative_tolerance=args.tolerance)
+    print(result.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# ResoCharge: Profiling / Instrumentation
+# See where the time goes: matching, rectifier lookups, results, reports
+#
+# What this does:
+# - Wraps the simulator's main stages (harvest calculation, pair
+#   matching, result building, reports, scenarios, charts, batch engine)
+#   with timers while a Profiler is enabled
+# - Counts calls of the hot per-pair functions and how many pairs
+#   received no power, plus how many source x antenna pairs each pair
+#   recalculation looked at and how many of them were out of band
+# - Notes how many memory blocks each stage left allocated
+# - Exports a Chrome trace (open in chrome://tracing or ui.perfetto.dev)
+#   and a plain summary table
+#
+# Nothing is wrapped until enable() (or a with block) and everything is
+# put back afterwards, so a disabled profiler costs nothing at all.
+#
+# Example:
+#   with Profiler() as profiler:
+#       compare_scenarios(chart_path=None)
+#   print(profiler.summary())
+#   profiler.write_chrome_trace('trace.json')
+#
+# Only calls that go through the class or module attribute are seen:
+# a function imported with "from module import name" before enable()
+# keeps calling the unwrapped original.
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import resocharge_engine
+import resocharge_report
+import resocharge_simulator
+from resocharge_simulator import RFEnergyHarvester
+
+
+# Stages timed one call at a time (these also become trace events):
+# (owner, attribute, category)
+SPAN_TARGETS = [
+    (RFEnergyHarvester, 'calculate_total_harvested_power', 'harvest'),
+    (RFEnergyHarvester, '_refresh_pairs', 'harvest'),
+    (RFEnergyHarvester, '_assemble_results', 'harvest'),
+    (RFEnergyHarvester, 'write_report', 'report'),
+    (RFEnergyHarvester, 'generate_report', 'report'),
+    (resocharge_simulator, 'compare_scenarios', 'scenario'),
+    (resocharge_simulator, 'create_urban_apartment_scenario', 'scenario'),
+    (resocharge_simulator, 'create_near_cell_tower_scenario', 'scenario'),
+    (resocharge_simulator, 'create_rural_scenario', 'scenario'),
+    (resocharge_simulator, 'plot_comparison', 'plot'),
+    (resocharge_engine, 'pack_harvesters', 'engine'),
+    (resocharge_engine, 'evaluate_batch', 'engine'),
+    (resocharge_engine, 'evaluate_totals', 'engine'),
+    (resocharge_report, 'write_reports', 'report'),
+]
+
+# Per-pair functions, called far too often for one event per call:
+# only their calls and total time are kept, plus a counter of one kind
+# of outcome: (owner, attribute, counter name, outcome test)
+COUNT_TARGETS = [
+    (RFEnergyHarvester, 'calculate_received_power', 'zero_power',
+     lambda power: not power > 0),
+    (RFEnergyHarvester, '_frequency_match', None, None),
+    (RFEnergyHarvester, 'get_rectifier_efficiency', None, None),
+]
+
+
+def _pair_counts(harvester: RFEnergyHarvester) -> Dict[str, int]:
+    """
+    All source x antenna pairs of a harvester, and how many of them are
+    out of band (the _frequency_match test, one antenna at a time)
+
+    The FrequencyIndex drops most out-of-band pairs before
+    _frequency_match is ever called, so counting its answers would miss
+    them; this counts what was actually skipped.
+    """
+    sources = harvester.rf_sources.column('frequency_mhz')
+    antennas = harvester.antennas
+    rejected = 0
+    for frequency, tolerance in zip(antennas.column('frequency_mhz'),
+                                    antennas.column('tolerance')):
+        matched = np.abs(sources - frequency) / frequency < tolerance
+        rejected += len(sources) - int(np.count_nonzero(matched))
+    return {'pairs': len(sources) * len(antennas), 'rejected': rejected}
+
+
+# Stages whose work is counted after they return: (owner, attribute,
+# counts of what the call worked on).  _refresh_pairs only counts when
+# it really recalculated (the harvester's version went up).
+TALLY_TARGETS = [
+    (RFEnergyHarvester, '_refresh_pairs', _pair_counts),
+]
+
+
+@dataclass
+class StageStats:
+    """Totals for one instrumented function"""
+    name: str
+    category: str
+    calls: int = 0
+    total_ns: int = 0  # Including time spent in instrumented callees
+    self_ns: int = 0  # Excluding it
+    net_blocks: int = 0  # Memory blocks still allocated afterwards
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_ns / self.calls / 1000.0 if self.calls else 0.0
+
+
+class Profiler:
+    """
+    Opt-in timers and counters for the simulator
+
+    Think of this as clipping a stopwatch onto each stage of the
+    pipeline for the duration of a with block.  trace=False keeps only
+    the totals (no per-call events), and at most max_events trace
+    events are kept so long runs can't eat all the memory.
+    """
+
+    def __init__(self, trace: bool = True, max_events: int = 1_000_000):
+        self.trace = trace
+        self.max_events = max_events
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.events: List[Dict] = []
+        self.dropped_events = 0
+        self.enabled = False
+        self._patches = []
+        self._stack: List[int] = []  # Callee time of each open stage
+        self._origin_ns = time.perf_counter_ns()
+        self._wall_ns = 0
+        self._enabled_at = 0
+
+    # Switching on and off --------------------------------------------------
+
+    def enable(self):
+        """Wrap every target (does nothing if already enabled)"""
+        if self.enabled:
+            return
+        for owner, name, category in SPAN_TARGETS:
+            self._patch(owner, name, self._span_wrapper(
+                getattr(owner, name), self._label(owner, name), category))
+        for owner, name, outcome, test in COUNT_TARGETS:
+            self._patch(owner, name, self._count_wrapper(
+                getattr(owner, name), self._label(owner, name), outcome,
+                test))
+        for owner, name, tally in TALLY_TARGETS:
+            self._patch(owner, name, self._tally_wrapper(
+                getattr(owner, name), self._label(owner, name), tally))
+        self.enabled = True
+        self._enabled_at = time.perf_counter_ns()
+
+    def disable(self):
+        """Put all the original functions back"""
+        if not self.enabled:
+            return
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+        self.enabled = False
+        self._wall_ns += time.perf_counter_ns() - self._enabled_at
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _patch(self, owner, name, wrapper):
+        # Take the attribute from the class dict, not via getattr, so
+        # we put back exactly what was there
+        original = (owner.__dict__[name] if isinstance(owner, type)
+                    else getattr(owner, name))
+        self._patches.append((owner, name, original))
+        setattr(owner, name, wrapper)
+
+    @staticmethod
+    def _label(owner, name: str) -> str:
+        """Short stage name, e.g. harvester._refresh_pairs"""
+        if owner is RFEnergyHarvester:
+            return f"harvester.{name}"
+        return f"{owner.__name__.replace('resocharge_', '')}.{name}"
+
+    def _stage(self, label: str, category: str) -> StageStats:
+        stage = self.stages.get(label)
+        if stage is None:
+            stage = self.stages[label] = StageStats(label, category)
+        return stage
+
+    def count(self, name: str, amount: int = 1):
+        """Add to a named counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Wrappers ---------------------------------------------------------------
+
+    def _span_wrapper(self, original, label: str, category: str):
+        stage = self._stage(label, category)
+        profiler = self
+
+        @functools.wraps(original)
+        def span(*args, **kwargs):
+            blocks = sys.getallocatedblocks()
+            profiler._stack.append(0)
+            start = time.perf_counter_ns()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                duration = end - start
+                callee_ns = profiler._stack.pop()
+                if profiler._stack:
+                    profiler._stack[-1] += duration
+                stage.calls += 1
+                stage.total_ns += duration
+                stage.self_ns += duration - callee_ns
+                stage.net_blocks += sys.getallocatedblocks() - blocks
+                if profiler.trace:
+                    profiler._event(label, category, start, duration)
+        return span
+
+    def _count_wrapper(self, original, label: str,
+                       outcome: Optional[str], test):
+        stage = self._stage(label, 'per-pair')
+        profiler = self
+        counters = self.counters
+        if outcome:
+            outcome = f"{label}.{outcome}"
+            counters.setdefault(outcome, 0)
+
+        @functools.wraps(original)
+        def counted(*args, **kwargs):
+            profiler._stack.append(0)
+            start = time.perf_counter_ns()
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                duration = time.perf_counter_ns() - start
+                callee_ns = profiler._stack.pop()
+                if profiler._stack:
+                    profiler._stack[-1] += duration
+                stage.calls += 1
+                stage.total_ns += duration
+                stage.self_ns += duration - callee_ns
+            if outcome and test(result):
+                counters[outcome] += 1
+            return result
+        return counted
+
+    def _tally_wrapper(self, original, label: str, tally):
+        counters = self.counters
+
+        @functools.wraps(original)
+        def tallied(harvester, *args, **kwargs):
+            version = harvester.version
+            result = original(harvester, *args, **kwargs)
+            if harvester.version != version:
+                for name, amount in tally(harvester).items():
+                    key = f"{label}.{name}"
+                    counters[key] = counters.get(key, 0) + amount
+            return result
+        return tallied
+
+    def _event(self, name: str, category: str, start_ns: int,
+               duration_ns: int):
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+        self.events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': (start_ns - self._origin_ns) / 1000.0,
+            'dur': duration_ns / 1000.0,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+        })
+
+    # Output -----------------------------------------------------------------
+
+    def chrome_trace(self) -> Dict:
+        """The trace as a Chrome trace-event dict"""
+        end = (time.perf_counter_ns() - self._origin_ns) / 1000.0
+        counters = [{'name': name, 'ph': 'C', 'ts': end,
+                     'pid': os.getpid(), 'args': {'value': value}}
+                    for name, value in sorted(self.counters.items())]
+        return {
+            'traceEvents': self.events + counters,
+            'displayTimeUnit': 'ms',
+            'otherData': {'dropped_events': self.dropped_events},
+        }
+
+    def write_chrome_trace(self, path: str):
+        """Save the Chrome trace-event JSON file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> str:
+        """Plain table: busiest stages first, then the counters"""
+        wall_ns = self._wall_ns
+        if self.enabled:
+            wall_ns += time.perf_counter_ns() - self._enabled_at
+        lines = [f"{'stage':44s} {'calls':>9s} {'total ms':>10s} "
+                 f"{'self ms':>10s} {'mean µs':>10s} {'blocks':>9s}",
+                 '-' * 97]
+        stages = sorted((s for s in self.stages.values() if s.calls),
+                        key=lambda s: s.self_ns, reverse=True)
+        for stage in stages:
+            lines.append(f"{stage.name:44s} {stage.calls:9d} "
+                         f"{stage.total_ns / 1e6:10.2f} "
+                         f"{stage.self_ns / 1e6:10.2f} "
+                         f"{stage.mean_us:10.2f} {stage.net_blocks:9d}")
+        lines.append('-' * 97)
+        lines.append(f"{'wall time while enabled':44s} {'':9s} "
+                     f"{wall_ns / 1e6:10.2f}")
+        if self.counters:
+            lines.append("")
+            lines.append("counters")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"  {name:48s} {value:12d}")
+        if self.dropped_events:
+            lines.append(f"  (trace full: {self.dropped_events} events "
+                         f"not kept)")
+        return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    """Profile the scenario comparison (or scenario files) and print
+    the summary"""
+    parser = argparse.ArgumentParser(
+        description='Profile the ResoCharge simulator')
+    parser.add_argument('scenarios', nargs='*',
+                        help='scenario files/directories/names '
+                             '(default: compare the built-in scenarios)')
+    parser.add_argument('--trace', metavar='JSON',
+                        help='also write a Chrome trace-event file')
+    parser.add_argument('--chart', action='store_true',
+                        help='include chart rendering')
+    args = parser.parse_args(argv)
+
+    with Profiler() as profiler:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if args.scenarios:
+                from resocharge_scenarios import load_scenarios
+                harvesters = [h for path in args.scenarios
+                              for h in load_scenarios(path)]
+                resocharge_report.write_reports(harvesters, io.StringIO())
+            else:
+                resocharge_simulator.compare_scenarios(
+                    chart_path='scenario_comparison.png' if args.chart
+                    else None)
+
+    print(profiler.summary())
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
+        print(f"\nChrome trace saved as '{args.trace}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# ResoCharge: Report Writers
+# Stream reports for many scenarios to a file, as text, CSV or JSON
+#
+# What this does:
+# - Writes one report per harvester straight to any file-like object
+#   (open file, sys.stdout, io.StringIO, a socket wrapper, ...)
+# - Accepts results you already computed (for example with the batch
+#   engine), so nothing is calculated twice
+# - Never holds more than one scenario's report in memory
+#
+# Formats:
+#   text  - the same report as RFEnergyHarvester.generate_report
+#   csv   - one row per scenario, or one row per source x antenna pair
+#   json  - one JSON array of scenario records
+#   jsonl - one JSON record per line
+#
+# Example:
+#   results = evaluate_harvesters(harvesters)  # resocharge_engine
+#   with open('reports.csv', 'w', newline='') as f:
+#       write_reports(harvesters, f, 'csv', results=results)
+
+import abc
+import csv
+import json
+import math
+from typing import Dict, Iterable, Optional, Sequence
+
+from resocharge_simulator import RFEnergyHarvester
+
+
+REPORT_FORMATS = ('text', 'csv', 'json', 'jsonl')
+
+# CSV columns, per scenario and per source x antenna pair
+SUMMARY_COLUMNS = ('scenario', 'rf_sources', 'antennas',
+                   'matching_efficiency', 'filter_efficiency',
+                   'enable_resonance', 'total_received_uw',
+                   'total_harvested_uw', 'total_harvested_mw',
+                   'system_efficiency', 'energy_per_day_mwh',
+                   'energy_per_day_wh', 'energy_per_day_j',
+                   'iphone_charge_time_days', 'iphone_charge_time_years')
+PAIR_COLUMNS = ('scenario', 'source', 'frequency_mhz', 'received_uw',
+                'harvested_uw', 'efficiency')
+
+
+def report_record(harvester: RFEnergyHarvester,
+                  results: Optional[Dict] = None,
+                  include_sources: bool = True) -> Dict:
+    """
+    Everything in a report as one dict (what the JSON formats write)
+
+    Uses results if given, otherwise calculate_total_harvested_power.
+    """
+    if results is None:
+        results = harvester.calculate_total_harvested_power()
+    harvested_uw = results['total_harvested_uw']
+    energy = harvester.calculate_energy_per_day(harvested_uw)
+    charging = harvester.estimate_charging_capability(harvested_uw)
+    record = {
+        'scenario': harvester.name,
+        'rf_sources': len(harvester.rf_sources),
+        'antennas': len(harvester.antennas),
+        'matching_efficiency': harvester.matching_efficiency,
+        'filter_efficiency': harvester.filter_efficiency,
+        'enable_resonance': bool(harvester.enable_resonance),
+        'total_received_uw': results['total_received_uw'],
+        'total_harvested_uw': harvested_uw,
+        'total_harvested_mw': results['total_harvested_mw'],
+        'system_efficiency': results['system_efficiency'],
+        'energy_per_day_mwh': energy['energy_per_day_mwh'],
+        'energy_per_day_wh': energy['energy_per_day_wh'],
+        'energy_per_day_j': energy['energy_per_day_j'],
+        'iphone_charge_time_days': charging['iphone_charge_time_days'],
+        'iphone_charge_time_years': charging['iphone_charge_time_years'],
+        'capabilities': charging['capabilities'],
+    }
+    if include_sources:
+        record['sources'] = results['sources'].to_list()
+    return record
+
+
+def _json_safe(value):
+    """JSON has no infinity or NaN: write them as null (also inside
+    dicts and lists)"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+class ReportWriter(abc.ABC):
+    """
+    Writes reports one scenario at a time to a file-like sink
+
+    Think of this as a printer: feed it harvesters one by one with
+    write(), and call close() (or use a with block) at the end so the
+    format can finish off (e.g. the closing ] of a JSON array).
+    The sink itself is never closed - it belongs to the caller.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.count = 0  # Reports written so far
+
+    def write(self, harvester: RFEnergyHarvester,
+              results: Optional[Dict] = None):
+        """Write one scenario's report"""
+        self._write(harvester, results)
+        self.count += 1
+
+    @abc.abstractmethod
+    def _write(self, harvester: RFEnergyHarvester, results: Optional[Dict]):
+        """Write one scenario's report in this writer's format"""
+
+    def close(self):
+        """Finish the output"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TextReportWriter(ReportWriter):
+    """The human-readable report, exactly like generate_report"""
+
+    def _write(self, harvester, results):
+        harvester.write_report(self.sink, results)
+
+
+class CsvReportWriter(ReportWriter):
+    """
+    CSV with one row per scenario (level='summary') or one row per
+    source x antenna pair (level='pairs')
+    """
+
+    def __init__(self, sink, level: str = 'summary'):
+        super().__init__(sink)
+        if level not in ('summary', 'pairs'):
+            raise ValueError(f"Unknown CSV level: {level!r}")
+        self.level = level
+        columns = SUMMARY_COLUMNS if level == 'summary' else PAIR_COLUMNS
+        self._writer = csv.DictWriter(sink, fieldnames=columns,
+                                      extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, harvester, results):
+        if self.level == 'summary':
+            self._writer.writerow(report_record(harvester, results,
+                                                include_sources=False))
+            return
+        if results is None:
+            results = harvester.calculate_total_harvested_power()
+        for pair in results['sources'].to_list():
+            self._writer.writerow(dict(pair, scenario=harvester.name))
+
+
+class JsonReportWriter(ReportWriter):
+    """
+    JSON records: one array of all scenarios (lines=False), or one
+    record per line (lines=True, JSON Lines)
+    """
+
+    def __init__(self, sink, lines: bool = False,
+                 include_sources: bool = True):
+        super().__init__(sink)
+        self.lines = lines
+        self.include_sources = include_sources
+
+    def _write(self, harvester, results):
+        record = report_record(harvester, results, self.include_sources)
+        text = json.dumps(_json_safe(record), ensure_ascii=False,
+                          allow_nan=False)
+        if self.lines:
+            self.sink.write(text + "\n")
+        else:
+            # Stream the array: "[" before the first record, "," between
+            self.sink.write(("[\n" if self.count == 0 else ",\n") + text)
+
+    def close(self):
+        if not self.lines:
+            self.sink.write("[]\n" if self.count == 0 else "\n]\n")
+
+
+def open_report_writer(sink, report_format: str = 'text',
+                       **options) -> ReportWriter:
+    """
+    A ReportWriter for one of REPORT_FORMATS
+
+    options go to the writer: level for csv, include_sources for json.
+    """
+    if report_format == 'text':
+        return TextReportWriter(sink, **options)
+    if report_format == 'csv':
+        return CsvReportWriter(sink, **options)
+    if report_format in ('json', 'jsonl'):
+        return JsonReportWriter(sink, lines=report_format == 'jsonl',
+                                **options)
+    raise ValueError(f"Unknown report format: {report_format!r}")
+
+
+def write_reports(harvesters: Iterable[RFEnergyHarvester], sink,
+                  report_format: str = 'text',
+                  results: Optional[Sequence[Dict]] = None,
+                  **options) -> int:
+    """
+    Write reports for many harvesters; returns how many were written
+
+    results, if given, lines up with harvesters (e.g. the list from
+    resocharge_engine.evaluate_harvesters).  harvesters may be any
+    iterable, including a generator, so scenarios can be built and
+    reported one at a time.
+    """
+    with open_report_writer(sink, report_format, **options) as writer:
+        for i, harvester in enumerate(harvesters):
+            writer.write(harvester,
+                         None if results is None else results[i])
+    return writer.count
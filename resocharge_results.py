@@ -0,0 +1,300 @@
+# ResoCharge: Harvest Results
+# Per-pair results stored column by column
+#
+# What this does:
+# - Holds the source x antenna pairs of calculate_total_harvested_power
+#   (results['sources']) as a handful of NumPy arrays instead of one
+#   dict per pair: source row, antenna row, received and harvested
+#   power, and efficiency
+# - Still behaves like the old list of dicts: len, indexing, slicing
+#   and iteration give read-only pair views that act like
+#   {'source', 'frequency_mhz', 'received_uw', 'harvested_uw',
+#   'efficiency'} dicts, and to_list() gives real dicts (e.g. for JSON)
+# - Joins the results of many harvesters into one with a single
+#   concatenate per column; part(i) gets harvester i back
+# - Saves to a single file that load() maps back into memory without
+#   reading or copying it
+#
+# Results are read-only, so a harvester can hand out the same object
+# every time instead of copying it.
+#
+# Example:
+#   pairs = harvester.calculate_total_harvested_power()['sources']
+#   pairs.harvested_uw.max()          # a column, no loop
+#   pairs[0]['source']                # still works like a dict
+#   HarvestResult.concatenate(all_pairs).save('survey.rch')
+#
+# File layout (little-endian):
+#   header   - magic, format version, JSON description size
+#   JSON     - name, dtype, shape and byte offset of every array
+#   arrays   - raw array data, each starting on a 64-byte boundary
+
+import json
+import struct
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+# Keys of a pair, in the order the old dicts had them
+PAIR_FIELDS = ('source', 'frequency_mhz', 'received_uw', 'harvested_uw',
+               'efficiency')
+
+RESULT_FORMAT_VERSION = 1
+
+_MAGIC = b'RCHR'
+_HEADER = struct.Struct('<4sIQ')  # magic, version, JSON bytes
+_ALIGNMENT = 64
+
+# Arrays of a result, in file order
+_ARRAYS = ('source_index', 'antenna_index', 'received_uw', 'harvested_uw',
+           'efficiency', 'source_name', 'source_frequency_mhz', 'offsets',
+           'source_offsets')
+
+
+def _read_only(values, dtype) -> np.ndarray:
+    values = np.asarray(values, dtype=dtype)
+    if values.flags.writeable:
+        values = values.view()
+        values.flags.writeable = False
+    return values
+
+
+class PairView(Mapping):
+    """One pair of a HarvestResult, used like the old result dict"""
+
+    __slots__ = ('_result', '_index')
+
+    def __init__(self, result: 'HarvestResult', index: int):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, key):
+        result, i = self._result, self._index
+        if key == 'source':
+            return result.source_name.item(result.source_index[i])
+        if key == 'frequency_mhz':
+            return result.source_frequency_mhz.item(result.source_index[i])
+        if key in PAIR_FIELDS:
+            return getattr(result, key).item(i)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(PAIR_FIELDS)
+
+    def __len__(self) -> int:
+        return len(PAIR_FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class HarvestResult:
+    """
+    The source x antenna pairs of one or more harvesters
+
+    Pair columns (one entry per pair, in source then antenna order):
+      source_index, antenna_index - rows in the harvester's tables
+      received_uw, harvested_uw, efficiency
+    Source columns (one entry per source, looked up by source_index):
+      source_name, source_frequency_mhz
+    Harvester i owns pairs offsets[i]:offsets[i + 1] and sources
+    source_offsets[i]:source_offsets[i + 1]; source_index counts over
+    all of them, antenna_index within the harvester.
+    """
+
+    def __init__(self, source_index, antenna_index, received_uw,
+                 harvested_uw, efficiency, source_name,
+                 source_frequency_mhz, offsets=None, source_offsets=None):
+        self.source_index = _read_only(source_index, np.int64)
+        self.antenna_index = _read_only(antenna_index, np.int64)
+        self.received_uw = _read_only(received_uw, np.float64)
+        self.harvested_uw = _read_only(harvested_uw, np.float64)
+        self.efficiency = _read_only(efficiency, np.float64)
+        self.source_name = _read_only(source_name, str)
+        self.source_frequency_mhz = _read_only(source_frequency_mhz,
+                                               np.float64)
+        if offsets is None:
+            offsets = [0, len(self.source_index)]
+        if source_offsets is None:
+            source_offsets = [0, len(self.source_name)]
+        self.offsets = _read_only(offsets, np.int64)
+        self.source_offsets = _read_only(source_offsets, np.int64)
+        sizes = {len(getattr(self, name)) for name in _ARRAYS[:5]}
+        if len(sizes) > 1 or \
+                len(self.source_name) != len(self.source_frequency_mhz):
+            raise ValueError("All pair (and all source) columns must have "
+                             "the same length")
+
+    @classmethod
+    def empty(cls) -> 'HarvestResult':
+        """A result without any pairs or sources"""
+        return cls([], [], [], [], [], [], [])
+
+    # Acting like a list of dicts ------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.source_index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [PairView(self, i)
+                    for i in range(*index.indices(len(self)))]
+        position = index + len(self) if index < 0 else index
+        if not 0 <= position < len(self):
+            raise IndexError("result index out of range")
+        return PairView(self, position)
+
+    def __iter__(self) -> Iterator[PairView]:
+        for i in range(len(self)):
+            yield PairView(self, i)
+
+    def __eq__(self, other):
+        if isinstance(other, HarvestResult):
+            return self.to_list() == other.to_list()
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return (f"HarvestResult({len(self)} pairs, "
+                f"{len(self.offsets) - 1} harvesters)")
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        One of PAIR_FIELDS for every pair
+
+        'source' and 'frequency_mhz' are looked up from the source
+        columns (a new array); the others are the stored column itself.
+        """
+        if name == 'source':
+            return self.source_name[self.source_index]
+        if name == 'frequency_mhz':
+            return self.source_frequency_mhz[self.source_index]
+        if name in PAIR_FIELDS:
+            return getattr(self, name)
+        raise KeyError(name)
+
+    def to_list(self) -> List[Dict]:
+        """Every pair as a plain dict (the pre-columnar format)"""
+        columns = [self.column(name).tolist() for name in PAIR_FIELDS]
+        return [dict(zip(PAIR_FIELDS, values)) for values in zip(*columns)]
+
+    # Many harvesters ------------------------------------------------------
+
+    @classmethod
+    def concatenate(cls, results: Sequence['HarvestResult']
+                    ) -> 'HarvestResult':
+        """
+        One result holding all of these, harvester after harvester
+
+        Each column is concatenated once; only source_index and the
+        offsets are shifted, so this costs about one copy of the data.
+        """
+        if not results:
+            return cls.empty()
+        pair_starts = np.cumsum([0] + [len(r) for r in results])
+        source_starts = np.cumsum([0] + [len(r.source_name)
+                                         for r in results])
+        return cls(
+            np.concatenate([r.source_index + start for r, start
+                            in zip(results, source_starts)]),
+            *[np.concatenate([getattr(r, name) for r in results])
+              for name in _ARRAYS[1:7]],
+            offsets=np.concatenate(
+                [r.offsets[:-1] + start for r, start
+                 in zip(results, pair_starts)] + [pair_starts[-1:]]),
+            source_offsets=np.concatenate(
+                [r.source_offsets[:-1] + start for r, start
+                 in zip(results, source_starts)] + [source_starts[-1:]]))
+
+    @property
+    def harvesters(self) -> int:
+        """Number of harvesters whose pairs are in here"""
+        return len(self.offsets) - 1
+
+    def part(self, i: int) -> 'HarvestResult':
+        """The pairs of harvester i (views, apart from source_index)"""
+        pairs = slice(self.offsets[i], self.offsets[i + 1])
+        sources = slice(self.source_offsets[i], self.source_offsets[i + 1])
+        return HarvestResult(
+            self.source_index[pairs] - self.source_offsets[i],
+            self.antenna_index[pairs], self.received_uw[pairs],
+            self.harvested_uw[pairs], self.efficiency[pairs],
+            self.source_name[sources], self.source_frequency_mhz[sources])
+
+    def harvester_index(self) -> np.ndarray:
+        """Which harvester every pair belongs to"""
+        return np.repeat(np.arange(self.harvesters), np.diff(self.offsets))
+
+    # Files ----------------------------------------------------------------
+
+    def save(self, path: str):
+        """Write everything to one file (see the layout at the top)"""
+        arrays = [np.ascontiguousarray(
+            getattr(self, name).astype(
+                getattr(self, name).dtype.newbyteorder('<'), copy=False))
+            for name in _ARRAYS]
+        offset = 0
+        description = []
+        for name, values in zip(_ARRAYS, arrays):
+            description.append({'name': name, 'dtype': values.dtype.str,
+                                'shape': list(values.shape),
+                                'offset': offset})
+            offset += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+        text = json.dumps(description).encode('utf-8')
+        start = -(-(_HEADER.size + len(text)) // _ALIGNMENT) * _ALIGNMENT
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, RESULT_FORMAT_VERSION, len(text)))
+            f.write(text)
+            for entry, values in zip(description, arrays):
+                f.seek(start + entry['offset'])
+                f.write(values.tobytes())
+            f.truncate(start + offset)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'HarvestResult':
+        """
+        Read a file written by save()
+
+        With mmap the arrays are mapped straight from the file: nothing
+        is read until it is used, and the pages are shared between
+        processes opening the same file.
+        """
+        with open(path, 'rb') as f:
+            magic, version, text_size = _HEADER.unpack(
+                f.read(_HEADER.size))
+            if magic != _MAGIC or version != RESULT_FORMAT_VERSION:
+                raise ValueError(f"{path} is not a harvest result file")
+            description = json.loads(f.read(text_size))
+            start = -(-(_HEADER.size + text_size) // _ALIGNMENT) * \
+                _ALIGNMENT
+            arrays = {}
+            for entry in description:
+                dtype = np.dtype(entry['dtype'])
+                shape = tuple(entry['shape'])
+                if mmap and dtype.itemsize * int(np.prod(shape)):
+                    arrays[entry['name']] = np.memmap(
+                        path, dtype=dtype, mode='r', shape=shape,
+                        offset=start + entry['offset'])
+                else:
+                    f.seek(start + entry['offset'])
+                    count = int(np.prod(shape))
+                    arrays[entry['name']] = np.fromfile(
+                        f, dtype=dtype, count=count).reshape(shape)
+        return cls(**arrays)
+
+
+def pair_totals(result: HarvestResult) -> Dict[str, float]:
+    """
+    Total received and harvested power over all pairs of a result
+
+    Added strictly in pair order (like `total += x` in a loop), so the
+    totals match calculate_total_harvested_power to the last bit.
+    """
+    if not len(result):
+        return {'total_received_uw': 0.0, 'total_harvested_uw': 0.0}
+    return {'total_received_uw': np.cumsum(result.received_uw)[-1].item(),
+            'total_harvested_uw': np.cumsum(result.harvested_uw)[-1].item()}
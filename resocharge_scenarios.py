@@ -0,0 +1,248 @@
+# ResoCharge: Scenario Files
+# Describe harvesters in JSON or TOML files instead of Python code
+#
+# What this does:
+# - Loads scenario definitions (sources, antennas, rectifier curve,
+#   efficiencies) from .json / .toml files or whole directories
+# - Writes any RFEnergyHarvester back out as a scenario file
+# - Gives the built-in create_*_scenario environments short names
+#
+# A scenario file looks like this (JSON; TOML uses the same keys):
+#
+#   {
+#     "name": "Urban Apartment",
+#     "enable_resonance": false,
+#     "matching_efficiency": 0.90,
+#     "filter_efficiency": 0.95,
+#     "rectification_mode": "pair",
+#     "sources": [
+#       {"name": "WiFi 2.4GHz", "frequency_mhz": 2450,
+#        "power_density_uw_per_m2": 30, "availability": 0.95}
+#     ],
+#     "antennas": [
+#       {"frequency_mhz": 2450, "effective_area_m2": 0.006,
+#        "efficiency": 0.85}
+#     ],
+#     "rectifier": {
+#       "type": "dickson", "stages": 6, "threshold_voltage": 0.3,
+#       "efficiency_at_power": [[0.1, 0.10], [1.0, 0.25], [10.0, 0.40]]
+#     }
+#   }
+#
+# A file may also hold several scenarios: {"scenarios": [{...}, ...]}.
+# Efficiency curves are [power μW, efficiency] pairs because JSON and
+# TOML keys can't be numbers.
+
+import json
+import os
+from dataclasses import fields
+from typing import Callable, Dict, List
+
+from resocharge_simulator import AntennaConfig, RECTIFICATION_MODES, \
+    RFEnergyHarvester, RFSource, RectifierConfig, \
+    create_near_cell_tower_scenario, create_rural_scenario, \
+    create_urban_apartment_scenario
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:  # pragma: no cover - older Pythons
+    tomllib = None
+
+
+# Built-in environments by short name
+BUILTIN_SCENARIOS: Dict[str, Callable[[], RFEnergyHarvester]] = {
+    'urban': create_urban_apartment_scenario,
+    'tower': create_near_cell_tower_scenario,
+    'rural': create_rural_scenario,
+}
+
+# File extensions we know how to read
+SCENARIO_EXTENSIONS = ('.json', '.toml')
+
+
+class ScenarioError(ValueError):
+    """A scenario file is missing something or has a bad value"""
+
+
+def _record(cls, values: Dict, where: str):
+    """Build a dataclass (RFSource, AntennaConfig) from a dict"""
+    names = {f.name for f in fields(cls)}
+    unknown = set(values) - names
+    if unknown:
+        raise ScenarioError(
+            f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+    try:
+        return cls(**values)
+    except TypeError as error:
+        raise ScenarioError(f"{where}: {error}") from None
+
+
+def _curve(values, where: str) -> Dict[float, float]:
+    """Efficiency curve from [[power, eff], ...] or {"power": eff}"""
+    if isinstance(values, dict):
+        values = values.items()
+    try:
+        return {float(power): float(eff) for power, eff in values}
+    except (TypeError, ValueError):
+        raise ScenarioError(
+            f"{where}: efficiency_at_power must be [power, efficiency] "
+            f"pairs") from None
+
+
+def scenario_from_dict(data: Dict,
+                       where: str = "scenario") -> RFEnergyHarvester:
+    """Build an RFEnergyHarvester from one scenario definition"""
+    known = {'name', 'enable_resonance', 'resonance_boost',
+             'matching_efficiency', 'filter_efficiency',
+             'rectification_mode', 'sources', 'antennas', 'rectifier'}
+    unknown = set(data) - known
+    if unknown:
+        raise ScenarioError(
+            f"{where}: unknown key(s) {', '.join(sorted(unknown))}")
+
+    harvester = RFEnergyHarvester(data.get('name', 'ResoCharge'),
+                                  bool(data.get('enable_resonance', False)))
+    where = f"{where} ({harvester.name})"
+    for key in ('resonance_boost', 'matching_efficiency',
+                'filter_efficiency'):
+        if key in data:
+            setattr(harvester, key, float(data[key]))
+    if 'rectification_mode' in data:
+        mode = data['rectification_mode']
+        if mode not in RECTIFICATION_MODES:
+            raise ScenarioError(
+                f"{where}: rectification_mode must be one of "
+                f"{', '.join(RECTIFICATION_MODES)}")
+        harvester.rectification_mode = mode
+    for i, source in enumerate(data.get('sources', [])):
+        harvester.add_rf_source(
+            _record(RFSource, source, f"{where} sources[{i}]"))
+    for i, antenna in enumerate(data.get('antennas', [])):
+        harvester.add_antenna(
+            _record(AntennaConfig, antenna, f"{where} antennas[{i}]"))
+
+    rectifier = data.get('rectifier')
+    if rectifier is not None:
+        rectifier = dict(rectifier)
+        curve = _curve(rectifier.pop('efficiency_at_power', []),
+                       f"{where} rectifier")
+        config = _record(RectifierConfig,
+                         dict(rectifier, efficiency_at_power=curve),
+                         f"{where} rectifier")
+        harvester.set_rectifier(config)
+    return harvester
+
+
+def scenario_to_dict(harvester: RFEnergyHarvester) -> Dict:
+    """The scenario definition of a harvester (inverse of
+    scenario_from_dict)"""
+    data = {
+        'name': harvester.name,
+        'enable_resonance': bool(harvester.enable_resonance),
+        'resonance_boost': harvester.resonance_boost,
+        'matching_efficiency': harvester.matching_efficiency,
+        'filter_efficiency': harvester.filter_efficiency,
+        'rectification_mode': harvester.rectification_mode,
+        'sources': [{f.name: getattr(source, f.name)
+                     for f in fields(RFSource)}
+                    for source in harvester.rf_sources],
+        'antennas': [{f.name: getattr(antenna, f.name)
+                      for f in fields(AntennaConfig)}
+                     for antenna in harvester.antennas],
+    }
+    if harvester.rectifier:
+        rectifier = harvester.rectifier
+        data['rectifier'] = {
+            'type': rectifier.type,
+            'stages': rectifier.stages,
+            'threshold_voltage': rectifier.threshold_voltage,
+            'efficiency_at_power': [
+                [power, eff] for power, eff in sorted(
+                    rectifier.efficiency_at_power.items())],
+        }
+    return data
+
+
+def _parse(path: str) -> Dict:
+    """Read a JSON or TOML file into a dict"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    if extension == '.toml':
+        if tomllib is None:
+            raise ScenarioError(
+                f"{path}: reading TOML needs Python 3.11 or newer")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    raise ScenarioError(f"{path}: not a .json or .toml file")
+
+
+def load_scenarios(path: str) -> List[RFEnergyHarvester]:
+    """
+    Load every scenario in a file, a directory, or a built-in name
+
+    Directories are read in file-name order (only .json/.toml files).
+    A built-in name ('urban', 'tower', 'rural') gives that scenario.
+    """
+    if path in BUILTIN_SCENARIOS and not os.path.exists(path):
+        return [BUILTIN_SCENARIOS[path]()]
+    if os.path.isdir(path):
+        harvesters = []
+        for entry in sorted(os.listdir(path)):
+            if os.path.splitext(entry)[1].lower() in SCENARIO_EXTENSIONS:
+                harvesters.extend(load_scenarios(os.path.join(path, entry)))
+        return harvesters
+
+    data = _parse(path)
+    if 'scenarios' in data:
+        return [scenario_from_dict(item, f"{path} scenarios[{i}]")
+                for i, item in enumerate(data['scenarios'])]
+    return [scenario_from_dict(data, path)]
+
+
+def _toml_value(value) -> str:
+    """One value in TOML syntax (only what scenarios need)"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        return repr(value)  # Also gives TOML's inf and nan
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return json.dumps(value)  # JSON strings are valid TOML strings
+    if isinstance(value, list):
+        return '[' + ', '.join(_toml_value(v) for v in value) + ']'
+    raise TypeError(f"Can't write {type(value).__name__} to TOML")
+
+
+def _to_toml(data: Dict) -> str:
+    """Write a scenario dict as TOML"""
+    lines = []
+    for key, value in data.items():
+        if isinstance(value, (dict, list)):
+            continue  # Tables come after the plain keys
+        lines.append(f"{key} = {_toml_value(value)}")
+    for key in ('sources', 'antennas'):
+        for item in data.get(key, []):
+            lines.append(f"\n[[{key}]]")
+            lines.extend(f"{k} = {_toml_value(v)}" for k, v in item.items())
+    if 'rectifier' in data:
+        lines.append("\n[rectifier]")
+        lines.extend(f"{k} = {_toml_value(v)}"
+                     for k, v in data['rectifier'].items())
+    return "\n".join(lines) + "\n"
+
+
+def dump_scenario(harvester: RFEnergyHarvester, path: str):
+    """Save a harvester as a .json or .toml scenario file"""
+    data = scenario_to_dict(harvester)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        text = json.dumps(data, indent=2, ensure_ascii=False) + "\n"
+    elif extension == '.toml':
+        text = _to_toml(data)
+    else:
+        raise ScenarioError(f"{path}: not a .json or .toml file")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
@@ -0,0 +1,758 @@
+# ResoCharge: Energy-Budget Task Scheduler
+# Can a real task mix run on harvested power? Simulate it event by event
+#
+# What this does:
+# - Describes a node's work as periodic tasks (a BLE advert at 10 mW for
+#   2 ms every minute, a sensor read every 30 s, an e-ink refresh every
+#   6 hours, ...) on top of a constant sleep draw
+# - Runs them from an EnergyStorage (see resocharge_timeseries) charged
+#   by the harvester's output, with a priority-queue event heap
+# - Jumps straight from one event to the next: between events the
+#   stored energy follows a closed-form curve, so there is no time step
+# - Reports missed deadlines, brown-outs (storage ran dry) and the
+#   highest task rates the harvested power could sustain
+#
+# Between two events the net power p (harvest in, sleep / task / leakage
+# out) is constant and self-discharge removes a fixed fraction k of the
+# stored energy per second, so
+#
+#     E(t) = p/k + (E0 - p/k) × e^(-k t)       (E0 + p t when k = 0)
+#
+# which also tells exactly when the storage will be full, empty, or hold
+# enough energy for the next job.
+#
+# Periodic tasks repeat every hyperperiod (the least common multiple of
+# the periods).  Once a hyperperiod ends in the same state it started
+# in, and no job had to wait for energy along the way, all remaining
+# hyperperiods are identical and are skipped by multiplying the counts;
+# while the storage only drifts (no waiting, no overflow, nothing
+# missed) hyperperiods are skipped with the closed form as well.  Years
+# of operation then take milliseconds.  Starved schedules, where jobs
+# keep waiting for energy, are simulated event by event: there the
+# order in which tasks get served is too sensitive to skip.
+# `--check` reruns the demo without fast-forwarding and compares.
+
+import argparse
+import heapq
+import math
+import time
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Dict, List, Optional, Sequence, Union
+
+from resocharge_simulator import RFEnergyHarvester, \
+    create_near_cell_tower_scenario
+from resocharge_timeseries import EnergyStorage, SECONDS_PER_DAY
+
+
+# Scheduling policies
+#   wait  - a job only starts once the storage holds its whole energy
+#   eager - a job starts as soon as the processor is free (brown-out if
+#           the storage runs dry half way)
+POLICIES = ('wait', 'eager')
+
+# Hyperperiods with more job releases than this are simulated event by
+# event without fast-forwarding
+MAX_RELEASES_PER_HYPERPERIOD = 1_000_000
+
+# Event kinds, in the order they are handled at the same instant
+_BOUNDARY, _COMPLETE, _EMPTY, _RECOVER, _RELEASE, _ENERGY, _MISS = range(7)
+
+
+@dataclass
+class Task:
+    """
+    A periodic job the node has to run
+
+    Think of this as one line in the firmware's main loop: every
+    period_s it draws power_mw for duration_s, and it has to be done
+    within deadline_s of being released (default: before the next one).
+    Lower priority numbers run first when several jobs are waiting.
+
+    Example: Task("BLE advert", 10.0, 0.002, 60.0) - 20 μJ a minute
+    """
+    name: str
+    power_mw: float  # Draw while running
+    duration_s: float
+    period_s: float
+    deadline_s: Optional[float] = None  # After release; None = period
+    priority: int = 0
+    phase_s: float = 0.0  # First release
+
+    @property
+    def energy_j(self) -> float:
+        """Energy of one job"""
+        return self.power_mw * 1e-3 * self.duration_s
+
+    @property
+    def relative_deadline_s(self) -> float:
+        return self.period_s if self.deadline_s is None else self.deadline_s
+
+    @property
+    def average_power_uw(self) -> float:
+        """Long-run average draw of this task"""
+        return self.energy_j / self.period_s * 1e6
+
+
+@dataclass
+class TaskStats:
+    """What happened to one task's jobs"""
+    name: str
+    released: int = 0
+    completed: int = 0
+    missed: int = 0  # Could not start in time to meet the deadline
+    failed: int = 0  # Started, but a brown-out cut it off
+    wait_s: float = 0.0  # Total release-to-start delay of started jobs
+
+    @property
+    def miss_rate(self) -> float:
+        """Fraction of released jobs that were missed or failed"""
+        if not self.released:
+            return 0.0
+        return (self.missed + self.failed) / self.released
+
+    @property
+    def mean_wait_s(self) -> float:
+        started = self.completed + self.failed
+        return self.wait_s / started if started else 0.0
+
+
+@dataclass
+class ScheduleResult:
+    """Totals of a scheduler run (energies in joules)"""
+    duration_s: float
+    harvested_power_uw: float
+    policy: str
+    tasks: Dict[str, TaskStats]
+    brownouts: int  # Times the storage ran dry while the node was on
+    off_time_s: float  # Time spent browned out, waiting to restart
+    stored_energy_j: float  # Harvested energy put into storage
+    task_energy_j: float  # Energy used by jobs (including failed ones)
+    sleep_energy_j: float
+    wasted_energy_j: float  # Harvested while the storage was full
+    loss_energy_j: float  # Leakage and self-discharge
+    final_energy_j: float
+    min_energy_j: float
+    events: int  # Events actually processed
+    skipped_s: float  # Simulated time covered by fast-forwarding
+    elapsed_s: float
+
+    @property
+    def missed_deadlines(self) -> int:
+        return sum(t.missed + t.failed for t in self.tasks.values())
+
+    @property
+    def sustainable(self) -> bool:
+        """No missed jobs and no brown-outs"""
+        return self.missed_deadlines == 0 and self.brownouts == 0
+
+    def format(self) -> str:
+        """Text summary"""
+        days = self.duration_s / SECONDS_PER_DAY
+        verdict = 'sustainable' if self.sustainable else 'NOT sustainable'
+        skipped = (self.skipped_s / self.duration_s * 100
+                   if self.duration_s else 0.0)
+        lines = [f"Schedule ({self.policy}, {days:,.1f} days at "
+                 f"{self.harvested_power_uw:.3f} μW): {verdict}",
+                 f"  {self.events:,} events, {skipped:.1f}% "
+                 f"fast-forwarded, {self.elapsed_s * 1000:.1f} ms",
+                 f"  Brown-outs: {self.brownouts:,} "
+                 f"({self.off_time_s / 3600:.1f} h off)",
+                 f"  Energy: {self.stored_energy_j:.4f} J in, "
+                 f"{self.task_energy_j:.4f} J tasks, "
+                 f"{self.sleep_energy_j:.4f} J sleep, "
+                 f"{self.loss_energy_j:.4f} J lost, "
+                 f"{self.wasted_energy_j:.4f} J wasted (storage full)",
+                 "",
+                 f"  {'Task':20s} {'Released':>12s} {'Completed':>12s} "
+                 f"{'Missed':>10s} {'Failed':>8s} {'Mean wait':>10s}"]
+        for stats in self.tasks.values():
+            lines.append(f"  {stats.name:20s} {stats.released:12,d} "
+                         f"{stats.completed:12,d} {stats.missed:10,d} "
+                         f"{stats.failed:8,d} {stats.mean_wait_s:9.2f}s")
+        return "\n".join(lines)
+
+
+def _hyperperiod(tasks: Sequence[Task]) -> Optional[float]:
+    """Least common multiple of the periods (None if not practical)"""
+    periods = [Fraction(str(t.period_s)).limit_denominator(10 ** 6)
+               for t in tasks]
+    if not periods:
+        return None
+    result = periods[0]
+    for period in periods[1:]:
+        result = Fraction(
+            math.lcm(result.numerator * period.denominator,
+                     period.numerator * result.denominator),
+            result.denominator * period.denominator)
+    releases = sum(result / p for p in periods)
+    if releases > MAX_RELEASES_PER_HYPERPERIOD:
+        return None
+    return float(result)
+
+
+def _time_to_level(energy: float, level: float, power_w: float,
+                   rate: float) -> float:
+    """Seconds until the stored energy reaches level (inf = never)"""
+    if energy == level:
+        return 0.0
+    if rate > 0:
+        settle = power_w / rate  # Where the energy is heading
+        if energy == settle:
+            return math.inf
+        ratio = (level - settle) / (energy - settle)
+        if not 0 < ratio <= 1:
+            return math.inf
+        return -math.log(ratio) / rate
+    if power_w == 0:
+        return math.inf
+    seconds = (level - energy) / power_w
+    return seconds if seconds >= 0 else math.inf
+
+
+def _energy_after(energy: float, power_w: float, rate: float,
+                  seconds: float) -> float:
+    """Stored energy after seconds at constant net power (no limits)"""
+    if rate > 0:
+        settle = power_w / rate
+        return settle + (energy - settle) * math.exp(-rate * seconds)
+    return energy + power_w * seconds
+
+
+class _Job:
+    """One release of a task"""
+    __slots__ = ('task', 'release', 'deadline', 'start', 'state')
+
+    def __init__(self, task: int, release: float, deadline: float):
+        self.task = task
+        self.release = release
+        self.deadline = deadline
+        self.start = 0.0
+        self.state = 'ready'  # ready / running / done
+
+
+class _Simulation:
+    """The event loop and the storage state between events"""
+
+    def __init__(self, power_uw: float, tasks: Sequence[Task],
+                 storage: EnergyStorage, sleep_uw: float, policy: str,
+                 restart_j: Optional[float], duration_s: float,
+                 fast_forward: bool):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy!r}")
+        self.tasks = list(tasks)
+        self.policy = policy
+        self.end = duration_s
+        self.capacity = storage.capacity_j
+        self.rate = (-math.log1p(-storage.self_discharge_per_hour) / 3600.0
+                     if storage.self_discharge_per_hour > 0 else 0.0)
+        self.input_w = power_uw * storage.charge_efficiency * 1e-6
+        self.leakage_w = storage.leakage_uw * 1e-6
+        self.sleep_w = sleep_uw * 1e-6
+        self.restart_j = (restart_j if restart_j is not None else
+                          max([t.energy_j for t in self.tasks] + [0.0]))
+
+        self.now = 0.0
+        self.energy = self.min_energy = storage.energy_j
+        self.on = True
+        self.off_since = 0.0
+        self.running: Optional[_Job] = None
+        self.ready: List = []  # (priority, deadline, seq, job)
+        self.heap: List = []  # (time, kind, seq, payload, generation)
+        self.seq = 0
+        self.generation = 0
+        self.events = 0
+        self.skipped_s = 0.0
+        # Everything that adds up over time, so hyperperiods can be
+        # repeated by multiplying their increments
+        self.count: Dict = {'stored_j': 0.0, 'task_j': 0.0,
+                            'sleep_j': 0.0, 'wasted_j': 0.0,
+                            'brownouts': 0, 'off_s': 0.0}
+        for i in range(len(self.tasks)):
+            for key in ('released', 'completed', 'missed', 'failed',
+                        'wait_s'):
+                self.count[key, i] = 0
+
+        self.hyperperiod = _hyperperiod(self.tasks) if fast_forward \
+            else None
+        if self.hyperperiod and self.hyperperiod * 2 >= duration_s:
+            self.hyperperiod = None
+        self.previous = None  # State at the last hyperperiod boundary
+        self._reset_window()
+
+    # Storage between events ------------------------------------------------
+
+    @property
+    def net_w(self) -> float:
+        """Net power into the storage right now"""
+        draw = self.leakage_w
+        if self.on:
+            draw += self.sleep_w
+            if self.running is not None:
+                draw += self.tasks[self.running.task].power_mw * 1e-3
+        return self.input_w - draw
+
+    def _advance(self, until: float):
+        """Move the clock forward, following the energy curve"""
+        seconds = until - self.now
+        if seconds <= 0:
+            return
+        power = self.net_w
+        self.count['stored_j'] += self.input_w * seconds
+        if self.on:
+            self.count['sleep_j'] += self.sleep_w * seconds
+        else:
+            self.count['off_s'] += seconds
+
+        energy = self.energy
+        to_full = _time_to_level(energy, self.capacity, power, self.rate) \
+            if energy < self.capacity else 0.0
+        if to_full < seconds:
+            # Fills up part way: the rest of the surplus is wasted
+            self.count['wasted_j'] += (power - self.rate * self.capacity) \
+                * (seconds - to_full)
+            self.window_clamped = True
+            energy = self.capacity
+        else:
+            energy = max(_energy_after(energy, power, self.rate, seconds),
+                         0.0)
+        self.window_min = min(self.window_min, energy)
+        self.window_max = max(self.window_max, energy)
+        self.min_energy = min(self.min_energy, energy)
+        self.energy = energy
+        self.now = until
+
+    # Events ---------------------------------------------------------------
+
+    def _push(self, when: float, kind: int, payload=None,
+              generation: int = -1):
+        self.seq += 1
+        heapq.heappush(self.heap, (when, kind, self.seq, payload,
+                                   generation))
+
+    def _plan(self):
+        """(Re)schedule the events that depend on the energy curve"""
+        self.generation += 1
+        power = self.net_w
+        if not self.on:
+            wait = _time_to_level(self.energy, self.restart_j, power,
+                                  self.rate)
+            if self.energy >= self.restart_j:
+                wait = 0.0
+            if wait < math.inf:
+                self._push(self.now + wait, _RECOVER, None, self.generation)
+            return
+        if power < 0:
+            wait = _time_to_level(self.energy, 0.0, power, self.rate)
+            if wait < math.inf:
+                self._push(self.now + wait, _EMPTY, None, self.generation)
+        job = self._next_ready()
+        if (self.running is None and job is not None and
+                self.policy == 'wait'):
+            need = self.tasks[job.task].energy_j
+            if self._short_of(need):
+                wait = _time_to_level(self.energy, need, power, self.rate)
+                if wait < math.inf and need <= self.capacity:
+                    self._push(self.now + wait, _ENERGY, None,
+                               self.generation)
+
+    def _short_of(self, need: float) -> bool:
+        """Less energy stored than need (ignoring rounding, so a job
+        woken by its _ENERGY event really starts)"""
+        return self.energy < need * (1 - 1e-9)
+
+    def _next_ready(self) -> Optional[_Job]:
+        """Most urgent waiting job (finished ones are dropped lazily)"""
+        while self.ready and self.ready[0][3].state != 'ready':
+            heapq.heappop(self.ready)
+        return self.ready[0][3] if self.ready else None
+
+    def _try_start(self):
+        """Start the most urgent job if the processor and energy allow"""
+        while self.on and self.running is None:
+            job = self._next_ready()
+            if job is None:
+                return
+            task = self.tasks[job.task]
+            if self.now + task.duration_s > job.deadline:
+                self._miss(job)
+                continue
+            if self.policy == 'wait' and self._short_of(task.energy_j):
+                self.window_waited = True
+                return
+            heapq.heappop(self.ready)
+            job.state = 'running'
+            job.start = self.now
+            self.count['wait_s', job.task] += self.now - job.release
+            self.window_slack = min(self.window_slack,
+                                    self.energy - task.energy_j)
+            self.running = job
+            self._push(self.now + task.duration_s, _COMPLETE, job)
+
+    def _miss(self, job: _Job):
+        job.state = 'done'
+        self.count['missed', job.task] += 1
+        self.window_missed = True
+
+    def _release(self, task_index: int, number: int):
+        task = self.tasks[task_index]
+        release = task.phase_s + number * task.period_s
+        job = _Job(task_index, release, release + task.relative_deadline_s)
+        self.count['released', task_index] += 1
+        heapq.heappush(self.ready, (task.priority, job.deadline, self.seq,
+                                    job))
+        self._push(job.deadline - task.duration_s, _MISS, job)
+        following = task.phase_s + (number + 1) * task.period_s
+        if following < self.end:
+            self._push(following, _RELEASE, (task_index, number + 1))
+
+    def _complete(self, job: _Job):
+        if job.state != 'running':
+            return  # Cut off by a brown-out
+        job.state = 'done'
+        self.running = None
+        self.count['completed', job.task] += 1
+        self.count['task_j'] += self.tasks[job.task].energy_j
+
+    def _brownout(self):
+        self.count['brownouts'] += 1
+        self.window_missed = True
+        self.on = False
+        job = self.running
+        if job is not None:
+            job.state = 'done'
+            self.running = None
+            self.count['failed', job.task] += 1
+            self.count['task_j'] += (self.tasks[job.task].power_mw * 1e-3 *
+                                     (self.now - job.start))
+
+    # Hyperperiods ---------------------------------------------------------
+
+    def _reset_window(self):
+        """Start collecting what happens during one hyperperiod"""
+        self.window_min = self.window_max = self.energy
+        self.window_slack = math.inf
+        self.window_clamped = self.window_waited = False
+        self.window_missed = False
+
+    def _signature(self):
+        """Everything about the state except the stored energy"""
+        scale = self.hyperperiod
+        running = self.running
+        waiting = sorted((job.task, round((job.release - self.now) / scale,
+                                          9))
+                         for _, _, _, job in self.ready
+                         if job.state == 'ready')
+        return (self.on,
+                running and (running.task,
+                             round((running.start - self.now) / scale, 9)),
+                tuple(waiting))
+
+    def _boundary(self) -> int:
+        """
+        Compare with the last hyperperiod and skip ahead if possible;
+        returns the number of hyperperiods skipped
+        """
+        state = (self._signature(), self.energy, dict(self.count))
+        previous, self.previous = self.previous, state
+        clean = not (self.window_clamped or self.window_waited or
+                     self.window_missed) and self.on
+        waited = self.window_waited
+        window = (self.window_min, self.window_max, self.window_slack)
+        self._reset_window()
+        if previous is None or previous[0] != state[0]:
+            return 0
+
+        remaining = int((self.end - self.now) // self.hyperperiod)
+        before, after = previous[1], self.energy
+        skip = 0
+        tolerance = 1e-12 + 1e-9 * abs(after)
+        # The same state only repeats exactly if the stored energy
+        # decided nothing: no job waited for energy and the storage
+        # stayed clear of empty (and of each job's need) by more than
+        # the tolerance.  Otherwise (e.g. a starved 'wait' schedule) a
+        # rounding-level difference can change which task is served.
+        margin = min(window[0], window[2] if self.policy == 'wait'
+                     else math.inf)
+        settled = self.on and not waited and margin > tolerance
+        if abs(after - before) <= tolerance and settled:
+            skip = remaining  # Same state again: all the rest are alike
+            energy = after
+        elif clean:
+            skip, energy = self._drift(before, after, window, remaining)
+        if skip <= 0:
+            return 0
+
+        increments = {key: value - previous[2][key]
+                      for key, value in self.count.items()}
+        for key, value in increments.items():
+            self.count[key] += value * skip
+        low = window[0] - before
+        self.min_energy = min(self.min_energy,
+                              min(energy, after) + min(low, 0.0))
+        self._shift(skip)
+        self.energy = energy
+        self.previous = None  # The skipped window isn't a reference
+        return skip
+
+    def _drift(self, before: float, after: float, window,
+               remaining: int):
+        """
+        Hyperperiods that can be skipped while the energy only drifts
+
+        With no overflow, waiting or brown-out the whole hyperperiod maps
+        the starting energy E to a E + b, and every energy along the way
+        moves by at most as much as the start did.  So the following
+        hyperperiods behave the same as long as the start stays within
+        the slack to empty (or to a waiting job) and to full.
+        """
+        low, high, slack = window
+        room_down = min(low, slack)
+        room_up = self.capacity - high
+        factor = math.exp(-self.rate * self.hyperperiod)
+        offset = after - factor * before
+        if factor < 1:
+            settle = offset / (1 - factor)
+            gap = settle - before
+            room = room_up if gap > 0 else room_down
+            if abs(gap) <= room:
+                count = remaining
+            else:
+                count = int(math.log1p(-room / abs(gap)) / math.log(factor))
+        else:
+            room = room_up if offset > 0 else room_down
+            count = int(room / abs(offset))
+        # count hyperperiods from now on are known to be clean; skip all
+        # but the last of them (one in hand for rounding)
+        skip = min(count - 1, remaining)
+        if skip <= 0:
+            return 0, after
+        if factor < 1:
+            energy = settle + (after - settle) * factor ** skip
+        else:
+            energy = after + offset * skip
+        return skip, energy
+
+    def _shift(self, count: int):
+        """Move every pending event and job count hyperperiods ahead"""
+        seconds = count * self.hyperperiod
+        self.now += seconds
+        self.skipped_s += seconds
+        jobs = {id(job): job for _, _, _, job in self.ready}
+        if self.running is not None:
+            jobs[id(self.running)] = self.running
+        for job in jobs.values():
+            job.release += seconds
+            job.deadline += seconds
+            job.start += seconds
+        shifted = []
+        for when, kind, seq, payload, generation in self.heap:
+            if kind == _RELEASE:
+                task_index, number = payload
+                task = self.tasks[task_index]
+                number += round(count * self.hyperperiod / task.period_s)
+                payload = (task_index, number)
+                when = task.phase_s + number * task.period_s
+            else:
+                when += seconds
+            shifted.append((when, kind, seq, payload, generation))
+        heapq.heapify(shifted)
+        self.heap = shifted
+        self.ready = [(p, job.deadline, s, job)
+                      for p, _, s, job in self.ready]
+        heapq.heapify(self.ready)
+
+    # Main loop ------------------------------------------------------------
+
+    def run(self):
+        for index, task in enumerate(self.tasks):
+            if task.phase_s < self.end:
+                self._push(task.phase_s, _RELEASE, (index, 0))
+        if self.hyperperiod:
+            self._push(self.hyperperiod, _BOUNDARY, 1)
+        self._plan()
+
+        while self.heap and self.heap[0][0] < self.end:
+            when, kind, _, payload, generation = heapq.heappop(self.heap)
+            if generation >= 0 and generation != self.generation:
+                continue  # Energy forecast made before the last change
+            self.events += 1
+            self._advance(when)
+            if kind == _BOUNDARY:
+                number = payload + self._boundary()
+                following = (number + 1) * self.hyperperiod
+                if following < self.end:
+                    self._push(following, _BOUNDARY, number + 1)
+                continue
+            if kind == _COMPLETE:
+                self._complete(payload)
+            elif kind == _EMPTY:
+                self._brownout()
+            elif kind == _RECOVER:
+                self.on = True
+            elif kind == _RELEASE:
+                self._release(*payload)
+            elif kind == _MISS:
+                if payload.state == 'ready':
+                    self._miss(payload)
+            self._try_start()
+            self._plan()
+        self._advance(self.end)
+
+
+def simulate_schedule(
+        harvester: Union[RFEnergyHarvester, float],
+        tasks: Sequence[Task],
+        duration_s: float,
+        storage: Optional[EnergyStorage] = None,
+        sleep_uw: float = 0.0,
+        policy: str = 'wait',
+        restart_j: Optional[float] = None,
+        fast_forward: bool = True) -> ScheduleResult:
+    """
+    Run periodic tasks on harvested power for duration_s seconds
+
+    harvester  - an RFEnergyHarvester (its total_harvested_uw is used)
+                 or a harvested power in μW
+    storage    - the energy buffer (default: an ideal 1 J store)
+    sleep_uw   - constant draw whenever the node is on
+    policy     - 'wait' or 'eager' (see POLICIES)
+    restart_j  - after a brown-out the node restarts once this much
+                 energy is stored (default: the biggest job's energy)
+
+    Example: a year of BLE adverts and sensor reads near a cell tower
+        simulate_schedule(create_near_cell_tower_scenario(),
+                          [Task("BLE advert", 10.0, 0.002, 60.0),
+                           Task("Sensor read", 1.0, 0.005, 30.0)],
+                          365 * 86400,
+                          EnergyStorage.supercapacitor(0.047, 3.3),
+                          sleep_uw=0.5)
+    """
+    started = time.perf_counter()
+    if isinstance(harvester, RFEnergyHarvester):
+        power_uw = harvester.calculate_total_harvested_power()[
+            'total_harvested_uw']
+    else:
+        power_uw = float(harvester)
+    storage = storage or EnergyStorage(capacity_j=1.0)
+    simulation = _Simulation(power_uw, tasks, storage, sleep_uw, policy,
+                             restart_j, duration_s, fast_forward)
+    simulation.run()
+
+    count = simulation.count
+    stats = {}
+    for i, task in enumerate(simulation.tasks):
+        stats[task.name] = TaskStats(
+            task.name, released=count['released', i],
+            completed=count['completed', i], missed=count['missed', i],
+            failed=count['failed', i], wait_s=count['wait_s', i])
+    loss = (storage.energy_j + count['stored_j'] - count['task_j'] -
+            count['sleep_j'] - count['wasted_j'] - simulation.energy)
+    return ScheduleResult(
+        duration_s=duration_s, harvested_power_uw=power_uw, policy=policy,
+        tasks=stats, brownouts=count['brownouts'],
+        off_time_s=count['off_s'], stored_energy_j=count['stored_j'],
+        task_energy_j=count['task_j'], sleep_energy_j=count['sleep_j'],
+        wasted_energy_j=count['wasted_j'], loss_energy_j=loss,
+        final_energy_j=simulation.energy,
+        min_energy_j=simulation.min_energy, events=simulation.events,
+        skipped_s=simulation.skipped_s,
+        elapsed_s=time.perf_counter() - started)
+
+
+def sustainable_rates(harvester: Union[RFEnergyHarvester, float],
+                      tasks: Sequence[Task],
+                      storage: Optional[EnergyStorage] = None,
+                      sleep_uw: float = 0.0) -> Dict[str, float]:
+    """
+    Most jobs per hour each task could run, the others left as they are
+
+    Two limits apply: energy (harvested power minus sleep, leakage,
+    self-discharge and the other tasks' average draw, divided by one
+    job's energy) and time (the processor can only run one job at a
+    time).  Self-discharge is counted at the lowest level the storage
+    can run at - the biggest job's energy - so this is the long-run
+    ceiling; simulate_schedule shows whether the storage is big enough
+    to get there.  A job that needs more energy than the storage holds
+    gets 0.
+    """
+    if isinstance(harvester, RFEnergyHarvester):
+        power_uw = harvester.calculate_total_harvested_power()[
+            'total_harvested_uw']
+    else:
+        power_uw = float(harvester)
+    storage = storage or EnergyStorage(capacity_j=1.0)
+    rate = (-math.log1p(-storage.self_discharge_per_hour) / 3600.0
+            if storage.self_discharge_per_hour > 0 else 0.0)
+    input_w = power_uw * storage.charge_efficiency * 1e-6
+    floor_j = max([t.energy_j for t in tasks] + [0.0])
+    surplus_w = (input_w - storage.leakage_uw * 1e-6 - sleep_uw * 1e-6 -
+                 rate * floor_j)
+
+    rates = {}
+    for task in tasks:
+        others = [t for t in tasks if t is not task]
+        energy_w = surplus_w - sum(t.energy_j / t.period_s for t in others)
+        busy = 1.0 - sum(t.duration_s / t.period_s for t in others)
+        per_second = min(energy_w / task.energy_j if task.energy_j
+                         else math.inf,
+                         busy / task.duration_s if task.duration_s
+                         else math.inf)
+        if task.energy_j - input_w * task.duration_s > storage.capacity_j:
+            per_second = 0.0
+        rates[task.name] = max(per_second, 0.0) * 3600.0
+    return rates
+
+
+def main():
+    """Command-line demo: a sensor node's task mix near a cell tower"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge energy-budget task scheduler')
+    parser.add_argument('--days', type=float, default=365.0)
+    parser.add_argument('--policy', choices=POLICIES, default='wait')
+    parser.add_argument('--capacitance', type=float, default=0.047,
+                        help='supercapacitor size in farads (3.3 V)')
+    parser.add_argument('--sleep-uw', type=float, default=0.5)
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help='run every task this many times as often')
+    parser.add_argument('--check', action='store_true',
+                        help='also run event by event (no fast-forward) '
+                             'and compare the task counts')
+    args = parser.parse_args()
+
+    harvester = create_near_cell_tower_scenario()
+    tasks = [
+        Task("BLE advert", 10.0, 0.002, 60.0 / args.speedup),
+        Task("Sensor read", 1.0, 0.005, 30.0 / args.speedup, priority=1),
+        Task("E-ink refresh", 15.0, 0.5, 21600.0 / args.speedup,
+             priority=2),
+    ]
+    storage = EnergyStorage.supercapacitor(args.capacitance, 3.3)
+    result = simulate_schedule(harvester, tasks,
+                               args.days * SECONDS_PER_DAY, storage,
+                               sleep_uw=args.sleep_uw, policy=args.policy)
+    print(result.format())
+
+    if args.check:
+        reference = simulate_schedule(
+            harvester, tasks, args.days * SECONDS_PER_DAY, storage,
+            sleep_uw=args.sleep_uw, policy=args.policy, fast_forward=False)
+        counts = ('released', 'completed', 'missed', 'failed')
+        differences = [
+            name for name, stats in result.tasks.items()
+            if any(getattr(stats, key) != getattr(reference.tasks[name], key)
+                   for key in counts)]
+        print(f"\nEvent by event ({reference.elapsed_s:.2f} s): "
+              + (f"task counts differ for {', '.join(differences)}"
+                 if differences else "same task counts"))
+
+    print("\nMost jobs per hour the harvested power can sustain:")
+    for name, per_hour in sustainable_rates(
+            harvester, tasks, storage, args.sleep_uw).items():
+        task = next(t for t in tasks if t.name == name)
+        print(f"  {name:20s} {per_hour:10.1f}/h "
+              f"(now {3600.0 / task.period_s:.1f}/h)")
+
+
+if __name__ == "__main__":
+    main()
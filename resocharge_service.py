@@ -0,0 +1,526 @@
+# ResoCharge: Evaluation Service
+# Ask for harvested power over HTTP instead of importing the simulator
+#
+# What this does:
+# - Runs a small local HTTP/JSON server (asyncio, standard library only)
+# - POST /evaluate takes scenario definitions (the same dicts as the
+#   scenario files, or built-in names) and answers with harvested power,
+#   energy per day and device capabilities for each
+# - Collects requests that arrive within a few milliseconds of each
+#   other and evaluates them together in one batch engine call, so a
+#   burst of small requests costs about as much as one big one
+# - Pushes back when overloaded: at most max_queue requests wait for
+#   evaluation, anything beyond that gets "503 Service Unavailable" with
+#   a Retry-After header straight away instead of piling up
+# - GET /metrics reports request and scenario counts, throughput, batch
+#   sizes and latency percentiles; GET /health just says "ok"
+#
+# Example:
+#   python resocharge_service.py --port 8750
+#   curl -d '{"scenarios": ["urban", "rural"]}' localhost:8750/evaluate
+#
+#   # or from Python
+#   evaluate_remote('http://127.0.0.1:8750', ['urban', scenario_dict])
+#
+# A request body is one scenario dict, or {"scenarios": [...]} where
+# every item is a scenario dict or a built-in name ('urban', 'tower',
+# 'rural').  Add "details": true to also get every source x antenna
+# pair.  Results come back in request order: {"results": [...]}.
+# Infinite values (e.g. the charge time of a scenario that harvests
+# nothing) come back as null.
+
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from resocharge_engine import evaluate_harvesters, evaluate_totals, \
+    pack_harvesters
+from resocharge_montecarlo import QuantileSketch
+from resocharge_report import _json_safe
+from resocharge_scenarios import BUILTIN_SCENARIOS, ScenarioError, \
+    scenario_from_dict
+from resocharge_simulator import RFEnergyHarvester
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+
+# How long the first request of a batch waits for company
+DEFAULT_BATCH_WINDOW_S = 0.002
+
+# Most scenarios evaluated in one batch
+DEFAULT_MAX_BATCH = 1024
+
+# Most requests waiting for evaluation before new ones get a 503
+DEFAULT_MAX_QUEUE = 4096
+
+# Largest accepted request body and header block
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+# Throughput is reported over this many recent seconds
+RATE_WINDOW_S = 10
+
+_TOTAL_KEYS = ('total_received_uw', 'total_harvested_uw',
+               'total_harvested_mw', 'system_efficiency')
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """A request we answer with an HTTP error status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_request(data) -> Tuple[List[RFEnergyHarvester], bool]:
+    """
+    Harvesters and the details flag from a decoded /evaluate body
+
+    Raises ScenarioError for anything that isn't a valid scenario.
+    """
+    if not isinstance(data, dict):
+        raise ScenarioError("request: expected a JSON object")
+    data = dict(data)
+    details = bool(data.pop('details', False))
+    if 'scenarios' in data:
+        items = data.pop('scenarios')
+        if data:
+            raise ScenarioError(f"request: unknown key(s) "
+                                f"{', '.join(sorted(data))}")
+        if not isinstance(items, list):
+            raise ScenarioError("request: 'scenarios' must be a list")
+    else:
+        items = [data]
+
+    harvesters = []
+    for i, item in enumerate(items):
+        where = f"scenarios[{i}]"
+        if isinstance(item, str):
+            if item not in BUILTIN_SCENARIOS:
+                raise ScenarioError(f"{where}: unknown built-in scenario "
+                                    f"'{item}'")
+            harvesters.append(BUILTIN_SCENARIOS[item]())
+        elif isinstance(item, dict):
+            harvesters.append(scenario_from_dict(item, where))
+        else:
+            raise ScenarioError(f"{where}: expected a scenario object or "
+                                f"a built-in name")
+    return harvesters, details
+
+
+def evaluate_records(harvesters: Sequence[RFEnergyHarvester],
+                     details: Sequence[bool]) -> List[Dict]:
+    """
+    One result record per harvester (pairs only where details is set)
+
+    Harvesters with any sources and antennas are packed into one batch;
+    the totals match calculate_total_harvested_power exactly.
+    """
+    totals = {key: [0.0] * len(harvesters) for key in _TOTAL_KEYS}
+    pairs: Dict[int, List[Dict]] = {}
+    # Empty scenarios harvest nothing; leave them out of the batch
+    rows = [i for i, h in enumerate(harvesters)
+            if len(h.rf_sources) and len(h.antennas)]
+    detailed = [i for i in rows if details[i]]
+    plain = [i for i in rows if not details[i]]
+    if detailed:
+        results = evaluate_harvesters([harvesters[i] for i in detailed])
+        for i, result in zip(detailed, results):
+            pairs[i] = result['sources'].to_list()
+            for key in _TOTAL_KEYS:
+                totals[key][i] = result[key]
+    if plain:
+        evaluated = evaluate_totals(
+            pack_harvesters([harvesters[i] for i in plain]))
+        for key in _TOTAL_KEYS:
+            for i, value in zip(plain, evaluated[key].tolist()):
+                totals[key][i] = value
+
+    records = []
+    for i, harvester in enumerate(harvesters):
+        harvested_uw = totals['total_harvested_uw'][i]
+        energy = harvester.calculate_energy_per_day(harvested_uw)
+        charging = harvester.estimate_charging_capability(harvested_uw)
+        record = {'scenario': harvester.name}
+        record.update({key: totals[key][i] for key in _TOTAL_KEYS})
+        record.update({
+            'energy_per_day_mwh': energy['energy_per_day_mwh'],
+            'energy_per_day_j': energy['energy_per_day_j'],
+            'iphone_charge_time_days': charging['iphone_charge_time_days'],
+            'capabilities': charging['capabilities'],
+        })
+        if details[i]:
+            record['pairs'] = pairs.get(i, [])
+        records.append(record)
+    return records
+
+
+@dataclass
+class _Job:
+    """One /evaluate request waiting for its batch"""
+    harvesters: List[RFEnergyHarvester]
+    details: bool
+    future: asyncio.Future
+    received: float = field(default_factory=time.perf_counter)
+
+
+class ServiceMetrics:
+    """
+    Counters and latency percentiles of a running service
+
+    Latencies (milliseconds, from the request arriving to its answer
+    being ready) and batch sizes go into QuantileSketches, so memory
+    stays fixed however long the service runs.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.scenarios = 0
+        self.rejected = 0  # 503s
+        self.errors = 0  # Other 4xx / 5xx answers
+        self.batches = 0
+        self.latency_ms = QuantileSketch()
+        self.batch_scenarios = QuantileSketch()
+        self.evaluate_s = 0.0
+        # Requests answered in each of the last RATE_WINDOW_S seconds
+        self._recent = deque(maxlen=RATE_WINDOW_S + 1)
+
+    def answered(self, latency_s: float, scenarios: int):
+        self.requests += 1
+        self.scenarios += scenarios
+        self.latency_ms.add([latency_s * 1000.0])
+        second = int(time.time())
+        if self._recent and self._recent[-1][0] == second:
+            self._recent[-1][1] += 1
+        else:
+            self._recent.append([second, 1])
+
+    def batch(self, scenarios: int, elapsed_s: float):
+        self.batches += 1
+        self.batch_scenarios.add([scenarios])
+        self.evaluate_s += elapsed_s
+
+    def snapshot(self, queued: int = 0) -> Dict:
+        """Everything as a JSON-ready dict"""
+        uptime = time.time() - self.started
+        now = int(time.time())
+        # Whole seconds only: the current one is still filling up
+        recent = sum(count for second, count in self._recent
+                     if now - RATE_WINDOW_S <= second < now)
+        window = min(RATE_WINDOW_S, max(int(uptime), 1))
+
+        def quantiles(sketch):
+            return {name: sketch.quantile(q) if sketch.count else None
+                    for name, q in (('p50', 0.5), ('p90', 0.9),
+                                    ('p99', 0.99), ('max', 1.0))}
+
+        return {
+            'uptime_s': uptime,
+            'requests': self.requests,
+            'scenarios': self.scenarios,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'queued': queued,
+            'batches': self.batches,
+            'requests_per_s': recent / window,
+            'mean_requests_per_s': self.requests / uptime if uptime else 0,
+            'latency_ms': quantiles(self.latency_ms),
+            'batch_scenarios': quantiles(self.batch_scenarios),
+            'evaluate_s': self.evaluate_s,
+        }
+
+
+class EvaluationService:
+    """
+    The HTTP service and its batching loop
+
+    Think of this as a lift that doesn't leave the moment the first
+    person steps in: it waits batch_window_s for others (or until
+    max_batch scenarios are aboard), then takes everyone up in one
+    trip.  While a batch is being evaluated the next one fills up.
+    The waiting area holds max_queue requests; when it's full, new
+    arrivals are told to come back later (503).
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 batch_window_s: float = DEFAULT_BATCH_WINDOW_S,
+                 max_batch: int = DEFAULT_MAX_BATCH,
+                 max_queue: int = DEFAULT_MAX_QUEUE):
+        self.host = host
+        self.port = port
+        self.batch_window_s = batch_window_s
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.metrics = ServiceMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._server = None
+        self._batcher = None
+
+    # Starting and stopping --------------------------------------------------
+
+    async def start(self):
+        """Start listening (port 0 picks a free port, see self.port)"""
+        self._queue = asyncio.Queue(self.max_queue)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_server(
+            self._connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening and fail any requests still waiting"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(
+                    RequestError(503, "service shutting down"))
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"ResoCharge service on http://{self.host}:{self.port}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    # Batching ---------------------------------------------------------------
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self._queue.get()]
+            scenarios = len(jobs[0].harvesters)
+            deadline = loop.time() + self.batch_window_s
+            while scenarios < self.max_batch:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        job = await asyncio.wait_for(self._queue.get(),
+                                                     remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    job = self._queue.get_nowait()
+                jobs.append(job)
+                scenarios += len(job.harvesters)
+
+            harvesters = [h for job in jobs for h in job.harvesters]
+            details = [job.details for job in jobs
+                       for _ in job.harvesters]
+            started = time.perf_counter()
+            try:
+                # In a thread, so the loop keeps accepting (and
+                # queueing) requests meanwhile
+                records = await loop.run_in_executor(
+                    None, evaluate_records, harvesters, details)
+            except Exception as error:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(
+                            RequestError(500, f"evaluation failed: "
+                                              f"{error}"))
+                continue
+            self.metrics.batch(len(harvesters),
+                               time.perf_counter() - started)
+
+            start = 0
+            for job in jobs:
+                stop = start + len(job.harvesters)
+                if not job.future.done():  # Client may have gone
+                    job.future.set_result(records[start:stop])
+                start = stop
+
+    # HTTP -------------------------------------------------------------------
+
+    async def _connection(self, reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter):
+        """Answer requests on one connection until it closes"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except RequestError as error:
+                    await self._respond(writer, error.status,
+                                        {'error': str(error)}, close=True)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                status, payload, headers = await self._handle(
+                    method, path, body)
+                await self._respond(writer, status, payload,
+                                    close=not keep_alive, headers=headers)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        """(method, path, body, keep-alive) or None at end of stream"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as error:
+            if error.partial.strip():
+                raise RequestError(400, "incomplete request") from None
+            return None
+        except asyncio.LimitOverrunError:
+            raise RequestError(413, "request headers too large") from None
+        if len(head) > MAX_HEADER_BYTES:
+            raise RequestError(413, "request headers too large")
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, path, version = lines[0].split(' ')
+        except ValueError:
+            raise RequestError(400, "malformed request line") from None
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError(400, "bad Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, f"body larger than {MAX_BODY_BYTES} "
+                                    f"bytes")
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+            else connection == 'keep-alive'
+        return method, path.split('?', 1)[0], body, keep_alive
+
+    async def _handle(self, method: str, path: str, body: bytes):
+        """(status, JSON payload, extra headers) for one request"""
+        if path == '/evaluate':
+            if method != 'POST':
+                return self._error(405, "use POST")
+            return await self._evaluate(body)
+        if path in ('/metrics', '/health'):
+            if method != 'GET':
+                return self._error(405, "use GET")
+            if path == '/health':
+                return 200, {'status': 'ok'}, None
+            return 200, self.metrics.snapshot(self._queue.qsize()), None
+        return self._error(404, f"no such endpoint: {path}")
+
+    def _error(self, status: int, message: str):
+        self.metrics.errors += 1
+        return status, {'error': message}, None
+
+    async def _evaluate(self, body: bytes):
+        received = time.perf_counter()
+        try:
+            harvesters, details = parse_request(json.loads(body))
+        except json.JSONDecodeError as error:
+            return self._error(400, f"invalid JSON: {error}")
+        except (ScenarioError, TypeError, ValueError) as error:
+            return self._error(400, str(error))
+        if not harvesters:
+            return 200, {'results': []}, None
+
+        job = _Job(harvesters, details,
+                   asyncio.get_running_loop().create_future(), received)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            return 503, {'error': "too many requests waiting, retry "
+                                  "shortly"}, {'Retry-After': '1'}
+        try:
+            records = await job.future
+        except RequestError as error:
+            return self._error(error.status, str(error))
+        self.metrics.answered(time.perf_counter() - received,
+                              len(harvesters))
+        return 200, {'results': records}, None
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int,
+                       payload: Dict, close: bool = False,
+                       headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(_json_safe(payload), ensure_ascii=False,
+                          allow_nan=False).encode('utf-8')
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}",
+                 "Content-Type: application/json",
+                 f"Content-Length: {len(body)}"]
+        if close:
+            lines.append("Connection: close")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+                     + body)
+        await writer.drain()
+
+
+def evaluate_remote(url: str, scenarios: Sequence, details: bool = False,
+                    timeout: float = 30.0) -> List[Dict]:
+    """
+    Evaluate scenarios on a running service (blocking client)
+
+    scenarios are scenario dicts or built-in names; raises
+    urllib.error.HTTPError for error answers (503 when overloaded).
+    """
+    body = json.dumps({'scenarios': list(scenarios),
+                       'details': details}).encode('utf-8')
+    request = urllib.request.Request(
+        url.rstrip('/') + '/evaluate', data=body,
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())['results']
+
+
+def main():
+    """Run the service until interrupted"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge evaluation service (HTTP/JSON)')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--window-ms', type=float,
+                        default=DEFAULT_BATCH_WINDOW_S * 1000,
+                        help='how long a batch waits for more requests')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help='most scenarios per batch')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='waiting requests before answering 503')
+    args = parser.parse_args()
+
+    service = EvaluationService(args.host, args.port,
+                                batch_window_s=args.window_ms / 1000,
+                                max_batch=args.max_batch,
+                                max_queue=args.max_queue)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,44 @@
 # - Shows what devices we could theoretically power
 # - Compares different locations (urban, near tower, rural)
 
-import matplotlib.pyplot as plt
-from dataclasses import dataclass
-from typing import List, Dict, Optional
+import io
+import numpy as np
+import math
+from bisect import bisect_left, bisect_right
+from dataclasses import MISSING, dataclass, fields
+from typing import Iterable, List, Dict, Optional, Sequence, Tuple
+
+from resocharge_results import HarvestResult, pair_totals
+
+# Battery used for the "how long to charge a phone" estimate
+IPHONE_BATTERY_WH = 12.16  # iPhone 14 Pro
+
+# Device power requirements in mW (approximate), used to judge what the
+# harvested power can run
+DEVICE_POWER_REQUIREMENTS_MW = {
+    'Temperature sensor': 0.01,  # 10 μW
+    'E-ink display (static)': 0.05,  # 50 μW
+    'Low-power MCU (sleep)': 0.001,  # 1 μW
+    'Low-power MCU (active)': 1.0,  # 1 mW
+    'LED (dimmed)': 5.0,  # 5 mW
+    'Bluetooth LE transmit': 10.0,  # 10 mW
+    'WiFi transmit': 100.0,  # 100 mW
+    'iPhone charging': 5000.0  # 5W
+}
+
+# Below this fraction of the requirement a device can't even be duty
+# cycled usefully ('No' instead of 'Partial')
+PARTIAL_POWER_FRACTION = 0.1
+
+# How received power reaches the rectifier curve:
+#   'pair'    - every source x antenna pair is rectified on its own
+#   'antenna' - each antenna's rectifier sees the sum of all the sources
+#               in its band (a better point on the efficiency curve)
+#   'chain'   - antennas with the same rectifier_chain share one
+#               rectifier that sees all their power together
+# In the combined modes the harvested power is handed back to the
+# sources in proportion to what each contributed.
+RECTIFICATION_MODES = ('pair', 'antenna', 'chain')
 
 
 @dataclass
@@ -42,6 +77,443 @@ class AntennaConfig:
     frequency_mhz: float  # What frequency this antenna is tuned to
     effective_area_m2: float  # How big the antenna is (bigger = more power)
     efficiency: float  # How good it is at catching signals (0.0 to 1.0)
+    # How far off-tune a source can be and still be caught (0.15 = ±15%)
+    tolerance: float = 0.15
+    # Sharpness of the resonance for the wideband spectrum model
+    # (resocharge_spectrum); 0 = derive it from tolerance, so the
+    # half-power points sit at ±tolerance (Q = 1 / (2 × tolerance))
+    q_factor: float = 0.0
+    # Rectifier this antenna feeds in 'chain' rectification mode:
+    # antennas with the same number share one; negative = its own
+    rectifier_chain: int = -1
+
+
+def _column_dtype(field_type):
+    """NumPy dtype for a dataclass field: floats get a float64 column,
+    anything else (names, optional values) an object column"""
+    return np.float64 if field_type in (float, int) else object
+
+
+def _row_view_class(row_class, class_name: str):
+    """
+    Make a class whose objects look like row_class but live in a table
+
+    Every dataclass field becomes a property that reads from (and
+    writes to) the table's column, so code written for RFSource or
+    AntennaConfig objects keeps working on table rows.  The class is a
+    subclass of row_class, so isinstance(view, RFSource) holds.
+    Calling it (as dataclasses.replace does), copying or pickling a
+    view gives a standalone row_class object instead of another view.
+    """
+    def column_property(name):
+        def get(self):
+            # .item() hands back a plain Python value (float, str, ...)
+            return self._table._columns[name].item(self._index)
+
+        def set(self, value):
+            self._table._columns[name][self._index] = value
+            self._table.version += 1
+        return property(get, set)
+
+    names = [f.name for f in fields(row_class)]
+    namespace = {
+        '__slots__': ('_table', '_index'),
+        '__doc__': f"One row of a table, used like a {row_class.__name__}",
+        '_fields': tuple(names),
+    }
+    for name in names:
+        namespace[name] = column_property(name)
+
+    def __new__(cls, *args, **kwargs):
+        return row_class(*args, **kwargs)
+
+    def _at(cls, table, index):
+        view = object.__new__(cls)
+        object.__setattr__(view, '_table', table)
+        object.__setattr__(view, '_index', index)
+        return view
+
+    def __setattr__(self, name, value):
+        # row_class objects have a __dict__; keep typos from landing there
+        if name not in names:
+            raise AttributeError(f"{row_class.__name__} has no field "
+                                 f"{name!r}")
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return row_class, tuple(getattr(self, n) for n in names)
+
+    def __eq__(self, other):
+        if not hasattr(other, '__dataclass_fields__') and \
+                not isinstance(other, view_class):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n, None)
+                   for n in names)
+
+    def __repr__(self):
+        values = ", ".join(f"{n}={getattr(self, n)!r}" for n in names)
+        return f"{row_class.__name__}({values})"
+
+    namespace.update(__new__=__new__, _at=classmethod(_at),
+                     __setattr__=__setattr__, __reduce__=__reduce__,
+                     __eq__=__eq__, __repr__=__repr__, __hash__=None)
+    view_class = type(class_name, (row_class,), namespace)
+    return view_class
+
+
+class _RecordTable:
+    """
+    A list of dataclass records stored column by column
+
+    Think of this as a spreadsheet instead of a stack of index cards:
+    one NumPy array per field (all frequencies together, all areas
+    together, ...).  A million sources then take a few tens of MB
+    instead of hundreds, and array code can read a whole column at once.
+
+    It behaves like a list: append, extend, len, indexing, slicing,
+    iteration, del and pop all work.  Indexing returns a row view that
+    looks like the dataclass and writes straight into the table.
+    Appending is amortized O(1) - the arrays double in size when full.
+    """
+
+    _row_class = None  # The dataclass stored (set by subclasses)
+    _view_class = None  # Row view class (set by subclasses)
+
+    def __init__(self, rows: Iterable = ()):
+        self._fields = [(f.name, _column_dtype(f.type))
+                        for f in fields(self._row_class)]
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in self._fields}
+        self._size = 0
+        self.version = 0  # Goes up on every change
+        self.extend(rows)
+
+    @classmethod
+    def from_arrays(cls, **columns):
+        """
+        Wrap existing arrays as a table without copying them
+
+        Pass one array per field (all the same length).  Float arrays
+        that are already float64 are used as they are (zero-copy);
+        fields left out get their dataclass default.  The arrays are
+        copied only if the table later has to grow.
+        """
+        table = cls()
+        sizes = {len(column) for column in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError("All columns must have the same length")
+        size = sizes.pop() if sizes else 0
+        for f in fields(cls._row_class):
+            if f.name in columns:
+                column = np.asarray(columns.pop(f.name),
+                                    dtype=_column_dtype(f.type))
+            elif f.default is not MISSING:
+                column = np.full(size, f.default,
+                                 dtype=_column_dtype(f.type))
+            else:
+                raise ValueError(f"Missing column: {f.name}")
+            table._columns[f.name] = column
+        if columns:
+            raise ValueError(f"Unknown columns: {sorted(columns)}")
+        table._size = size
+        return table
+
+    def _reserve(self, size: int):
+        """Make sure the arrays can hold size rows"""
+        capacity = len(self._columns[self._fields[0][0]])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name, dtype in self._fields:
+            column = np.empty(capacity, dtype=dtype)
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _position(self, index: int) -> int:
+        """Turn a (possibly negative) index into a row number"""
+        position = index + self._size if index < 0 else index
+        if not 0 <= position < self._size:
+            raise IndexError("table index out of range")
+        return position
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._view_class._at(self, i)
+                    for i in range(*index.indices(self._size))]
+        return self._view_class._at(self, self._position(index))
+
+    def __setitem__(self, index: int, row):
+        position = self._position(index)
+        for name, _ in self._fields:
+            self._columns[name][position] = getattr(row, name)
+        self.version += 1
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            rows = np.arange(self._size)[index]
+        else:
+            rows = self._position(index)
+        for name, _ in self._fields:
+            self._columns[name] = np.delete(
+                self._columns[name][:self._size], rows)
+        self._size = len(self._columns[self._fields[0][0]])
+        self.version += 1
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._view_class._at(self, i)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_list()!r})"
+
+    def append(self, row):
+        """Add one row (values are copied into the table)"""
+        self._reserve(self._size + 1)
+        for name, _ in self._fields:
+            self._columns[name][self._size] = getattr(row, name)
+        self._size += 1
+        self.version += 1
+
+    def extend(self, rows: Iterable):
+        """Add many rows"""
+        for row in rows:
+            self.append(row)
+
+    def pop(self, index: int = -1):
+        """Remove a row and return it as a standalone dataclass"""
+        row = self.row(index)
+        del self[index]
+        return row
+
+    def clear(self):
+        """Remove all rows"""
+        self._size = 0
+        self.version += 1
+
+    def row(self, index: int):
+        """A standalone dataclass copy of one row"""
+        position = self._position(index)
+        return self._row_class(*[self._columns[name].item(position)
+                                 for name, _ in self._fields])
+
+    def to_list(self) -> list:
+        """All rows as standalone dataclass objects"""
+        columns = [self._columns[name][:self._size].tolist()
+                   for name, _ in self._fields]
+        return [self._row_class(*values) for values in zip(*columns)]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Read-only array of one field for all rows (no copy)
+
+        Use set_column to change a whole column at once.
+        """
+        column = self._columns[name][:self._size].view()
+        column.flags.writeable = False
+        return column
+
+    def set_column(self, name: str, values):
+        """Replace the values of one field for all rows"""
+        self._columns[name][:self._size] = values
+        self.version += 1
+
+
+class RFSourceTable(_RecordTable):
+    """
+    Columnar collection of RF sources (see _RecordTable)
+
+    Example: 10^6 sources from a spectrum survey, built zero-copy:
+        RFSourceTable.from_arrays(name=names, frequency_mhz=freqs,
+                                  power_density_uw_per_m2=densities,
+                                  availability=availability)
+    """
+    _row_class = RFSource
+    _view_class = _row_view_class(RFSource, 'RFSourceView')
+
+
+class AntennaTable(_RecordTable):
+    """Columnar collection of antennas (see _RecordTable)"""
+    _row_class = AntennaConfig
+    _view_class = _row_view_class(AntennaConfig, 'AntennaView')
+
+
+class FrequencyIndex:
+    """
+    Sorted index of antenna frequency bands
+
+    Each antenna listens to a band: frequency ± tolerance.  Instead of
+    checking every source against every antenna, we cut the frequency
+    axis at every band edge and remember which antennas cover each
+    piece.  Finding the antennas for a source is then one binary search
+    (O(log A)) plus the k antennas that are actually returned.
+
+    Think of it like the index at the back of a book: look up the
+    frequency, get the list of pages (antennas) straight away.
+
+    Bands are widened by a hair so the index never misses a match;
+    callers still confirm candidates with the exact _frequency_match.
+    """
+
+    # Relative widening of every band (guards against rounding at edges)
+    EDGE_SLACK = 1e-9
+
+    def __init__(self, antennas: Sequence[AntennaConfig]):
+        self.key = self.antenna_key(antennas)
+        self.size = len(antennas)
+        # Antennas with odd settings (zero/negative/infinite frequency)
+        # can't be described by a band, so they are always checked
+        self.always_check: List[int] = []
+
+        bands = []
+        for i, (frequency, tolerance) in enumerate(self.key):
+            if not (math.isfinite(frequency) and frequency > 0):
+                self.always_check.append(i)
+            elif tolerance > 0 and math.isfinite(tolerance):
+                slack = 1.0 + self.EDGE_SLACK
+                bands.append((i,
+                              frequency * (1.0 - tolerance * slack),
+                              frequency * (1.0 + tolerance * slack)))
+
+        # Cut points and the antennas covering each piece between them
+        self.edges: List[float] = sorted(
+            {lo for _, lo, _ in bands} | {hi for _, _, hi in bands})
+        covers: List[List[int]] = [[] for _ in self.edges]
+        for i, lo, hi in bands:
+            first = bisect_left(self.edges, lo)
+            last = bisect_left(self.edges, hi)
+            for piece in range(first, last):
+                covers[piece].append(i)
+        if self.always_check:
+            covers = [sorted(c + self.always_check) for c in covers]
+        self.covers: List[Tuple[int, ...]] = [tuple(c) for c in covers]
+        self._outside = tuple(self.always_check)
+
+    @staticmethod
+    def antenna_key(
+            antennas: Sequence[AntennaConfig]) -> Tuple[Tuple[float, float]]:
+        """The antenna settings the index depends on"""
+        if isinstance(antennas, AntennaTable):
+            return tuple(zip(antennas.column('frequency_mhz').tolist(),
+                             antennas.column('tolerance').tolist()))
+        return tuple((a.frequency_mhz, a.tolerance) for a in antennas)
+
+    def query(self, frequency_mhz: float) -> Tuple[int, ...]:
+        """Indices of antennas whose band may contain this frequency"""
+        piece = bisect_right(self.edges, frequency_mhz) - 1
+        if 0 <= piece < len(self.covers):
+            return self.covers[piece]
+        return self._outside
+
+
+class RectifierCurve:
+    """
+    Precompiled rectifier efficiency curve (piecewise-linear)
+
+    The efficiency_at_power dict is sorted once, here, instead of on
+    every lookup.  Scalar lookups use binary search (O(log n)) and
+    efficiency_array() handles a whole NumPy array of powers in one call.
+
+    Below the first point and above the last point the curve is flat,
+    just like the original get_rectifier_efficiency.
+    """
+
+    def __init__(self, efficiency_at_power: Dict[float, float]):
+        self.power_levels: List[float] = sorted(efficiency_at_power.keys())
+        self.efficiencies: List[float] = [
+            efficiency_at_power[p] for p in self.power_levels]
+        self._power_array = np.array(self.power_levels, dtype=float)
+        self._efficiency_array = np.array(self.efficiencies, dtype=float)
+
+    def efficiency(self, input_power_uw: float) -> float:
+        """Efficiency at one input power level (binary search)"""
+        power_levels = self.power_levels
+
+        # Clamp below the first and above the last point
+        if input_power_uw <= power_levels[0]:
+            return self.efficiencies[0]
+        if input_power_uw >= power_levels[-1]:
+            return self.efficiencies[-1]
+
+        # Segment i has power_levels[i] < input <= power_levels[i + 1]
+        i = bisect_left(power_levels, input_power_uw) - 1
+        p1, p2 = power_levels[i], power_levels[i + 1]
+        if not p1 <= input_power_uw <= p2:
+            return 0.5  # Fallback (only reachable for NaN input)
+        e1, e2 = self.efficiencies[i], self.efficiencies[i + 1]
+        # Linear interpolation formula
+        return e1 + (e2 - e1) * (input_power_uw - p1) / (p2 - p1)
+
+    def efficiency_array(self, input_power_uw) -> np.ndarray:
+        """Efficiency for a whole array of input power levels at once"""
+        power = np.asarray(input_power_uw, dtype=float)
+        powers = self._power_array
+        effs = self._efficiency_array
+        if len(powers) == 1:
+            result = np.full(power.shape, effs[0])
+        else:
+            segment = np.clip(
+                np.searchsorted(powers, power, side='left') - 1,
+                0, len(powers) - 2)
+            p1, p2 = powers[segment], powers[segment + 1]
+            e1, e2 = effs[segment], effs[segment + 1]
+            # Same formula (and operation order) as the scalar lookup
+            result = e1 + (e2 - e1) * (power - p1) / (p2 - p1)
+        result = np.where(power >= powers[-1], effs[-1], result)
+        result = np.where(power <= powers[0], effs[0], result)
+        result = np.where(np.isnan(power), 0.5, result)
+        return result
+
+
+class _TrackedCurveDict(dict):
+    """
+    A dict that counts its own modifications
+
+    RectifierConfig stores efficiency_at_power in one of these, so the
+    compiled RectifierCurve knows when it has to be rebuilt.
+    """
+    version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._changed()
+        return result
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._changed()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self._changed()
+        return result
+
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self._changed()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
 
 
 @dataclass
@@ -62,6 +534,68 @@ class RectifierConfig:
     # How efficient at different power levels
     efficiency_at_power: Dict[float, float]
 
+    def __setattr__(self, name, value):
+        # Keep efficiency_at_power tracked even when it is replaced
+        if name == 'efficiency_at_power':
+            value = _TrackedCurveDict(value)
+            object.__setattr__(self, '_curve', None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def curve(self) -> RectifierCurve:
+        """
+        Compiled efficiency curve, built once and cached
+
+        Rebuilt automatically after efficiency_at_power is changed
+        (item assignment, update(), or replacing the whole dict).
+        """
+        points = self.efficiency_at_power
+        if self._curve is None or self._curve_version != points.version:
+            object.__setattr__(self, '_curve', RectifierCurve(points))
+            object.__setattr__(self, '_curve_version', points.version)
+        return self._curve
+
+
+def _same_state(state: tuple, previous: Optional[tuple]) -> bool:
+    """Same tables (by identity) at the same versions?"""
+    return previous is not None and all(
+        a is b or a == b for a, b in zip(state, previous))
+
+
+def _changed_rows(old: Dict[str, np.ndarray],
+                  new: Dict[str, np.ndarray]) -> np.ndarray:
+    """True for every row of new that differs from old (or is new)"""
+    size = len(next(iter(new.values())))
+    changed = np.ones(size, dtype=bool)
+    if not old:
+        return changed
+    common = min(size, len(next(iter(old.values()))))
+    same = np.ones(common, dtype=bool)
+    for name, column in new.items():
+        a, b = column[:common], old[name][:common]
+        equal = a == b
+        if a.dtype.kind == 'f':
+            equal |= np.isnan(a) & np.isnan(b)  # NaN counts as unchanged
+        same &= equal
+    changed[:common] = ~same
+    return changed
+
+
+def _maybe_matching(source_frequency_mhz: np.ndarray,
+                    antenna_frequency_mhz: float,
+                    tolerance: float) -> np.ndarray:
+    """
+    Which sources might match an antenna (a superset of the exact
+    _frequency_match test; unusual antennas check every source)
+    """
+    if not (math.isfinite(antenna_frequency_mhz) and
+            antenna_frequency_mhz > 0):
+        return np.ones(len(source_frequency_mhz), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        offset = np.abs(source_frequency_mhz - antenna_frequency_mhz)
+        return ~(offset / antenna_frequency_mhz >=
+                 tolerance * (1.0 + FrequencyIndex.EDGE_SLACK))
+
 
 class RFEnergyHarvester:
     """
@@ -80,25 +614,125 @@ class RFEnergyHarvester:
                  enable_resonance: bool = False):
         self.name = name
         # List of all RF sources around us
-        self.rf_sources: List[RFSource] = []
-        self.antennas: List[AntennaConfig] = []  # List of antennas we have
+        self.rf_sources = RFSourceTable()
+        self.antennas = AntennaTable()  # List of antennas we have
         self.rectifier: Optional[RectifierConfig] = None  # The AC→DC converter
         self.matching_efficiency: float = 0.90  # Antenna-rectifier matching
         self.filter_efficiency: float = 0.95  # Signal filtering efficiency
         self.enable_resonance: bool = enable_resonance  # Resonance enabled
         self.resonance_boost: float = 1.5 if enable_resonance else 1.0  # Boost
+        # 'pair', 'antenna' or 'chain' (see RECTIFICATION_MODES)
+        self.rectification_mode: str = 'pair'
+        # Frequency lookup table for the antennas (built when needed)
+        self._frequency_index: Optional[FrequencyIndex] = None
+        self._frequency_index_state: Optional[tuple] = None
+        # Configuration version: goes up whenever anything that changes
+        # the results changes (see calculate_total_harvested_power)
+        self.version: int = 0
+        # Remembered pair results, one dict per source row:
+        # {antenna column: (received_uw, rectifier_efficiency)}
+        # plus what they were computed from
+        self._pairs: List[Dict[int, Tuple[float, float]]] = []
+        self._table_state: Optional[tuple] = None
+        self._source_columns: Dict[str, np.ndarray] = {}
+        self._antenna_columns: Dict[str, np.ndarray] = {}
+        self._pair_boost: Optional[float] = None
+        self._pair_curve: Optional[RectifierCurve] = None
+        self._efficiency_key: Optional[Tuple[float, float]] = None
+        self._results: Optional[Dict] = None
+        self._results_version: int = -1
+
+    @property
+    def rf_sources(self) -> RFSourceTable:
+        """All RF sources around us (a list of RFSource also works when
+        assigning; it is converted to a table)"""
+        return self._rf_sources
+
+    @rf_sources.setter
+    def rf_sources(self, sources: Iterable[RFSource]):
+        if not isinstance(sources, RFSourceTable):
+            sources = RFSourceTable(sources)
+        self._rf_sources = sources
+
+    @property
+    def antennas(self) -> AntennaTable:
+        """All antennas (a list of AntennaConfig also works when
+        assigning; it is converted to a table)"""
+        return self._antennas
+
+    @antennas.setter
+    def antennas(self, antennas: Iterable[AntennaConfig]):
+        if not isinstance(antennas, AntennaTable):
+            antennas = AntennaTable(antennas)
+        self._antennas = antennas
+
+    def clone(self, rf_sources: Optional[Iterable[RFSource]] = None,
+              antennas: Optional[Iterable[AntennaConfig]] = None
+              ) -> 'RFEnergyHarvester':
+        """
+        A new harvester with the same settings (name, rectifier,
+        efficiencies, resonance, rectification mode)
+
+        Sources and antennas are the ones given, or else this
+        harvester's tables, shared rather than copied.  The copy starts
+        with an empty result cache.
+        """
+        copy = RFEnergyHarvester(self.name, self.enable_resonance)
+        copy.rf_sources = self.rf_sources if rf_sources is None \
+            else rf_sources
+        copy.antennas = self.antennas if antennas is None else antennas
+        copy.rectifier = self.rectifier
+        copy.matching_efficiency = self.matching_efficiency
+        copy.filter_efficiency = self.filter_efficiency
+        copy.resonance_boost = self.resonance_boost
+        copy.rectification_mode = self.rectification_mode
+        return copy
 
     def add_rf_source(self, source: RFSource):
-        """Add an RF energy source to the environment"""
+        """
+        Add an RF energy source to the environment
+
+        The values are copied into the harvester's source table: change
+        them later through harvester.rf_sources[i], not through source.
+        """
         self.rf_sources.append(source)
+        self.version += 1
 
     def add_antenna(self, antenna: AntennaConfig):
-        """Add an antenna to the harvester"""
+        """
+        Add an antenna to the harvester
+
+        The values are copied in: change them later through
+        harvester.antennas[i], not through antenna.
+        """
         self.antennas.append(antenna)
+        self._frequency_index = None  # Rebuild on next lookup
+        self.version += 1
 
     def set_rectifier(self, rectifier: RectifierConfig):
         """Configure the rectifier"""
         self.rectifier = rectifier
+        self.version += 1
+
+    @property
+    def frequency_index(self) -> FrequencyIndex:
+        """
+        Frequency index over the current antennas
+
+        Rebuilt whenever antennas are added, removed or retuned
+        (checking that is O(A), much cheaper than matching every pair,
+        and skipped entirely while the antenna table is unchanged).
+        """
+        state = (self.antennas, self.antennas.version)
+        index = self._frequency_index
+        if index is not None and _same_state(
+                state, self._frequency_index_state):
+            return index
+        if index is None or index.key != FrequencyIndex.antenna_key(
+                self.antennas):
+            index = self._frequency_index = FrequencyIndex(self.antennas)
+        self._frequency_index_state = state
+        return index
 
     def calculate_received_power(
             self,
@@ -114,7 +748,8 @@ class RFEnergyHarvester:
         # Check if antenna frequency matches the source (like tuning a radio)
         if not self._frequency_match(
                 source.frequency_mhz,
-                antenna.frequency_mhz):
+                antenna.frequency_mhz,
+                antenna.tolerance):
             return 0.0  # Wrong frequency = no power received
 
         # Calculate received power using physics formula
@@ -144,6 +779,7 @@ class RFEnergyHarvester:
 
         tolerance = 0.15 means we allow ±15% difference
         Example: Antenna at 2450 MHz works for 2082-2817 MHz
+        (each AntennaConfig carries its own tolerance, 0.15 by default)
         """
         return abs(source_freq - antenna_freq) / antenna_freq < tolerance
 
@@ -162,75 +798,226 @@ class RFEnergyHarvester:
         if not self.rectifier:
             return 0.5  # Default 50% if no rectifier configured
 
-        # Get the predefined power levels and their efficiencies
-        power_levels = sorted(self.rectifier.efficiency_at_power.keys())
+        # The compiled curve sorts the power levels once and then uses
+        # binary search to find the two closest levels to interpolate
+        return self.rectifier.curve.efficiency(input_power_uw)
+
+    def _pair(self, source: RFSource,
+              antenna: AntennaConfig) -> Optional[Tuple[float, float]]:
+        """(received μW, rectifier efficiency) of one pair, or None if
+        the antenna catches nothing from the source"""
+        received_power = self.calculate_received_power(source, antenna)
+        if received_power > 0:
+            return received_power, self.get_rectifier_efficiency(
+                received_power)
+        return None
+
+    def _refresh_pairs(self):
+        """
+        Bring the remembered pair results up to date
 
-        # If power is below lowest level, use lowest efficiency
-        if input_power_uw <= power_levels[0]:
-            return self.rectifier.efficiency_at_power[power_levels[0]]
-        # If power is above highest level, use highest efficiency
-        if input_power_uw >= power_levels[-1]:
-            return self.rectifier.efficiency_at_power[power_levels[-1]]
+        Like a spreadsheet that only recalculates the cells whose inputs
+        changed: each source (row) and antenna (column) is compared with
+        what the cached pairs were computed from, and only changed rows
+        and columns are worked out again.  This also catches sources and
+        antennas that were edited directly instead of through add_*.
+        """
+        sources, antennas = self.rf_sources, self.antennas
+        table_state = (sources, sources.version,
+                       antennas, antennas.version)
+        curve = self.rectifier.curve if self.rectifier else None
+        efficiency_key = (self.matching_efficiency, self.filter_efficiency,
+                          self.rectification_mode)
+        if (_same_state(table_state, self._table_state) and
+                self.resonance_boost == self._pair_boost and
+                curve is self._pair_curve and
+                efficiency_key == self._efficiency_key):
+            return  # Nothing changed
+
+        self.version += 1
+        self._efficiency_key = efficiency_key
+        self._table_state = table_state
+        source_columns = {name: sources.column(name).copy()
+                          for name in ('name', 'frequency_mhz',
+                                       'power_density_uw_per_m2',
+                                       'availability')}
+        antenna_columns = {name: antennas.column(name).copy()
+                           for name in ('frequency_mhz',
+                                        'effective_area_m2', 'efficiency',
+                                        'tolerance')}
+
+        if self.resonance_boost != self._pair_boost:
+            # The boost scales every received power: start over
+            self._pairs = []
+            self._source_columns, self._antenna_columns = {}, {}
+            self._pair_boost = self.resonance_boost
+        elif curve is not self._pair_curve:
+            # New rectifier: received powers stay, efficiencies don't
+            for row in self._pairs:
+                for column, (received_power, _) in row.items():
+                    row[column] = (received_power,
+                                   self.get_rectifier_efficiency(
+                                       received_power))
+        self._pair_curve = curve
+
+        changed_rows = _changed_rows(self._source_columns, source_columns)
+        stale_columns = _changed_rows(self._antenna_columns,
+                                      antenna_columns)
+        pairs = self._pairs[:len(sources)]
+        kept_rows = np.nonzero(~changed_rows[:len(pairs)])[0]
+
+        if len(self._antenna_columns.get('frequency_mhz', ())) > \
+                len(antennas):
+            # Antennas were removed: forget their columns
+            for row in kept_rows:
+                pair_row = pairs[row]
+                for column in [c for c in pair_row if c >= len(antennas)]:
+                    del pair_row[column]
+
+        # Plain dataclass copies are much quicker to read than row views
+        # when the same antenna is used for many pairs
+        antenna_rows = antennas.to_list()
+
+        # Changed antennas: only the kept rows it may match (before or
+        # after the change) need a look
+        frequencies = source_columns['frequency_mhz'][kept_rows]
+        for column in np.nonzero(stale_columns)[0]:
+            antenna = antenna_rows[column]
+            rows = _maybe_matching(frequencies, antenna.frequency_mhz,
+                                   antenna.tolerance)
+            old = self._antenna_columns
+            if column < len(old.get('frequency_mhz', ())):
+                rows |= _maybe_matching(frequencies,
+                                        old['frequency_mhz'][column],
+                                        old['tolerance'][column])
+            for row in kept_rows[rows]:
+                pair = self._pair(sources.row(row), antenna)
+                if pair is None:
+                    pairs[row].pop(column, None)
+                else:
+                    pairs[row][column] = pair
+
+        # New or changed sources: redo the whole row
+        index = self.frequency_index
+        pairs.extend({} for _ in range(len(sources) - len(pairs)))
+        for row in np.nonzero(changed_rows)[0]:
+            source = sources.row(row)
+            pair_row = {}
+            for column in index.query(source.frequency_mhz):
+                pair = self._pair(source, antenna_rows[column])
+                if pair is not None:
+                    pair_row[column] = pair
+            pairs[row] = pair_row
+
+        self._pairs = pairs
+        self._source_columns = source_columns
+        self._antenna_columns = antenna_columns
 
-        # Otherwise, interpolate between two closest power levels
-        for i in range(len(power_levels) - 1):
-            if power_levels[i] <= input_power_uw <= power_levels[i + 1]:
-                p1, p2 = power_levels[i], power_levels[i + 1]
-                e1 = self.rectifier.efficiency_at_power[p1]
-                e2 = self.rectifier.efficiency_at_power[p2]
-                # Linear interpolation formula
-                return e1 + (e2 - e1) * (input_power_uw - p1) / (p2 - p1)
+    def calculate_total_harvested_power(self) -> Dict:
+        """
+        Calculate total harvested power from all sources
+
+        results['sources'] is a HarvestResult: the source x antenna
+        pairs as read-only columns, also usable as a list of dicts.
+        Results are remembered: asking again without changing anything
+        returns a copy of the last answer, and after a small edit (one
+        more source, a retuned antenna, a new rectifier) only the
+        affected source x antenna pairs are recomputed.
+        """
+        self._refresh_pairs()
+        if self._results is None or self._results_version != self.version:
+            self._results = self._assemble_results()
+            self._results_version = self.version
 
-        return 0.5  # Fallback
+        # A copy of the dict, so callers can't change the remembered
+        # results (the pair columns are read-only and can be shared)
+        return dict(self._results)
 
-    def calculate_total_harvested_power(self) -> Dict:
-        """Calculate total harvested power from all sources"""
-        results = {
-            'sources': [],
-            'total_received_uw': 0.0,
-            'total_harvested_uw': 0.0,
-            'total_harvested_mw': 0.0,
-            'system_efficiency': 0.0
-        }
+    def rectifier_groups(self) -> Optional[np.ndarray]:
+        """
+        Which rectifier each antenna feeds (group numbers), or None in
+        'pair' mode where every pair has its own
+        """
+        mode = self.rectification_mode
+        if mode not in RECTIFICATION_MODES:
+            raise ValueError(f"rectification_mode must be one of "
+                             f"{RECTIFICATION_MODES}, not {mode!r}")
+        if mode == 'pair':
+            return None
+        count = len(self.antennas)
+        if mode == 'antenna':
+            return np.arange(count)
+        # Antennas without a chain get a key of their own (negative,
+        # so it can't clash with a real chain number)
+        chains = self.antennas.column('rectifier_chain')
+        keys = np.where(chains >= 0, chains, -1.0 - np.arange(count))
+        return np.unique(keys, return_inverse=True)[1].reshape(count)
+
+    def _shared_rectifier_efficiencies(
+            self, groups: np.ndarray) -> List[float]:
+        """
+        Rectifier efficiency of each antenna when its rectifier sees the
+        combined power of its group
 
-        total_received = 0.0
-
-        # Calculate power from each source through each antenna
-        for source in self.rf_sources:
-            for antenna in self.antennas:
-                received_power = self.calculate_received_power(source, antenna)
-                if received_power > 0:
-                    total_received += received_power
-
-                    # Calculate conversion efficiency
-                    rectifier_eff = self.get_rectifier_efficiency(
-                        received_power)
-
-                    # Total efficiency chain
-                    total_eff = (antenna.efficiency *
-                                 self.matching_efficiency *
-                                 rectifier_eff *
-                                 self.filter_efficiency)
-
-                    harvested_power = received_power * total_eff
-
-                    results['sources'].append({
-                        'source': source.name,
-                        'frequency_mhz': source.frequency_mhz,
-                        'received_uw': received_power,
-                        'harvested_uw': harvested_power,
-                        'efficiency': total_eff
-                    })
-
-        results['total_received_uw'] = total_received
-        results['total_harvested_uw'] = sum(
-            s['harvested_uw'] for s in results['sources'])
+        Two grouped sums, both linear in the number of pairs: received
+        power per antenna (sources in order), then per group (antennas
+        in order) - the same order the batch engine adds them in.
+        """
+        antenna_received = [0.0] * len(self.antennas)
+        for pair_row in self._pairs:
+            for antenna_index, (received_power, _) in pair_row.items():
+                antenna_received[antenna_index] += received_power
+        group_received = [0.0] * (int(groups.max()) + 1 if len(groups)
+                                  else 0)
+        group_list = groups.tolist()
+        for antenna_index, group in enumerate(group_list):
+            group_received[group] += antenna_received[antenna_index]
+        group_efficiency = [self.get_rectifier_efficiency(power)
+                            for power in group_received]
+        return [group_efficiency[group] for group in group_list]
+
+    def _assemble_results(self) -> Dict:
+        """Build the results dict from the remembered pairs"""
+        groups = self.rectifier_groups()
+
+        # Go through each source and each antenna in order, exactly as
+        # if every pair had just been calculated
+        source_index, antenna_index = [], []
+        received, rectifier_eff = [], []
+        for row, pair_row in enumerate(self._pairs):
+            for column in sorted(pair_row):
+                received_power, efficiency = pair_row[column]
+                source_index.append(row)
+                antenna_index.append(column)
+                received.append(received_power)
+                rectifier_eff.append(efficiency)
+        antenna_index = np.array(antenna_index, dtype=np.int64)
+        received = np.array(received, dtype=np.float64)
+        if groups is None:
+            rectifier_eff = np.array(rectifier_eff, dtype=np.float64)
+        else:
+            rectifier_eff = np.array(
+                self._shared_rectifier_efficiencies(groups),
+                dtype=np.float64)[antenna_index]
+
+        # Total efficiency chain (multiplied in the same order as a
+        # scalar expression, so every pair keeps its exact value)
+        total_eff = (self.antennas.column('efficiency')[antenna_index] *
+                     self.matching_efficiency *
+                     rectifier_eff *
+                     self.filter_efficiency)
+        sources = HarvestResult(
+            source_index, antenna_index, received, received * total_eff,
+            total_eff, self.rf_sources.column('name'),
+            self.rf_sources.column('frequency_mhz'))
+
+        results = {'sources': sources, **pair_totals(sources)}
         results['total_harvested_mw'] = results['total_harvested_uw'] / 1000.0
-
-        if total_received > 0:
+        results['system_efficiency'] = 0.0
+        if results['total_received_uw'] > 0:
             results['system_efficiency'] = (
-                results['total_harvested_uw'] / total_received
-            )
+                results['total_harvested_uw'] /
+                results['total_received_uw'])
 
         return results
 
@@ -255,34 +1042,21 @@ class RFEnergyHarvester:
         """Estimate what can be powered or charged"""
         power_mw = harvested_power_uw / 1000.0
 
-        # Device power requirements (approximate)
-        devices = {
-            'Temperature sensor': 0.01,  # 10 μW
-            'E-ink display (static)': 0.05,  # 50 μW
-            'Low-power MCU (sleep)': 0.001,  # 1 μW
-            'Low-power MCU (active)': 1.0,  # 1 mW
-            'LED (dimmed)': 5.0,  # 5 mW
-            'Bluetooth LE transmit': 10.0,  # 10 mW
-            'WiFi transmit': 100.0,  # 100 mW
-            'iPhone charging': 5000.0  # 5W
-        }
-
         capabilities = {}
-        for device, required_mw in devices.items():
+        for device, required_mw in DEVICE_POWER_REQUIREMENTS_MW.items():
             if power_mw >= required_mw:
                 capabilities[device] = 'Yes - Continuous'
-            elif power_mw >= required_mw * 0.1:
+            elif power_mw >= required_mw * PARTIAL_POWER_FRACTION:
                 duty_cycle = (power_mw / required_mw) * 100
-                capabilities[device] = f'Partial - {
-                    duty_cycle:.1f}% duty cycle'
+                capabilities[device] = (
+                    f'Partial - {duty_cycle:.1f}% duty cycle')
             else:
                 capabilities[device] = 'No'
 
         # iPhone charging time
-        iphone_battery_wh = 12.16  # iPhone 14 Pro
         energy_per_day = self.calculate_energy_per_day(harvested_power_uw)
         days_to_charge = (
-            iphone_battery_wh / energy_per_day['energy_per_day_wh']
+            IPHONE_BATTERY_WH / energy_per_day['energy_per_day_wh']
             if energy_per_day['energy_per_day_wh'] > 0
             else float('inf')
         )
@@ -295,12 +1069,26 @@ class RFEnergyHarvester:
 
     def generate_report(self) -> str:
         """Generate a comprehensive report"""
-        results = self.calculate_total_harvested_power()
+        report = io.StringIO()
+        self.write_report(report)
+        return report.getvalue()
+
+    def write_report(self, sink, results: Optional[Dict] = None):
+        """
+        Write the report piece by piece to a file-like sink
+
+        Same text as generate_report, but nothing is glued together in
+        memory: each line goes straight to sink.write.  Pass results
+        (from calculate_total_harvested_power or the batch engine) if
+        you already have them.  See resocharge_report.py for CSV/JSON.
+        """
+        if results is None:
+            results = self.calculate_total_harvested_power()
         energy = self.calculate_energy_per_day(results['total_harvested_uw'])
         capabilities = self.estimate_charging_capability(
             results['total_harvested_uw'])
 
-        report = f"""
+        sink.write(f"""
 {'=' * 70}
 {self.name} - RF Energy Harvesting Analysis Report
 {'=' * 70}
@@ -323,16 +1111,16 @@ Overall System Efficiency: {results['system_efficiency'] * 100:.1f}%
 
 POWER BREAKDOWN BY SOURCE
 {'-' * 70}
-"""
+""")
         for source in results['sources']:
             src = source['source'][:8]
             freq = int(source['frequency_mhz'])
             source_name = f"{src}@{freq}MHz"
             harvested = f"{source['harvested_uw']:6.1f}μW"
             eff_str = f"({source['efficiency']*100:.0f}%eff)"
-            report += f"{source_name}: {harvested} {eff_str}\n"
+            sink.write(f"{source_name}: {harvested} {eff_str}\n")
 
-        report += f"""
+        sink.write(f"""
 ENERGY PER DAY
 {'-' * 70}
 Energy per day:  {energy['energy_per_day_mwh']:.3f} mWh
@@ -341,11 +1129,11 @@ Energy per day:  {energy['energy_per_day_mwh']:.3f} mWh
 
 DEVICE CAPABILITIES
 {'-' * 70}
-"""
+""")
         for device, capability in capabilities['capabilities'].items():
-            report += f"{device:30s}: {capability}\n"
+            sink.write(f"{device:30s}: {capability}\n")
 
-        report += f"""
+        sink.write(f"""
 iPhone Charging Estimate:
   Time to full charge: {capabilities['iphone_charge_time_days']:.0f} days \
 ({capabilities['iphone_charge_time_years']:.1f} years)
@@ -353,8 +1141,7 @@ iPhone Charging Estimate:
 {(1 / capabilities['iphone_charge_time_days'] * 100):.4f}% of battery
 
 {'=' * 70}
-"""
-        return report
+""")
 
 # Predefined environment scenarios
 
@@ -490,8 +1277,9 @@ def create_rural_scenario() -> RFEnergyHarvester:
     return harvester
 
 
-def compare_scenarios(enable_resonance: bool = False):
-    """Compare all scenarios"""
+def compare_scenarios(enable_resonance: bool = False,
+                      chart_path: Optional[str] = 'scenario_comparison.png'):
+    """Compare all scenarios (chart_path=None skips the chart)"""
     scenarios = [
         create_urban_apartment_scenario(),
         create_near_cell_tower_scenario(),
@@ -523,6 +1311,22 @@ def compare_scenarios(enable_resonance: bool = False):
             'power_mw': results['total_harvested_mw']
         })
 
+    if chart_path:
+        plot_comparison(comparison_data, chart_path)
+
+    return comparison_data
+
+
+def plot_comparison(comparison_data: List[Dict],
+                    path: str = 'scenario_comparison.png'):
+    """
+    Save the scenario comparison chart
+
+    matplotlib is only imported here, so programs that never draw a
+    chart don't pay its (large) import time.
+    """
+    import matplotlib.pyplot as plt
+
     # Create comparison chart
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
 
@@ -565,8 +1369,8 @@ def compare_scenarios(enable_resonance: bool = False):
     # Add harvested power lines
     colors = ['#3498db', '#2ecc71', '#e74c3c']
     for i, d in enumerate(comparison_data):
-        ax2.axvline(x=d['power_uw'], color=colors[i], linestyle='--',
-                    linewidth=2, label=d['name'])
+        ax2.axvline(x=d['power_uw'], color=colors[i % len(colors)],
+                    linestyle='--', linewidth=2, label=d['name'])
 
     ax2.set_xlabel('Power (μW, log scale)', fontsize=12)
     ax2.set_xscale('log')
@@ -578,13 +1382,28 @@ def compare_scenarios(enable_resonance: bool = False):
     ax2.grid(axis='x', alpha=0.3)
 
     plt.tight_layout()
-    plt.savefig('scenario_comparison.png', dpi=300, bbox_inches='tight')
-    print("\nComparison chart saved as 'scenario_comparison.png'")
-
-    return comparison_data
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    print(f"\nComparison chart saved as '{path}'")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='ResoCharge RF Energy Harvesting Simulator '
+                    '(for batch runs see resocharge_cli.py)')
+    resonance_group = parser.add_mutually_exclusive_group()
+    resonance_group.add_argument(
+        '--resonance', dest='resonance', action='store_true', default=None,
+        help='enable multi-band resonance (skips the question)')
+    resonance_group.add_argument(
+        '--no-resonance', dest='resonance', action='store_false',
+        help='disable multi-band resonance (skips the question)')
+    parser.add_argument('--no-chart', action='store_true',
+                        help="don't save the comparison chart")
+    args = parser.parse_args()
+
     print("ResoCharge RF Energy Harvesting Simulator")
     print("=" * 70)
     print("\nWHAT THIS SIMULATOR DOES:")
@@ -608,13 +1427,18 @@ if __name__ == "__main__":
     print("   - Provides 1.5x power boost (50% improvement)")
     print("   - Represents cutting-edge research (not yet commercial)")
 
-    choice = input(
-        "\n▶️  Test with resonance enabled? (y/n): ").lower().strip()
-    enable_resonance = choice == 'y' or choice == 'yes'
+    if args.resonance is None:
+        choice = input(
+            "\n▶️  Test with resonance enabled? (y/n): ").lower().strip()
+        enable_resonance = choice == 'y' or choice == 'yes'
+    else:
+        enable_resonance = args.resonance
 
     print("\n▶️  Running simulations...\n")
 
-    comparison_data = compare_scenarios(enable_resonance=enable_resonance)
+    comparison_data = compare_scenarios(
+        enable_resonance=enable_resonance,
+        chart_path=None if args.no_chart else 'scenario_comparison.png')
 
     print("\n" + "=" * 70)
     print("SUMMARY")
@@ -0,0 +1,448 @@
+# ResoCharge: Spatial Power-Density Field
+# Where should the harvester go? Power maps from transmitter positions
+#
+# What this does:
+# - Describes RF sources as transmitters with a position, EIRP and
+#   frequency, instead of a power density typed in per scenario
+# - Works out the power density anywhere with free-space (Friis) or
+#   log-distance path loss
+# - Evaluates a harvester at every cell of a 2-D or 3-D grid of
+#   candidate placements with the batch engine, one tile at a time, so
+#   million-cell grids only need a few tens of MB of scratch memory
+# - Returns a heatmap of harvested power and the best placements
+#
+# The physics: a transmitter radiating EIRP watts spreads it over a
+# sphere, so at distance d the power density is
+#
+#     S(d) = EIRP / (4π d²)                    (free space)
+#
+# Walls, floors and clutter make it fall off faster.  The log-distance
+# model keeps free space up to a reference distance d0 and then falls
+# off with a path-loss exponent n:
+#
+#     S(d) = EIRP / (4π d0²) × (d0 / d)^n      (n = 2 is free space)
+#
+# Typical n: 2 outdoors in line of sight, 2.7-3.5 in cities, 3-4
+# indoors.  Closer than d0 the formula blows up (and we'd be in the near
+# field anyway), so distances are clamped to d0.
+#
+# Each grid cell is an ordinary harvester: the transmitters become its
+# RF sources with the local power density, and the batch engine applies
+# exactly the same efficiency chain as calculate_total_harvested_power.
+
+import argparse
+import math
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from resocharge_engine import evaluate_totals, pack_harvesters
+from resocharge_simulator import RFEnergyHarvester, RFSource, \
+    create_urban_apartment_scenario
+
+
+# Source x antenna pairs evaluated per tile (bounds the engine's
+# temporary arrays to roughly 10 x 8 bytes x this)
+TILE_ELEMENTS = 1 << 20
+
+
+@dataclass
+class Transmitter:
+    """
+    An RF transmitter at a known position
+
+    Think of this as a pin on a map: a cell tower, TV mast or WiFi
+    router with how much power it sends (EIRP = transmit power x antenna
+    gain) and how quickly its signal fades with distance.
+
+    Example: WiFi router at (4 m, 3 m, 1 m), 2450 MHz, 0.1 W EIRP,
+    indoor path-loss exponent 3
+    """
+    name: str
+    frequency_mhz: float
+    eirp_w: float  # Effective isotropic radiated power in watts
+    x_m: float
+    y_m: float
+    z_m: float = 0.0
+    # How often it's on (1.0 = always, 0.5 = half the time)
+    availability: float = 1.0
+    path_loss_exponent: float = 2.0  # 2.0 = free space
+    reference_distance_m: float = 1.0  # Free space up to here
+
+
+def dbm_to_w(dbm: float) -> float:
+    """Convert dBm to watts (30 dBm = 1 W)"""
+    return 10 ** ((dbm - 30) / 10)
+
+
+def _transmitter_arrays(
+        transmitters: Sequence[Transmitter]) -> Dict[str, np.ndarray]:
+    """Transmitter fields as arrays, one entry per transmitter"""
+    def column(name):
+        return np.array([getattr(t, name) for t in transmitters],
+                        dtype=float)
+    return {
+        'position': np.array([(t.x_m, t.y_m, t.z_m) for t in transmitters],
+                             dtype=float).reshape(-1, 3),
+        'frequency_mhz': column('frequency_mhz'),
+        'eirp_uw': column('eirp_w') * 1e6,
+        'availability': column('availability'),
+        'exponent': column('path_loss_exponent'),
+        'reference_m': column('reference_distance_m'),
+    }
+
+
+def _as_points(points) -> np.ndarray:
+    """(P, 3) array of positions; (P, 2) points get z = 0"""
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 1:
+        points = points[None, :]
+    if points.shape[1] == 2:
+        points = np.column_stack([points, np.zeros(len(points))])
+    return points
+
+
+def _density(arrays: Dict[str, np.ndarray],
+             points: np.ndarray) -> np.ndarray:
+    """Power density (μW/m²) of every transmitter at every point,
+    shape (P, T)"""
+    offset = points[:, None, :] - arrays['position'][None, :, :]
+    distance = np.sqrt(np.einsum('ptk,ptk->pt', offset, offset))
+    reference = arrays['reference_m']
+    distance = np.maximum(distance, reference)
+    # EIRP / (4π d0²) x (d0 / d)^n
+    return (arrays['eirp_uw'] / (4 * math.pi * reference ** 2) *
+            (reference / distance) ** arrays['exponent'])
+
+
+def power_density(transmitters: Sequence[Transmitter],
+                  points) -> np.ndarray:
+    """
+    Power density (μW/m²) from each transmitter at each point
+
+    points is one (x, y[, z]) position or an array of them; the result
+    has one row per point and one column per transmitter.
+    """
+    return _density(_transmitter_arrays(transmitters), _as_points(points))
+
+
+def sources_at(transmitters: Sequence[Transmitter],
+               point) -> List[RFSource]:
+    """The transmitters as RFSources seen from one position"""
+    density = power_density(transmitters, point)[0]
+    return [RFSource(t.name, t.frequency_mhz, density[i].item(),
+                     t.availability)
+            for i, t in enumerate(transmitters)]
+
+
+def harvester_at(harvester: RFEnergyHarvester,
+                 transmitters: Sequence[Transmitter],
+                 point) -> RFEnergyHarvester:
+    """
+    A copy of harvester placed at point: the transmitters become its
+    sources (its own sources are left out); antennas, rectifier,
+    efficiencies and rectification mode are shared with the original
+    """
+    return harvester.clone(rf_sources=sources_at(transmitters, point))
+
+
+@dataclass
+class PlacementGrid:
+    """
+    Candidate harvester positions on a regular grid
+
+    Cell (i, j, k) is at (x_m[i], y_m[j], z_m[k]).  A single height
+    gives a flat 2-D grid.  Positions are worked out tile by tile when
+    needed, so a grid costs nothing but its three axes.
+    """
+    x_m: np.ndarray
+    y_m: np.ndarray
+    z_m: np.ndarray
+
+    @classmethod
+    def spanning(cls, x_range_m: Tuple[float, float],
+                 y_range_m: Tuple[float, float], spacing_m: float,
+                 heights_m: Sequence[float] = (0.0,)) -> 'PlacementGrid':
+        """Grid from x and y ranges (ends included) and a spacing"""
+        def axis(start, stop):
+            count = int(math.floor((stop - start) / spacing_m + 1e-9)) + 1
+            return start + spacing_m * np.arange(max(count, 1))
+        return cls(axis(*x_range_m), axis(*y_range_m),
+                   np.asarray(heights_m, dtype=float))
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return len(self.x_m), len(self.y_m), len(self.z_m)
+
+    @property
+    def size(self) -> int:
+        """Number of cells"""
+        return len(self.x_m) * len(self.y_m) * len(self.z_m)
+
+    def points(self, start: int = 0,
+               stop: Optional[int] = None) -> np.ndarray:
+        """Positions (N, 3) of cells start..stop in flat (C) order"""
+        stop = self.size if stop is None else min(stop, self.size)
+        i, j, k = np.unravel_index(np.arange(start, stop), self.shape)
+        return np.column_stack([self.x_m[i], self.y_m[j], self.z_m[k]])
+
+
+def _evaluate_tile(base, arrays: Dict[str, np.ndarray],
+                   points: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Totals for one tile of positions
+
+    The one-row batch of the harvester is stretched to one row per
+    position with broadcast views (no copies); only the power densities
+    are real (P, T) arrays.
+    """
+    count = len(points)
+    transmitters = len(arrays['frequency_mhz'])
+
+    def rows(values):
+        return np.broadcast_to(values[0], (count,) + values.shape[1:])
+
+    batch = replace(
+        base,
+        source_frequency_mhz=np.broadcast_to(
+            arrays['frequency_mhz'], (count, transmitters)),
+        source_power_density_uw_per_m2=_density(arrays, points),
+        source_availability=np.broadcast_to(
+            arrays['availability'], (count, transmitters)),
+        antenna_frequency_mhz=rows(base.antenna_frequency_mhz),
+        antenna_effective_area_m2=rows(base.antenna_effective_area_m2),
+        antenna_efficiency=rows(base.antenna_efficiency),
+        antenna_tolerance=rows(base.antenna_tolerance),
+        matching_efficiency=rows(base.matching_efficiency),
+        filter_efficiency=rows(base.filter_efficiency),
+        resonance_boost=rows(base.resonance_boost),
+        curve_power_uw=rows(base.curve_power_uw),
+        curve_efficiency=rows(base.curve_efficiency),
+        curve_size=rows(base.curve_size),
+        rectifier_group=None if base.rectifier_group is None
+        else rows(base.rectifier_group))
+    return evaluate_totals(batch, max_elements=count * transmitters *
+                           base.antenna_frequency_mhz.shape[1])
+
+
+def _evaluate(harvester: RFEnergyHarvester,
+              transmitters: Sequence[Transmitter], count: int,
+              points_of, tile_elements: int) -> Dict[str, np.ndarray]:
+    """Received and harvested power (μW) for count positions, tile by
+    tile; points_of(start, stop) gives the positions of a tile"""
+    received = np.zeros(count)
+    harvested = np.zeros(count)
+    if not transmitters or count == 0:
+        return {'received_uw': received, 'harvested_uw': harvested}
+
+    base = pack_harvesters([harvester])
+    arrays = _transmitter_arrays(transmitters)
+    pairs_per_cell = len(transmitters) * base.antenna_frequency_mhz.shape[1]
+    step = max(1, tile_elements // pairs_per_cell)
+    for start in range(0, count, step):
+        stop = min(start + step, count)
+        totals = _evaluate_tile(base, arrays, points_of(start, stop))
+        received[start:stop] = totals['total_received_uw']
+        harvested[start:stop] = totals['total_harvested_uw']
+    return {'received_uw': received, 'harvested_uw': harvested}
+
+
+def evaluate_points(harvester: RFEnergyHarvester,
+                    transmitters: Sequence[Transmitter], points,
+                    tile_elements: int = TILE_ELEMENTS
+                    ) -> Dict[str, np.ndarray]:
+    """
+    Harvested power at a list of candidate positions
+
+    Returns 'received_uw' and 'harvested_uw' arrays, one value per
+    point, equal to total_received_uw / total_harvested_uw of
+    harvester_at(harvester, transmitters, point).
+    """
+    points = _as_points(points)
+    return _evaluate(harvester, transmitters, len(points),
+                     lambda start, stop: points[start:stop], tile_elements)
+
+
+@dataclass
+class SpatialResult:
+    """Harvested power over a placement grid"""
+    grid: PlacementGrid
+    received_uw: np.ndarray  # Shape grid.shape
+    harvested_uw: np.ndarray  # Shape grid.shape
+    elapsed_s: float
+
+    def heatmap(self, height_index: int = 0) -> np.ndarray:
+        """Harvested power (μW) at one height as a (len(y), len(x))
+        image, ready for imshow(origin='lower')"""
+        return self.harvested_uw[:, :, height_index].T
+
+    def best(self, count: int = 10) -> List[Dict]:
+        """The count best placements, most harvested power first"""
+        flat = self.harvested_uw.ravel()
+        count = min(count, flat.size)
+        if count == 0:
+            return []
+        # Partial sort: only the winners get sorted
+        top = np.argpartition(-flat, count - 1)[:count]
+        top = top[np.lexsort((top, -flat[top]))]
+        received = self.received_uw.ravel()
+        i, j, k = np.unravel_index(top, self.grid.shape)
+        return [{'x_m': self.grid.x_m[i[n]].item(),
+                 'y_m': self.grid.y_m[j[n]].item(),
+                 'z_m': self.grid.z_m[k[n]].item(),
+                 'received_uw': received[cell].item(),
+                 'harvested_uw': flat[cell].item()}
+                for n, cell in enumerate(top.tolist())]
+
+    def format(self, count: int = 5) -> str:
+        """Short text summary with the best placements"""
+        nx, ny, nz = self.grid.shape
+        harvested = self.harvested_uw
+        lines = [f"Placement grid: {nx} x {ny} x {nz} = "
+                 f"{self.grid.size:,} cells "
+                 f"({self.elapsed_s * 1000:.1f} ms)",
+                 f"  Harvested: {harvested.min():.3f} .. "
+                 f"{harvested.max():.3f} μW "
+                 f"(median {np.median(harvested):.3f} μW)",
+                 "  Best placements:"]
+        for place in self.best(count):
+            lines.append(f"    ({place['x_m']:7.2f}, {place['y_m']:7.2f}, "
+                         f"{place['z_m']:5.2f}) m  "
+                         f"{place['harvested_uw']:10.3f} μW")
+        return "\n".join(lines)
+
+
+def evaluate_grid(harvester: RFEnergyHarvester,
+                  transmitters: Sequence[Transmitter],
+                  grid: PlacementGrid,
+                  tile_elements: int = TILE_ELEMENTS) -> SpatialResult:
+    """
+    Evaluate the harvester at every cell of a placement grid
+
+    Cells are processed in tiles of about tile_elements source x
+    antenna pairs, so memory stays flat however big the grid is (only
+    the two result arrays grow with it: 16 bytes per cell).
+    """
+    started = time.perf_counter()
+    values = _evaluate(harvester, transmitters, grid.size, grid.points,
+                       tile_elements)
+    return SpatialResult(
+        grid=grid,
+        received_uw=values['received_uw'].reshape(grid.shape),
+        harvested_uw=values['harvested_uw'].reshape(grid.shape),
+        elapsed_s=time.perf_counter() - started)
+
+
+def plot_heatmap(result: SpatialResult, path: str = 'power_map.png',
+                 height_index: int = 0,
+                 transmitters: Sequence[Transmitter] = (),
+                 best: int = 5):
+    """
+    Save a heatmap of harvested power at one height
+
+    Power falls off so quickly with distance that the colours use a log
+    scale.  Transmitters inside the map and the best placements are
+    marked.  matplotlib is only imported here.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    grid = result.grid
+    image = result.heatmap(height_index)
+    positive = image[image > 0]
+    fig, ax = plt.subplots(figsize=(10, 8))
+    shown = ax.imshow(
+        np.ma.masked_less_equal(image, 0), origin='lower', cmap='viridis',
+        extent=(grid.x_m[0], grid.x_m[-1], grid.y_m[0], grid.y_m[-1]),
+        norm=LogNorm(vmin=positive.min(), vmax=positive.max())
+        if positive.size else None,
+        aspect='equal')
+    fig.colorbar(shown, ax=ax, label='Harvested Power (μW)')
+
+    for t in transmitters:
+        if (grid.x_m[0] <= t.x_m <= grid.x_m[-1] and
+                grid.y_m[0] <= t.y_m <= grid.y_m[-1]):
+            ax.plot(t.x_m, t.y_m, 'r^', markersize=10)
+            ax.annotate(t.name, (t.x_m, t.y_m), color='red',
+                        textcoords='offset points', xytext=(5, 5))
+    z = grid.z_m[height_index]
+    flat = image.ravel()
+    best = min(best, int(np.count_nonzero(flat > 0)))
+    if best:
+        top = np.argpartition(-flat, best - 1)[:best]
+        y_index, x_index = np.unravel_index(top, image.shape)
+        ax.plot(grid.x_m[x_index], grid.y_m[y_index], 'w*',
+                markersize=14, label=f'Best {best}')
+        ax.legend(loc='upper right')
+
+    ax.set_xlabel('x (m)', fontsize=12)
+    ax.set_ylabel('y (m)', fontsize=12)
+    ax.set_title(f'Harvested Power at {z:.1f} m', fontsize=14,
+                 fontweight='bold')
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"\nHeatmap saved as '{path}'")
+
+
+def create_apartment_block_transmitters() -> List[Transmitter]:
+    """
+    Transmitters around a 40 m x 30 m apartment block (the block spans
+    x = 0..40 m, y = 0..30 m; two WiFi routers are inside)
+    """
+    return [
+        Transmitter("FM Radio", 100, 50_000, -6_000, 2_000, 150,
+                    path_loss_exponent=2.0),
+        Transmitter("TV Broadcast", 600, 100_000, 4_000, -5_000, 200,
+                    path_loss_exponent=2.2),
+        Transmitter("Cellular 700MHz", 750, 400, 250, 180, 30,
+                    availability=0.9, path_loss_exponent=2.8),
+        Transmitter("Cellular 1900MHz", 1900, 300, 250, 180, 30,
+                    availability=0.9, path_loss_exponent=2.8),
+        Transmitter("5G 3.5GHz", 3500, 40, -60, 45, 8,
+                    availability=0.8, path_loss_exponent=3.0),
+        Transmitter("WiFi 2.4GHz", 2450, 0.1, 8, 6, 1,
+                    availability=0.95, path_loss_exponent=3.0),
+        Transmitter("WiFi 5GHz", 5500, 0.2, 30, 22, 1,
+                    availability=0.8, path_loss_exponent=3.5),
+    ]
+
+
+def main():
+    """Command-line demo: where to put the urban apartment harvester"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge placement map from transmitter positions')
+    parser.add_argument('--spacing', type=float, default=0.25,
+                        help='grid spacing in metres (default 0.25)')
+    parser.add_argument('--heights', type=float, nargs='+',
+                        default=[0.5, 1.5, 2.5],
+                        help='heights to try in metres')
+    parser.add_argument('--top', type=int, default=5,
+                        help='how many best placements to list')
+    parser.add_argument('--chart', metavar='PNG',
+                        help='save a heatmap of the first height')
+    args = parser.parse_args()
+
+    harvester = create_urban_apartment_scenario()
+    transmitters = create_apartment_block_transmitters()
+    grid = PlacementGrid.spanning((0.0, 40.0), (0.0, 30.0), args.spacing,
+                                  args.heights)
+    result = evaluate_grid(harvester, transmitters, grid)
+    print(result.format(args.top))
+
+    best = result.best(1)[0]
+    placed = harvester_at(harvester, transmitters,
+                          (best['x_m'], best['y_m'], best['z_m']))
+    print("\nAt the best placement:")
+    for source in placed.rf_sources:
+        print(f"  {source.name:18s} "
+              f"{source.power_density_uw_per_m2:12.2f} μW/m²")
+    if args.chart:
+        plot_heatmap(result, args.chart, transmitters=transmitters,
+                     best=args.top)
+
+
+if __name__ == "__main__":
+    main()
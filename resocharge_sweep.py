@@ -0,0 +1,400 @@
+# ResoCharge: Parameter Sweep / Design-Space Exploration
+# Evaluate millions of harvester designs in parallel
+#
+# What this does:
+# - Describes a design space as a full grid or as random samples
+# - Splits it into chunks and evaluates them on a process pool
+# - Streams results back chunk by chunk (memory stays flat)
+# - Reports throughput in configurations per second
+#
+# Each design point starts from one of the create_*_scenario
+# environments and changes these knobs:
+#   scenario            - which environment ('urban', 'tower', 'rural')
+#   antenna_area_scale  - multiplies every antenna's effective area
+#   antenna_efficiency  - replaces every antenna's efficiency (NaN = keep)
+#   rectifier           - name of a RectifierConfig (stages + curve);
+#                         None = the scenario's own rectifier
+#   matching_efficiency - antenna-rectifier matching efficiency
+#                         (NaN = keep)
+#   filter_efficiency   - signal filter efficiency (NaN = keep)
+#   enable_resonance    - multi-band resonance (1.5x boost) on/off;
+#                         NaN = keep the scenario's own boost
+#
+# Knobs a design leaves out keep the scenario's values, so a sweep
+# varies a real scenario instead of resetting it.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from resocharge_engine import HarvesterBatch, evaluate_totals, \
+    pack_harvesters
+from resocharge_simulator import RFEnergyHarvester, RectifierConfig, \
+    create_near_cell_tower_scenario, create_rural_scenario, \
+    create_urban_apartment_scenario
+
+
+# Built-in environments, by the names used in designs
+SCENARIO_FACTORIES: Dict[str, Callable[[], RFEnergyHarvester]] = {
+    'urban': create_urban_apartment_scenario,
+    'tower': create_near_cell_tower_scenario,
+    'rural': create_rural_scenario,
+}
+
+# Value used for every knob the design doesn't mention
+SWEEP_DEFAULTS = {
+    'scenario': 'urban',
+    'antenna_area_scale': 1.0,
+    'antenna_efficiency': float('nan'),  # NaN = keep scenario value
+    'rectifier': None,  # None = keep scenario rectifier
+    'matching_efficiency': float('nan'),  # NaN = keep scenario value
+    'filter_efficiency': float('nan'),  # NaN = keep scenario value
+    'enable_resonance': float('nan'),  # NaN = keep scenario boost
+}
+
+# Knobs that pick from a list of names (stored as codes 0, 1, 2, ...)
+CATEGORICAL_PARAMETERS = ('scenario', 'rectifier')
+
+# Result columns added to every chunk
+RESULT_COLUMNS = ('total_received_uw', 'total_harvested_uw',
+                  'system_efficiency')
+
+
+def _check_parameters(names: Sequence[str]):
+    """Reject knobs the sweep doesn't know about"""
+    unknown = set(names) - set(SWEEP_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameter(s): {sorted(unknown)}")
+
+
+class GridDesign:
+    """
+    Full-factorial design: every combination of the listed values
+
+    Example: GridDesign(scenario=['urban', 'rural'],
+                        antenna_area_scale=[0.5, 1, 2, 4],
+                        enable_resonance=[False, True])
+    has 2 x 4 x 2 = 16 points.  Points are generated on demand from
+    their index, so even huge grids take no memory up front.
+    """
+
+    def __init__(self, **values: Sequence):
+        _check_parameters(values)
+        self.values = {name: list(values.get(name, [default]))
+                       for name, default in SWEEP_DEFAULTS.items()}
+        self.choices = {name: self.values[name]
+                        for name in CATEGORICAL_PARAMETERS}
+        self.shape = tuple(len(v) for v in self.values.values())
+
+    def __len__(self) -> int:
+        return int(np.prod(self.shape))
+
+    def columns(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Parameter columns for design points start..stop-1"""
+        indices = np.unravel_index(np.arange(start, stop), self.shape)
+        columns = {}
+        for (name, values), index in zip(self.values.items(), indices):
+            if name in CATEGORICAL_PARAMETERS:
+                columns[name] = index  # Code = position in the list
+            else:
+                columns[name] = np.asarray(values)[index]
+        return columns
+
+
+class RandomDesign:
+    """
+    Random design: n points drawn independently
+
+    Each knob is given as
+      (low, high)  - uniform between low and high
+      [a, b, c]    - one of the listed values, equally likely
+      value        - fixed
+    Example: RandomDesign(1_000_000, seed=1,
+                          antenna_area_scale=(0.5, 4.0),
+                          scenario=['urban', 'tower', 'rural'])
+
+    Points are drawn in fixed blocks seeded from (seed, block number),
+    so results don't depend on chunk size or number of workers.
+    """
+    BLOCK_SIZE = 4096
+
+    def __init__(self, n: int, seed: int = 0, **specs):
+        _check_parameters(specs)
+        self.n = n
+        self.seed = seed
+        self.specs = {name: specs.get(name, default)
+                      for name, default in SWEEP_DEFAULTS.items()}
+        self.choices = {}
+        for name in CATEGORICAL_PARAMETERS:
+            spec = self.specs[name]
+            self.choices[name] = (list(spec) if isinstance(spec, list)
+                                  else [spec])
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _block(self, block: int) -> Dict[str, np.ndarray]:
+        """All parameter columns for one block of points"""
+        rng = np.random.default_rng([self.seed, block])
+        size = min(self.BLOCK_SIZE, self.n - block * self.BLOCK_SIZE)
+        columns = {}
+        for name, spec in self.specs.items():
+            if name in CATEGORICAL_PARAMETERS:
+                columns[name] = rng.integers(
+                    len(self.choices[name]), size=size)
+            elif isinstance(spec, tuple):
+                columns[name] = rng.uniform(spec[0], spec[1], size=size)
+            elif isinstance(spec, list):
+                columns[name] = np.asarray(spec)[
+                    rng.integers(len(spec), size=size)]
+            else:
+                columns[name] = np.full(size, spec)
+        return columns
+
+    def columns(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Parameter columns for design points start..stop-1"""
+        first = start // self.BLOCK_SIZE
+        last = (stop - 1) // self.BLOCK_SIZE
+        blocks = [self._block(b) for b in range(first, last + 1)]
+        offset = start - first * self.BLOCK_SIZE
+        return {name: np.concatenate([b[name] for b in blocks])[
+                    offset:offset + stop - start]
+                for name in self.specs}
+
+
+@dataclass
+class SweepChunk:
+    """
+    One chunk of sweep results
+
+    columns holds one array per knob (categorical knobs as codes into
+    design.choices) plus 'index', total_received_uw, total_harvested_uw
+    and system_efficiency.
+    """
+    start: int
+    stop: int
+    columns: Dict[str, np.ndarray]
+    configs_done: int  # Points finished so far (including this chunk)
+    elapsed_s: float  # Wall time since the sweep started
+
+    @property
+    def configs_per_second(self) -> float:
+        """Sweep throughput so far"""
+        return self.configs_done / self.elapsed_s if self.elapsed_s else 0.0
+
+
+def _curve_table(rectifiers: Sequence[Optional[RectifierConfig]]):
+    """Padded curve arrays, one row per rectifier (None = no rectifier)"""
+    curves = [r.curve if r else None for r in rectifiers]
+    width = max([len(c.power_levels) for c in curves if c] + [2])
+    powers = np.full((len(curves), width), np.inf)
+    effs = np.zeros((len(curves), width))
+    sizes = np.zeros(len(curves), dtype=np.int64)
+    for row, curve in enumerate(curves):
+        if curve:
+            sizes[row] = len(curve.power_levels)
+            powers[row, :sizes[row]] = curve.power_levels
+            effs[row, :sizes[row]] = curve.efficiencies
+    return powers, effs, sizes
+
+
+class _SweepModel:
+    """Everything a worker needs to turn design columns into results"""
+
+    def __init__(self, design, scenarios: Dict[str, RFEnergyHarvester],
+                 rectifiers: Dict[str, RectifierConfig]):
+        self.design = design
+        names = design.choices['scenario']
+        self.scenarios = [pack_harvesters([scenarios[n]]) for n in names]
+        # Row r of the curve table = rectifier choice r; the last rows
+        # hold each scenario's own rectifier (for the None choice)
+        chosen = [rectifiers[r] if r is not None else None
+                  for r in design.choices['rectifier']]
+        own = [scenarios[n].rectifier for n in names]
+        self.curves = _curve_table(chosen + own)
+        self.own_offset = len(chosen)
+        self.keep_own = np.array(
+            [r is None for r in design.choices['rectifier']])
+
+    def evaluate(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Evaluate design points start..stop-1"""
+        columns = self.design.columns(start, stop)
+        columns['index'] = np.arange(start, stop)
+        for name in RESULT_COLUMNS:
+            columns[name] = np.zeros(stop - start)
+
+        for code, base in enumerate(self.scenarios):
+            rows = np.nonzero(columns['scenario'] == code)[0]
+            if len(rows) == 0:
+                continue
+            batch = self._build_batch(base, columns, rows, code)
+            totals = evaluate_totals(batch)
+            for name in RESULT_COLUMNS:
+                columns[name][rows] = totals[name]
+        return columns
+
+    def _build_batch(self, base: HarvesterBatch,
+                     columns: Dict[str, np.ndarray], rows: np.ndarray,
+                     scenario_code: int) -> HarvesterBatch:
+        """Apply the design knobs to one scenario for the given rows"""
+        count = len(rows)
+        sources = base.source_frequency_mhz.shape[1]
+        antennas = base.antenna_frequency_mhz.shape[1]
+
+        area = (base.antenna_effective_area_m2 *
+                columns['antenna_area_scale'][rows, None])
+        override = columns['antenna_efficiency'][rows, None]
+        efficiency = np.where(np.isnan(override),
+                              base.antenna_efficiency, override)
+
+        matching = columns['matching_efficiency'][rows]
+        filtering = columns['filter_efficiency'][rows]
+        resonance = columns['enable_resonance'][rows].astype(float)
+        boost = np.where(np.isnan(resonance), base.resonance_boost,
+                         np.where(resonance != 0, 1.5, 1.0))
+
+        curve_row = columns['rectifier'][rows]
+        curve_row = np.where(self.keep_own[curve_row],
+                             self.own_offset + scenario_code, curve_row)
+        powers, effs, sizes = self.curves
+
+        return HarvesterBatch(
+            source_frequency_mhz=np.broadcast_to(
+                base.source_frequency_mhz, (count, sources)),
+            source_power_density_uw_per_m2=np.broadcast_to(
+                base.source_power_density_uw_per_m2, (count, sources)),
+            source_availability=np.broadcast_to(
+                base.source_availability, (count, sources)),
+            antenna_frequency_mhz=np.broadcast_to(
+                base.antenna_frequency_mhz, (count, antennas)),
+            antenna_effective_area_m2=area,
+            antenna_efficiency=efficiency,
+            matching_efficiency=np.where(np.isnan(matching),
+                                         base.matching_efficiency, matching),
+            filter_efficiency=np.where(np.isnan(filtering),
+                                       base.filter_efficiency, filtering),
+            resonance_boost=boost,
+            curve_power_uw=powers[curve_row],
+            curve_efficiency=effs[curve_row],
+            curve_size=sizes[curve_row],
+            antenna_tolerance=np.broadcast_to(
+                base.antenna_tolerance, (count, antennas)),
+            rectifier_group=None if base.rectifier_group is None
+            else np.broadcast_to(base.rectifier_group, (count, antennas)))
+
+
+# Each worker process builds its _SweepModel once, at start-up, so
+# tasks only carry (start, stop) and results only carry arrays
+_worker_model: Optional[_SweepModel] = None
+
+
+def _init_worker(design, scenarios, rectifiers):
+    global _worker_model
+    _worker_model = _SweepModel(design, scenarios, rectifiers)
+
+
+def _evaluate_chunk(start: int, stop: int) -> Dict[str, np.ndarray]:
+    return _worker_model.evaluate(start, stop)
+
+
+def run_sweep(design,
+              scenarios: Optional[Dict[str, RFEnergyHarvester]] = None,
+              rectifiers: Optional[Dict[str, RectifierConfig]] = None,
+              chunk_size: int = 65536,
+              workers: Optional[int] = None,
+              max_pending: Optional[int] = None) -> Iterator[SweepChunk]:
+    """
+    Run a sweep and stream the results back chunk by chunk
+
+    design      - GridDesign or RandomDesign
+    scenarios   - environments by name (default: SCENARIO_FACTORIES)
+    rectifiers  - RectifierConfig choices by name for the 'rectifier' knob
+    workers     - process count (None = all cores, 1 = no pool)
+    max_pending - chunks in flight at once (default 2 per worker);
+                  this caps memory no matter how big the sweep is
+
+    Chunks are yielded in order.  Example:
+        for chunk in run_sweep(design, workers=8):
+            print(f"{chunk.configs_per_second:,.0f} configs/s")
+    """
+    if scenarios is None:
+        scenarios = {name: factory()
+                     for name, factory in SCENARIO_FACTORIES.items()
+                     if name in design.choices['scenario']}
+    rectifiers = rectifiers or {}
+    bounds = [(start, min(start + chunk_size, len(design)))
+              for start in range(0, len(design), chunk_size)]
+    started = time.perf_counter()
+    done = 0
+
+    if workers == 1:
+        model = _SweepModel(design, scenarios, rectifiers)
+        for start, stop in bounds:
+            columns = model.evaluate(start, stop)
+            done += stop - start
+            yield SweepChunk(start, stop, columns, done,
+                             time.perf_counter() - started)
+        return
+
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(design, scenarios, rectifiers)) as pool:
+        window = max_pending or 2 * (workers or os.cpu_count() or 1)
+        pending: List = []
+        next_bound = 0
+        while pending or next_bound < len(bounds):
+            # Keep the window full, then wait for the oldest chunk
+            while next_bound < len(bounds) and len(pending) < window:
+                start, stop = bounds[next_bound]
+                pending.append(
+                    (start, stop, pool.submit(_evaluate_chunk, start, stop)))
+                next_bound += 1
+            start, stop, future = pending.pop(0)
+            columns = future.result()
+            done += stop - start
+            yield SweepChunk(start, stop, columns, done,
+                             time.perf_counter() - started)
+
+
+def main():
+    """Command-line demo: random sweep over all built-in scenarios"""
+    parser = argparse.ArgumentParser(
+        description='ResoCharge parameter sweep (random design)')
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    design = RandomDesign(
+        args.points, seed=args.seed,
+        scenario=list(SCENARIO_FACTORIES),
+        antenna_area_scale=(0.5, 4.0),
+        antenna_efficiency=(0.6, 0.9),
+        matching_efficiency=(0.8, 0.98),
+        filter_efficiency=(0.9, 0.99),
+        enable_resonance=[False, True])
+
+    best = (-1.0, -1)
+    chunk = None
+    for chunk in run_sweep(design, chunk_size=args.chunk_size,
+                           workers=args.workers):
+        harvested = chunk.columns['total_harvested_uw']
+        i = int(np.argmax(harvested))
+        if harvested[i] > best[0]:
+            best = (float(harvested[i]), int(chunk.columns['index'][i]))
+
+    if chunk is not None:
+        print(f"Evaluated {chunk.configs_done:,} configurations in "
+              f"{chunk.elapsed_s:.2f} s "
+              f"({chunk.configs_per_second:,.0f} configs/s)")
+        print(f"Best design #{best[1]}: {best[0]:.2f} μW")
+
+
+if __name__ == "__main__":
+    main()
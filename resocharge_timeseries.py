@@ -0,0 +1,493 @@
+# ResoCharge: Time-Series Harvesting Simulation
+# Hour-by-hour (or second-by-second) energy, not just "power x 24 hours"
+#
+# What this does:
+# - Reads per-source density/availability traces lazily, chunk by chunk
+#   (generators or arrays, hourly down to sub-second steps)
+# - Runs every step through the same efficiency chain as
+#   calculate_total_harvested_power
+# - Charges a storage element (supercapacitor or battery) with leakage
+#   and a capacity limit, while a load draws from it
+#
+# A year at one-second steps is ~31.5 million steps.  The storage update
+#   energy = clip(retention * energy + net_input, 0, capacity)
+# looks inherently step-by-step, but "clip of a linear function" maps
+# compose into the same kind of map, so each chunk is solved with a
+# vectorized prefix scan.  Memory depends on chunk size, not duration.
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from resocharge_simulator import RFEnergyHarvester
+
+
+# A trace is one value per time step, given as an array or as any
+# iterable of array chunks (e.g. a generator reading a file)
+Trace = Union[np.ndarray, Iterable[np.ndarray]]
+
+SECONDS_PER_DAY = 86400.0
+
+# Stand-in for "no limit" inside the storage scan (0 x inf would be NaN
+# once the retention factor underflows to zero)
+_UNBOUNDED = 1e300
+
+
+@dataclass
+class EnergyStorage:
+    """
+    Energy buffer between the harvester and the load
+
+    Think of it as a bucket: the harvester trickles energy in, the
+    load scoops it out, it leaks a little, and it overflows when full.
+
+    Example: EnergyStorage.supercapacitor(1.0, 5.0) is a 1 F cap
+    charged to 5 V (12.5 J).
+    """
+    capacity_j: float  # Usable energy when full (joules)
+    energy_j: float = 0.0  # Energy stored at the start
+    self_discharge_per_hour: float = 0.0  # Fraction of stored energy lost
+    leakage_uw: float = 0.0  # Constant leakage / quiescent current draw
+    charge_efficiency: float = 1.0  # Fraction of harvested power stored
+
+    @classmethod
+    def supercapacitor(cls, capacitance_f: float, max_voltage: float,
+                       min_voltage: float = 0.0,
+                       self_discharge_per_hour: float = 0.01,
+                       **kwargs) -> 'EnergyStorage':
+        """Supercapacitor: usable energy = ½C(Vmax² - Vmin²)"""
+        capacity = 0.5 * capacitance_f * (max_voltage ** 2 -
+                                          min_voltage ** 2)
+        return cls(capacity_j=capacity,
+                   self_discharge_per_hour=self_discharge_per_hour,
+                   **kwargs)
+
+    @classmethod
+    def battery(cls, capacity_mah: float, voltage: float,
+                self_discharge_per_hour: float = 0.00003,
+                **kwargs) -> 'EnergyStorage':
+        """Battery: energy = mAh x 3.6 x V (about 2%/month leakage)"""
+        return cls(capacity_j=capacity_mah * 3.6 * voltage,
+                   self_discharge_per_hour=self_discharge_per_hour,
+                   **kwargs)
+
+    def retention(self, step_s: float) -> float:
+        """Fraction of stored energy left after one step"""
+        if self.self_discharge_per_hour <= 0:
+            return 1.0
+        rate = -math.log1p(-self.self_discharge_per_hour) / 3600.0
+        return math.exp(-rate * step_s)
+
+
+@dataclass
+class TimeSeriesResult:
+    """Totals from a time-series run (energies in joules)"""
+    steps: int
+    step_s: float
+    harvested_energy_j: float  # Harvester output before storage losses
+    load_energy_j: float  # Energy the load asked for
+    unmet_load_j: float  # Load energy that wasn't available
+    wasted_energy_j: float  # Harvested energy lost because storage was full
+    final_energy_j: float
+    min_energy_j: float
+    max_energy_j: float
+    brownout_steps: int  # Steps where the load could not be fully powered
+    peak_power_uw: float
+    # Stored energy sampled every record_every_s (empty if not requested)
+    energy_trace_j: Optional[np.ndarray] = None
+
+    @property
+    def duration_s(self) -> float:
+        return self.steps * self.step_s
+
+    @property
+    def mean_power_uw(self) -> float:
+        """Average harvested power over the whole run"""
+        if not self.steps:
+            return 0.0
+        return self.harvested_energy_j / self.duration_s * 1e6
+
+    @property
+    def brownout_fraction(self) -> float:
+        return self.brownout_steps / self.steps if self.steps else 0.0
+
+
+# Trace helpers ------------------------------------------------------------
+
+def _chunks(trace: Trace, chunk_size: int) -> Iterator[np.ndarray]:
+    """Yield a trace as float arrays of exactly chunk_size values
+
+    (the last chunk may be shorter).  Accepts an array or any iterable
+    of array chunks of any length.
+    """
+    if isinstance(trace, np.ndarray):
+        trace = np.asarray(trace, dtype=float).ravel()
+        for start in range(0, len(trace), chunk_size):
+            yield trace[start:start + chunk_size]
+        return
+
+    pending: List[np.ndarray] = []
+    pending_size = 0
+    for piece in trace:
+        piece = np.asarray(piece, dtype=float).ravel()
+        pending.append(piece)
+        pending_size += len(piece)
+        while pending_size >= chunk_size:
+            joined = np.concatenate(pending)
+            yield joined[:chunk_size]
+            pending = [joined[chunk_size:]]
+            pending_size = len(pending[0])
+    if pending_size:
+        yield np.concatenate(pending)
+
+
+def constant_trace(value: float, steps: int,
+                   chunk_size: int = 1 << 20) -> Iterator[np.ndarray]:
+    """The same value for every step"""
+    for start in range(0, steps, chunk_size):
+        yield np.full(min(chunk_size, steps - start), float(value))
+
+
+def diurnal_trace(mean: float, step_s: float, duration_s: float,
+                  swing: float = 0.5, peak_hour: float = 20.0,
+                  chunk_size: int = 1 << 20) -> Iterator[np.ndarray]:
+    """
+    Daily cycle: busiest at peak_hour, quietest 12 hours later
+
+    value = mean x (1 + swing x cos(2π (hour - peak_hour) / 24))
+    Example: swing=0.5 gives 1.5x mean in the evening, 0.5x at dawn.
+    """
+    steps = int(round(duration_s / step_s))
+    for start in range(0, steps, chunk_size):
+        t = np.arange(start, min(start + chunk_size, steps)) * step_s
+        hours = t / 3600.0 - peak_hour
+        yield mean * (1 + swing * np.cos(2 * np.pi * hours / 24.0))
+
+
+def bursty_trace(duty_cycle: float, mean_burst_s: float, step_s: float,
+                 duration_s: float, seed: int = 0,
+                 chunk_size: int = 1 << 20) -> Iterator[np.ndarray]:
+    """
+    On/off availability (1 or 0), like bursty WiFi traffic
+
+    Bursts last mean_burst_s on average and the signal is on for
+    duty_cycle of the time (random exponential on/off periods).
+    """
+    rng = np.random.default_rng(seed)
+    mean_gap_s = mean_burst_s * (1 - duty_cycle) / max(duty_cycle, 1e-12)
+    steps = int(round(duration_s / step_s))
+
+    def periods() -> Iterator[np.ndarray]:
+        produced = 0
+        first_on = rng.random() < duty_cycle
+        while produced < steps:
+            # Draw many on/off periods at once, alternating states
+            count = 65536
+            on = (np.arange(count) % 2 == 0) == first_on
+            mean_s = np.where(on, mean_burst_s, mean_gap_s)
+            lengths = np.maximum(
+                1, np.rint(rng.exponential(mean_s) / step_s)).astype(int)
+            piece = np.repeat(on.astype(float), lengths)
+            piece = piece[:steps - produced]
+            produced += len(piece)
+            yield piece
+
+    return _chunks(periods(), chunk_size)
+
+
+# Storage update as a prefix scan ------------------------------------------
+
+def _compose(first, second):
+    """
+    Combine two steps "x -> clip(a*x + b, lo, hi)" (first, then second)
+
+    The result has the same form, which is what makes the scan work.
+    Each map is a tuple of arrays (a, b, lo, hi).
+    """
+    a1, b1, lo1, hi1 = first
+    a2, b2, lo2, hi2 = second
+    return (a2 * a1, a2 * b1 + b2,
+            np.minimum(np.maximum(a2 * lo1 + b2, lo2), hi2),
+            np.minimum(np.maximum(a2 * hi1 + b2, lo2), hi2))
+
+
+def _prefix_maps(maps, block: int = 8):
+    """
+    Inclusive prefix composition of a sequence of clip-linear maps
+
+    Maps are composed inside blocks of `block` steps with a Hillis-Steele
+    scan (log2(block) passes), and the block totals are handled the same
+    way recursively - about log2(block) + 1 passes over the data in all.
+    """
+    steps = len(maps[0])
+    if steps == 1:
+        return maps
+    blocks = -(-steps // block)
+    padding = blocks * block - steps
+    identity = (1.0, 0.0, -_UNBOUNDED, _UNBOUNDED)
+    a, b, lo, hi = (np.concatenate([m, np.full(padding, fill)])
+                    .reshape(blocks, block)
+                    for m, fill in zip(maps, identity))
+
+    shift = 1
+    while shift < block:
+        combined = _compose(
+            (a[:, :-shift], b[:, :-shift], lo[:, :-shift], hi[:, :-shift]),
+            (a[:, shift:], b[:, shift:], lo[:, shift:], hi[:, shift:]))
+        a[:, shift:], b[:, shift:], lo[:, shift:], hi[:, shift:] = combined
+        shift *= 2
+
+    if blocks > 1:
+        # Everything before block j, applied before block j's own prefix
+        totals = _prefix_maps(
+            (a[:-1, -1], b[:-1, -1], lo[:-1, -1], hi[:-1, -1]), block)
+        before = tuple(t[:, None] for t in totals)
+        rest = _compose(
+            before, (a[1:], b[1:], lo[1:], hi[1:]))
+        a[1:], b[1:], lo[1:], hi[1:] = rest
+
+    return tuple(m.ravel()[:steps] for m in (a, b, lo, hi))
+
+
+def _storage_scan(start_energy: float, retention: float,
+                  net_input_j: np.ndarray, capacity_j: float) -> np.ndarray:
+    """
+    Stored energy after every step of
+        energy = clip(retention * energy + net_input, 0, capacity)
+
+    Every step is a map of the form clip(a*x + b, lo, hi), so the
+    energy after step t is the prefix composition of maps 0..t applied
+    to start_energy.
+    """
+    steps = len(net_input_j)
+    if steps == 0:
+        return np.zeros(0)
+    a, b, lo, hi = _prefix_maps((
+        np.full(steps, retention),
+        np.asarray(net_input_j, dtype=float),
+        np.zeros(steps),
+        np.full(steps, min(capacity_j, _UNBOUNDED))))
+    return np.minimum(np.maximum(a * start_energy + b, lo), hi)
+
+
+# The simulator ------------------------------------------------------------
+
+class _PairModel:
+    """
+    The harvester reduced to its matching source/antenna pairs
+
+    Pairs whose source has no trace give the same power every step, so
+    they are computed once; only traced pairs are evaluated per step.
+    In the 'antenna' and 'chain' rectification modes a rectifier sees
+    the summed power of its group, which changes whenever one traced
+    pair does, so then every pair is evaluated per step.
+    """
+
+    def __init__(self, harvester: RFEnergyHarvester,
+                 traced_sources: Iterable[int]):
+        self.harvester = harvester
+        self.traced = sorted(set(traced_sources))
+        self.groups = harvester.rectifier_groups()
+        self.pairs: List[tuple] = []  # (source index, antenna index)
+        constant = []
+        for s, source in enumerate(harvester.rf_sources):
+            for a in harvester.frequency_index.query(source.frequency_mhz):
+                antenna = harvester.antennas[a]
+                if not harvester._frequency_match(
+                        source.frequency_mhz, antenna.frequency_mhz,
+                        antenna.tolerance):
+                    continue
+                if s in self.traced or self.groups is not None:
+                    self.pairs.append((s, a))
+                else:
+                    constant.append((source, antenna))
+        self.antennas = harvester.antennas.to_list()
+
+        # Constant part: exactly the scalar calculation
+        self.constant_uw = 0.0
+        for source, antenna in constant:
+            received = harvester.calculate_received_power(source, antenna)
+            if received > 0:
+                self.constant_uw += received * self._efficiency(
+                    antenna, harvester.get_rectifier_efficiency(received))
+
+    def _efficiency(self, antenna, rectifier_eff):
+        """Total efficiency chain (same order as the scalar path)"""
+        return (antenna.efficiency *
+                self.harvester.matching_efficiency *
+                rectifier_eff *
+                self.harvester.filter_efficiency)
+
+    def _rectifier_efficiency(self, received):
+        curve = (self.harvester.rectifier.curve
+                 if self.harvester.rectifier else None)
+        if curve is None:
+            return np.full(np.shape(received), 0.5)
+        return curve.efficiency_array(received)
+
+    def power_uw(self, density: Dict[int, np.ndarray],
+                 availability: Dict[int, np.ndarray],
+                 steps: int) -> np.ndarray:
+        """Harvested power for every step of a chunk"""
+        harvester = self.harvester
+        sources = harvester.rf_sources
+        received = []
+        for s, a in self.pairs:
+            antenna = self.antennas[a]
+            pair_density = density.get(s, sources[s].power_density_uw_per_m2)
+            pair_availability = availability.get(s, sources[s].availability)
+            received.append(np.broadcast_to(
+                pair_density * antenna.effective_area_m2 *
+                antenna.efficiency * pair_availability *
+                harvester.resonance_boost, (steps,)))
+
+        if self.groups is None:
+            rectifier_eff = [self._rectifier_efficiency(r) for r in received]
+        else:
+            # Each rectifier sees the summed power of its group
+            group_received = np.zeros((int(self.groups.max()) + 1, steps))
+            for (_, a), pair_received in zip(self.pairs, received):
+                group_received[self.groups[a]] += np.where(
+                    pair_received > 0, pair_received, 0.0)
+            group_eff = self._rectifier_efficiency(group_received)
+            rectifier_eff = [group_eff[self.groups[a]]
+                             for _, a in self.pairs]
+
+        total = np.full(steps, self.constant_uw)
+        for (_, a), pair_received, eff in zip(self.pairs, received,
+                                              rectifier_eff):
+            harvested = pair_received * self._efficiency(self.antennas[a],
+                                                         eff)
+            total += np.where(pair_received > 0, harvested, 0.0)
+        return total
+
+
+def _source_index(harvester: RFEnergyHarvester, key) -> int:
+    """Trace keys may be a source index or a source name"""
+    if isinstance(key, int):
+        return key
+    for i, source in enumerate(harvester.rf_sources):
+        if source.name == key:
+            return i
+    raise KeyError(f"No RF source named {key!r}")
+
+
+def simulate_time_series(
+        harvester: RFEnergyHarvester,
+        step_s: float,
+        duration_s: Optional[float] = None,
+        density_traces: Optional[Dict[Union[int, str], Trace]] = None,
+        availability_traces: Optional[Dict[Union[int, str], Trace]] = None,
+        storage: Optional[EnergyStorage] = None,
+        load_uw: Union[float, Trace] = 0.0,
+        chunk_size: int = 1 << 20,
+        record_every_s: Optional[float] = None) -> TimeSeriesResult:
+    """
+    Simulate harvesting step by step and charge a storage element
+
+    density_traces / availability_traces map a source (index or name)
+    to a trace of power_density_uw_per_m2 / availability values; other
+    sources keep their constant values.  load_uw is a constant load or
+    a trace.  The run lasts duration_s, or until the shortest trace ends.
+
+    Example: a year of bursty WiFi at 1-second steps
+        simulate_time_series(
+            harvester, 1.0, 365 * 86400,
+            availability_traces={'WiFi 2.4GHz': bursty_trace(
+                0.3, 5.0, 1.0, 365 * 86400)},
+            storage=EnergyStorage.supercapacitor(0.1, 3.3),
+            load_uw=0.05)
+    """
+    density_traces = density_traces or {}
+    availability_traces = availability_traces or {}
+    storage = storage or EnergyStorage(capacity_j=math.inf)
+    sources = harvester.rf_sources
+
+    streams = {}
+    for kind, traces in (('density', density_traces),
+                         ('availability', availability_traces)):
+        for key, trace in traces.items():
+            s = _source_index(harvester, key)
+            streams[kind, s] = _chunks(trace, chunk_size)
+    load_stream = (None if np.isscalar(load_uw)
+                   else _chunks(load_uw, chunk_size))
+    if duration_s is None and not streams and load_stream is None:
+        raise ValueError("Give duration_s or at least one trace")
+    max_steps = (int(round(duration_s / step_s))
+                 if duration_s is not None else None)
+
+    model = _PairModel(harvester, [s for _, s in streams])
+    retention = storage.retention(step_s)
+    record_every = (max(1, int(round(record_every_s / step_s)))
+                    if record_every_s else None)
+    recorded: List[np.ndarray] = []
+
+    energy = storage.energy_j
+    steps = 0
+    harvested_j = load_j = unmet_j = wasted_j = 0.0
+    min_energy = max_energy = energy
+    brownouts = 0
+    peak_uw = 0.0
+
+    while max_steps is None or steps < max_steps:
+        size = chunk_size if max_steps is None else \
+            min(chunk_size, max_steps - steps)
+        density = {}
+        availability = {}
+        try:
+            for (kind, s), stream in streams.items():
+                values = next(stream)
+                size = min(size, len(values))
+                (density if kind == 'density' else availability)[s] = values
+            load = next(load_stream) if load_stream else None
+        except StopIteration:
+            break
+        if load is not None:
+            size = min(size, len(load))
+        if size == 0:
+            break
+        for s in model.traced:
+            density[s] = density.get(
+                s, np.full(size, sources[s].power_density_uw_per_m2))[:size]
+            availability[s] = availability.get(
+                s, np.full(size, sources[s].availability))[:size]
+        load = (np.full(size, float(load_uw)) if load is None
+                else load[:size])
+
+        power = model.power_uw(density, availability, size)
+        # μW x seconds = μJ; storage works in joules
+        net = (power * storage.charge_efficiency -
+               storage.leakage_uw - load) * step_s * 1e-6
+
+        stored = _storage_scan(energy, retention, net, storage.capacity_j)
+        previous = np.concatenate([[energy], stored[:-1]])
+        unclipped = retention * previous + net
+        overflow = np.maximum(unclipped - storage.capacity_j, 0.0)
+        shortfall = np.maximum(-unclipped, 0.0)
+
+        harvested_j += float(power.sum()) * step_s * 1e-6
+        load_j += float(load.sum()) * step_s * 1e-6
+        unmet_j += float(shortfall.sum())
+        wasted_j += float(overflow.sum())
+        brownouts += int(np.count_nonzero(shortfall > 0))
+        min_energy = min(min_energy, float(stored.min()))
+        max_energy = max(max_energy, float(stored.max()))
+        peak_uw = max(peak_uw, float(power.max()))
+        if record_every:
+            first = (-steps) % record_every
+            recorded.append(stored[first::record_every].copy())
+
+        energy = float(stored[-1])
+        steps += size
+
+    return TimeSeriesResult(
+        steps=steps, step_s=step_s,
+        harvested_energy_j=harvested_j, load_energy_j=load_j,
+        unmet_load_j=unmet_j, wasted_energy_j=wasted_j,
+        final_energy_j=energy, min_energy_j=min_energy,
+        max_energy_j=max_energy, brownout_steps=brownouts,
+        peak_power_uw=peak_uw,
+        energy_trace_j=(np.concatenate(recorded) if recorded
+                        else None))